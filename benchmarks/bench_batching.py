@@ -0,0 +1,105 @@
+"""Micro-batching benchmark: N client threads each embed one query at a time,
+either directly or through a MicroBatcher, against a model whose forward pass
+costs a fixed overhead plus a per-item cost (or the real embedding model).
+
+    python -m benchmarks.bench_batching --clients 16 --requests 50 --max-wait-ms 0 2 5
+    python -m benchmarks.bench_batching --model sentence-transformers/all-MiniLM-L6-v2
+"""
+
+import argparse
+import json
+import threading
+import time
+
+import numpy as np
+
+from modules.batching import MicroBatcher
+
+
+class SimulatedModel:
+    # Sleeping releases the GIL like a torch forward pass does
+    def __init__(self, overhead_ms, per_item_ms):
+        self.overhead = overhead_ms / 1000
+        self.per_item = per_item_ms / 1000
+        self.lock = threading.Lock()
+
+    def generate_batch(self, texts):
+        with self.lock:
+            time.sleep(self.overhead + self.per_item * len(texts))
+        return np.zeros((len(texts), 384), dtype=np.float32)
+
+
+def run(embed, n_clients, n_requests):
+    latencies = []
+    lock = threading.Lock()
+
+    def client(i):
+        for j in range(n_requests):
+            initial_time = time.perf_counter()
+            embed(f"client {i} query {j}")
+            with lock:
+                latencies.append(time.perf_counter() - initial_time)
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(n_clients)]
+    initial_time = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - initial_time
+    return {
+        "requests_per_second": len(latencies) / elapsed,
+        "latency_p50_ms": float(np.percentile(latencies, 50) * 1000),
+        "latency_p95_ms": float(np.percentile(latencies, 95) * 1000),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--clients", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=50)
+    parser.add_argument("--max-batch-size", type=int, default=64)
+    parser.add_argument("--max-wait-ms", type=float, nargs="+", default=[0, 2, 5])
+    parser.add_argument("--model", default=None)
+    parser.add_argument("--overhead-ms", type=float, default=5.0)
+    parser.add_argument("--per-item-ms", type=float, default=0.2)
+    args = parser.parse_args()
+
+    if args.model:
+        from modules.embedding_generator import EmbeddingGenerator
+
+        model = EmbeddingGenerator(model=args.model)
+    else:
+        model = SimulatedModel(args.overhead_ms, args.per_item_ms)
+
+    results = [
+        {
+            "mode": "unbatched",
+            **run(
+                lambda text: model.generate_batch([text])[0],
+                args.clients,
+                args.requests,
+            ),
+        }
+    ]
+    for max_wait_ms in args.max_wait_ms:
+        batcher = MicroBatcher(
+            f"bench-{max_wait_ms}",
+            lambda texts: list(model.generate_batch(texts)),
+            max_batch_size=args.max_batch_size,
+            max_wait_ms=max_wait_ms,
+        )
+        result = run(
+            lambda text: batcher.submit(text).result(), args.clients, args.requests
+        )
+        metrics = batcher.metrics()
+        results.append(
+            {
+                "mode": "micro-batched",
+                "max_wait_ms": max_wait_ms,
+                **result,
+                "mean_batch_size": metrics["mean_batch_size"],
+                "queue_wait_p95_ms": metrics["queue_wait_p95_ms"],
+            }
+        )
+    print(json.dumps({"clients": args.clients, "results": results}, indent=2))
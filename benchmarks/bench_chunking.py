@@ -0,0 +1,105 @@
+"""Chunking benchmark: time and chunk statistics of each DataChunker method on a
+large synthetic text (or the given files), including the previous nltk-based
+token chunking for comparison.
+
+    python -m benchmarks.bench_chunking --pages 2000 --tokens-per-chunk 256 --overlap 32
+    python -m benchmarks.bench_chunking --tokenizers tiktoken:cl100k_base --methods token
+"""
+
+import argparse
+import json
+import random
+import time
+
+import numpy as np
+
+from benchmarks.corpus import make_page
+from modules.data_chunker import DEFAULT_TOKENIZER, DataChunker
+
+
+def legacy_token_chunks(text, tokens_per_chunk):
+    # chunk_by_token before chunks became tokenizer spans
+    import nltk
+
+    tokens = nltk.word_tokenize(text)
+    return [
+        " ".join(tokens[i : i + tokens_per_chunk])
+        for i in range(0, len(tokens), tokens_per_chunk)
+    ]
+
+
+def run(chunk_fn, text):
+    initial_time = time.perf_counter()
+    chunks = chunk_fn()
+    elapsed = time.perf_counter() - initial_time
+    lengths = [len(chunk) for chunk in chunks]
+    return {
+        "seconds": elapsed,
+        "mb_per_second": len(text) / 1e6 / elapsed if elapsed else None,
+        "chunks": len(chunks),
+        "mean_chars": float(np.mean(lengths)) if lengths else 0.0,
+        # Chunks that are not verbatim substrings cannot be mapped back to offsets
+        "verbatim": sum(chunk in text for chunk in chunks[:200])
+        / max(min(len(chunks), 200), 1),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--files", nargs="*", default=None)
+    parser.add_argument("--pages", type=int, default=2000)
+    parser.add_argument("--words-per-page", type=int, default=400)
+    parser.add_argument("--tokens-per-chunk", type=int, default=256)
+    parser.add_argument("--overlap", type=int, default=32)
+    parser.add_argument(
+        "--methods",
+        nargs="+",
+        default=["character", "word", "sentence", "legacy_token", "token"],
+    )
+    parser.add_argument("--tokenizers", nargs="+", default=[DEFAULT_TOKENIZER])
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    if args.files:
+        from modules.data_loader import DataLoader
+
+        data_loader = DataLoader(file_paths=args.files)
+        text = data_loader.flatten_content(data_loader.load_data())
+    else:
+        rng = random.Random(args.seed)
+        text = "\n".join(make_page(rng, args.words_per_page) for _ in range(args.pages))
+
+    results = []
+    for method in args.methods:
+        if method == "legacy_token":
+            results.append(
+                {
+                    "method": method,
+                    **run(
+                        lambda: legacy_token_chunks(text, args.tokens_per_chunk),
+                        text,
+                    ),
+                }
+            )
+        elif method == "token":
+            for tokenizer in args.tokenizers:
+                chunker = DataChunker(
+                    text,
+                    method="token",
+                    tokens_per_chunk=args.tokens_per_chunk,
+                    token_overlap=args.overlap,
+                    tokenizer=tokenizer,
+                )
+                # Model/encoding loading is not part of the chunking time
+                DataChunker("warm up", method="token", tokenizer=tokenizer).chunk_text()
+                results.append(
+                    {
+                        "method": method,
+                        "tokenizer": tokenizer,
+                        **run(chunker.chunk_text, text),
+                    }
+                )
+        else:
+            chunker = DataChunker(text, method=method)
+            results.append({"method": method, **run(chunker.chunk_text, text)})
+    print(json.dumps({"characters": len(text), "results": results}, indent=2))
@@ -0,0 +1,67 @@
+"""Ingestion scaling benchmark: parse a synthetic multi-file corpus with
+DataLoader using an increasing number of worker processes.
+
+    python -m benchmarks.bench_ingestion --files 20 --pages 40 --workers 1 2 4 8
+"""
+
+import argparse
+import json
+import os
+import tempfile
+import time
+
+from benchmarks.corpus import generate_corpus
+from modules.data_loader import DataLoader
+
+
+def run(file_paths, max_workers, repeat):
+    timings = []
+    for _ in range(repeat):
+        data_loader = DataLoader(file_paths=file_paths, max_workers=max_workers)
+        initial_time = time.perf_counter()
+        n_records = sum(1 for _ in data_loader.iter_records())
+        timings.append(time.perf_counter() - initial_time)
+    best = min(timings)
+    return {
+        "workers": max_workers,
+        "records": n_records,
+        "errors": len(data_loader.errors),
+        "best_seconds": best,
+        "pages_per_second": n_records / best if best else None,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--files", type=int, default=20)
+    parser.add_argument("--pages", type=int, default=40)
+    parser.add_argument("--formats", nargs="+", default=["pdf"])
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        file_paths = generate_corpus(
+            directory, args.files, args.pages, formats=args.formats
+        )
+        corpus_bytes = sum(os.path.getsize(file_path) for file_path in file_paths)
+        # Warm the worker pools so process start-up isn't counted as parse time
+        for max_workers in args.workers:
+            if max_workers > 1:
+                run(file_paths[:1], max_workers, repeat=1)
+
+        results = [run(file_paths, w, args.repeat) for w in args.workers]
+        baseline = results[0]["best_seconds"]
+        for result in results:
+            result["speedup"] = baseline / result["best_seconds"]
+        print(
+            json.dumps(
+                {
+                    "files": args.files,
+                    "pages_per_file": args.pages,
+                    "corpus_bytes": corpus_bytes,
+                    "results": results,
+                },
+                indent=2,
+            )
+        )
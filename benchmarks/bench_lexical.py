@@ -0,0 +1,77 @@
+"""BM25 index benchmark: build time and per-query latency on synthetic chunks that
+each carry a unique part number, for identifier, mixed and common-word queries,
+with exact BM25 scoring and with pruning to the selective terms' postings.
+
+    python -m benchmarks.bench_lexical --chunks 100000 --words 60
+"""
+
+import argparse
+import json
+import random
+import time
+
+import numpy as np
+
+from benchmarks.corpus import WORDS, make_page
+from modules.lexical_index import BM25Index
+
+
+def percentile_ms(timings, q):
+    return float(np.percentile(timings, q) * 1000)
+
+
+def run(index, queries, n_results, prune):
+    timings = []
+    for query in queries:
+        initial_time = time.perf_counter()
+        index.search(query, n_results, prune=prune)
+        timings.append(time.perf_counter() - initial_time)
+    return {
+        "query_p50_ms": percentile_ms(timings, 50),
+        "query_p95_ms": percentile_ms(timings, 95),
+        "query_p99_ms": percentile_ms(timings, 99),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chunks", type=int, default=100000)
+    parser.add_argument("--words", type=int, default=60)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--n-results", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    documents = [
+        f"{make_page(rng, args.words)} Part PN-{i:07d}." for i in range(args.chunks)
+    ]
+    index = BM25Index()
+    initial_time = time.perf_counter()
+    index.add([str(i) for i in range(args.chunks)], documents)
+    build_time = time.perf_counter() - initial_time
+
+    part_numbers = [f"PN-{rng.randrange(args.chunks):07d}" for _ in range(args.queries)]
+    query_sets = {
+        "identifier": part_numbers,
+        "mixed": [f"{rng.choice(WORDS)} {pn}" for pn in part_numbers],
+        "common_words": [" ".join(rng.sample(WORDS, 3)) for _ in range(args.queries)],
+    }
+    results = {
+        name: {
+            "exact": run(index, queries, args.n_results, prune=False),
+            "pruned": run(index, queries, args.n_results, prune=True),
+        }
+        for name, queries in query_sets.items()
+    }
+    print(
+        json.dumps(
+            {
+                "chunks": args.chunks,
+                "terms": len(index.postings),
+                "build_seconds": build_time,
+                "results": results,
+            },
+            indent=2,
+        )
+    )
@@ -0,0 +1,80 @@
+"""LLM client load test against the local mock server: a burst of concurrent
+agenerate() calls through the shared client pool, with injected 429s.
+
+    python -m benchmarks.bench_llm_client --requests 200 --max-concurrency 16 --error-rate 0.1
+    python -m benchmarks.bench_llm_client --requests 100 --requests-per-minute 600
+"""
+
+import argparse
+import asyncio
+import json
+import time
+
+import numpy as np
+
+from benchmarks.mock_openai_server import start_server
+from modules.llm import LLM
+from modules.llm_client import LLMClientPool, _pools
+
+
+async def run(llm, n_requests):
+    async def call(i):
+        initial_time = time.perf_counter()
+        try:
+            await llm.agenerate(f"Question {i}", system_prompt="Answer briefly.")
+            return time.perf_counter() - initial_time, None
+        except Exception as e:
+            return time.perf_counter() - initial_time, type(e).__name__
+
+    initial_time = time.perf_counter()
+    results = await asyncio.gather(*(call(i) for i in range(n_requests)))
+    elapsed = time.perf_counter() - initial_time
+    latencies = [latency for latency, error in results if error is None]
+    return {
+        "elapsed_seconds": elapsed,
+        "succeeded": len(latencies),
+        "failed": [error for _, error in results if error is not None],
+        "latency_p50_ms": float(np.percentile(latencies, 50) * 1000),
+        "latency_p99_ms": float(np.percentile(latencies, 99) * 1000),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--max-concurrency", type=int, default=16)
+    parser.add_argument("--requests-per-minute", type=float, default=None)
+    parser.add_argument("--tokens-per-minute", type=float, default=None)
+    parser.add_argument("--max-retries", type=int, default=4)
+    parser.add_argument("--error-rate", type=float, default=0.1)
+    parser.add_argument("--ttft-ms", type=float, default=50.0)
+    parser.add_argument("--tokens-per-second", type=float, default=500.0)
+    parser.add_argument("--completion-tokens", type=int, default=50)
+    args = parser.parse_args()
+
+    server = start_server(
+        ttft_ms=args.ttft_ms,
+        tokens_per_second=args.tokens_per_second,
+        completion_tokens=args.completion_tokens,
+        error_rate=args.error_rate,
+    )
+    _pools[server.base_url] = LLMClientPool(
+        base_url=server.base_url,
+        api_key="mock",
+        max_concurrency=args.max_concurrency,
+        requests_per_minute=args.requests_per_minute,
+        tokens_per_minute=args.tokens_per_minute,
+        max_retries=args.max_retries,
+    )
+    llm = LLM(model_name="mock-model", base_url=server.base_url)
+    result = asyncio.run(run(llm, args.requests))
+    print(
+        json.dumps(
+            {
+                **result,
+                "client": llm.pool.metrics(),
+                "server": server.stats,
+            },
+            indent=2,
+        )
+    )
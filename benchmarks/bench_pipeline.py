@@ -0,0 +1,396 @@
+"""Offline benchmark suite: each pipeline stage in isolation, then end to end
+through PipelineManager, on a synthetic corpus with deterministic fake models
+(benchmarks.fakes) and the local mock OpenAI server. Prints one JSON report with
+throughput, p50/p95/p99 latency and peak RSS per stage; pass a previous report
+as --baseline to see the relative change of each figure.
+
+    python -m benchmarks.bench_pipeline --pages 100 --output before.json
+    python -m benchmarks.bench_pipeline --pages 100 --baseline before.json
+    python -m benchmarks.bench_pipeline --pages 10000 --files 100 --stages load chunk
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import tempfile
+import time
+
+import numpy as np
+
+from benchmarks.corpus import WORDS, generate_corpus
+from modules.model_registry import peak_rss_bytes
+
+STAGES = ("load", "chunk", "embed", "vector_store", "rerank", "prompt", "llm")
+CHUNK_METHODS = ("character", "word", "sentence", "token", "semantic")
+EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+RERANK_MODEL = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+# Figures compared against a baseline, and whether higher is better
+COMPARED = {
+    "items_per_second": True,
+    "latency_p50_ms": False,
+    "latency_p95_ms": False,
+    "latency_p99_ms": False,
+    "peak_rss_bytes": False,
+}
+
+
+def report(timings, n_items, elapsed, **extra):
+    # timings: seconds per operation; n_items: items processed in `elapsed`
+    timings = np.asarray(timings or [0.0]) * 1000
+    return {
+        "items": n_items,
+        "seconds": elapsed,
+        "items_per_second": n_items / elapsed if elapsed else None,
+        "latency_p50_ms": float(np.percentile(timings, 50)),
+        "latency_p95_ms": float(np.percentile(timings, 95)),
+        "latency_p99_ms": float(np.percentile(timings, 99)),
+        "peak_rss_bytes": peak_rss_bytes(),
+        **extra,
+    }
+
+
+def timed(fn, items):
+    # Calls fn(item) for each item; returns (results, per-call timings, total)
+    results, timings = [], []
+    initial_time = time.perf_counter()
+    for item in items:
+        start = time.perf_counter()
+        results.append(fn(item))
+        timings.append(time.perf_counter() - start)
+    return results, timings, time.perf_counter() - initial_time
+
+
+def batches(items, size):
+    return [items[i : i + size] for i in range(0, len(items), size)]
+
+
+def make_queries(n_queries, seed):
+    rng = random.Random(seed)
+    return [
+        f"What is the {rng.choice(WORDS)} {rng.choice(WORDS)} of the {rng.choice(WORDS)}?"
+        for _ in range(n_queries)
+    ]
+
+
+def bench_load(file_paths, workers):
+    from modules.data_loader import DataLoader
+
+    data_loader = DataLoader(file_paths=file_paths, max_workers=workers)
+    records, timings = [], []
+    initial_time = time.perf_counter()
+    start = initial_time
+    for record in data_loader.iter_records():
+        now = time.perf_counter()
+        timings.append(now - start)
+        records.append(record["text"])
+        start = now
+    elapsed = time.perf_counter() - initial_time
+    result = report(
+        timings,
+        len(records),
+        elapsed,
+        mb_per_second=sum(map(len, records)) / 1e6 / elapsed if elapsed else None,
+        errors=len(data_loader.errors),
+    )
+    return records, result
+
+
+def bench_chunk(pages, methods):
+    from modules.data_chunker import DataChunker
+
+    results, chunks = {}, None
+    for method in methods:
+        chunker = DataChunker("", method=method)
+
+        def chunk_page(page):
+            chunker.text = page
+            return chunker.chunk_text()
+
+        chunk_page(pages[0])  # loads the tokenizer/model outside the timings
+        page_chunks, timings, elapsed = timed(chunk_page, pages)
+        page_chunks = [chunk for chunk_list in page_chunks for chunk in chunk_list]
+        results[method] = report(
+            timings,
+            len(pages),
+            elapsed,
+            chunks=len(page_chunks),
+            mb_per_second=sum(map(len, pages)) / 1e6 / elapsed if elapsed else None,
+        )
+        if method == "sentence" or chunks is None:
+            chunks = page_chunks
+    return chunks, results
+
+
+def bench_embed(chunks, batch_size):
+    from modules.embedding_generator import EmbeddingGenerator
+
+    embedding_generator = EmbeddingGenerator(model=EMBEDDING_MODEL)
+    embedding_generator.generate_batch(chunks[:1])
+    vectors, timings, elapsed = timed(
+        embedding_generator.generate_batch, batches(chunks, batch_size)
+    )
+    embeddings = np.concatenate(vectors)
+    return embeddings, report(timings, len(chunks), elapsed, batch_size=batch_size)
+
+
+def bench_vector_store(chunks, embeddings, queries, backend, directory):
+    from modules.embedding_generator import EmbeddingGenerator
+    from modules.vector_store import VectorStore
+
+    vector_store = VectorStore(
+        f"bench_{backend}", persist_directory=directory, backend=backend
+    )
+    ids = [str(i) for i in range(len(chunks))]
+    _, upsert_timings, upsert_elapsed = timed(
+        lambda rows: vector_store.upsert_documents(
+            [ids[i] for i in rows], [chunks[i] for i in rows], embeddings[rows]
+        ),
+        batches(list(range(len(chunks))), 1024),
+    )
+    query_embeddings = EmbeddingGenerator(model=EMBEDDING_MODEL).generate_batch(queries)
+    _, timings, elapsed = timed(
+        lambda embedding: vector_store.query(embedding, n_results=20), query_embeddings
+    )
+    return vector_store, {
+        "upsert": report(upsert_timings, len(chunks), upsert_elapsed),
+        "query": report(timings, len(queries), elapsed, backend=backend),
+    }
+
+
+def bench_rerank(vector_store, queries, n_candidates):
+    from modules.embedding_generator import EmbeddingGenerator
+    from modules.reranker import Reranker, ScoreCache
+
+    # A fresh cache, so every query pays for its forward passes
+    reranker = Reranker(model=RERANK_MODEL, cache=ScoreCache(100000))
+    embedding_generator = EmbeddingGenerator(model=EMBEDDING_MODEL)
+    candidates = [
+        vector_store.query(embedding, n_results=n_candidates)
+        for embedding in embedding_generator.generate_batch(queries)
+    ]
+    inputs = list(zip(queries, candidates))
+    reranked, timings, elapsed = timed(
+        lambda item: reranker.rerank(
+            item[0], item[1]["documents"][0], ids=item[1]["ids"][0]
+        ),
+        inputs,
+    )
+    return list(zip(queries, reranked)), report(
+        timings, len(queries), elapsed, candidates_per_query=n_candidates
+    )
+
+
+def bench_prompt(reranked, token_budget):
+    from config import Config
+    from modules.pipeline_manager import PROMPT_TEMPLATE
+    from modules.prompt_constructor import PromptConstructor
+
+    prompt_constructor = PromptConstructor(
+        template=PROMPT_TEMPLATE, model=Config().model_name
+    )
+
+    def build(item):
+        query, scored = item
+        context_str, stats = prompt_constructor.pack_contexts(
+            [
+                {"id": str(i), "text": doc, "score": score}
+                for i, (doc, score) in enumerate(scored)
+            ],
+            max_tokens=token_budget,
+        )
+        return prompt_constructor.construct(contexts=context_str, question=query)
+
+    prompts, timings, elapsed = timed(build, reranked)
+    return prompts, report(timings, len(prompts), elapsed)
+
+
+def bench_llm(prompts, concurrency):
+    from config import Config
+    from modules.llm import LLM
+    from modules.pipeline_manager import SYSTEM_PROMPT
+
+    llm = LLM(model_name=Config().model_name)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def call(prompt):
+        async with semaphore:
+            start = time.perf_counter()
+            answer = await llm.agenerate(prompt, system_prompt=SYSTEM_PROMPT)
+            return time.perf_counter() - start, answer["time_to_first_token"]
+
+    async def run():
+        initial_time = time.perf_counter()
+        results = await asyncio.gather(*(call(prompt) for prompt in prompts))
+        return results, time.perf_counter() - initial_time
+
+    results, elapsed = asyncio.run(run())
+    return report(
+        [latency for latency, _ in results],
+        len(prompts),
+        elapsed,
+        concurrency=concurrency,
+    )
+
+
+def bench_end_to_end(file_paths, queries, backend, directory):
+    from config import Config
+    from modules.pipeline_manager import PipelineManager
+
+    config = Config(
+        file_paths=file_paths,
+        persist_directory=directory,
+        vector_backend=backend,
+        collection_name="bench_end_to_end",
+        response_cache=False,
+    )
+    pipeline_manager = PipelineManager("bench-index", config)
+    initial_time = time.perf_counter()
+    vector_store = pipeline_manager.index()
+    index_elapsed = time.perf_counter() - initial_time
+    index_result = report(
+        [index_elapsed],
+        vector_store.count(),
+        index_elapsed,
+        stages=pipeline_manager.trace.finish()["stages"],
+    )
+
+    async def run():
+        timings, stage_totals = [], {}
+        initial_time = time.perf_counter()
+        for i, question in enumerate(queries):
+            query_manager = PipelineManager(f"bench-query-{i}", config)
+            query_manager.open_index()
+            start = time.perf_counter()
+            answer = await query_manager.aquery(question)
+            timings.append(time.perf_counter() - start)
+            for stage, totals in answer["timings"]["stages"].items():
+                stage_totals[stage] = (
+                    stage_totals.get(stage, 0.0) + totals["wall_seconds"]
+                )
+        elapsed = time.perf_counter() - initial_time
+        mean_stage_ms = {
+            stage: total / len(queries) * 1000 for stage, total in stage_totals.items()
+        }
+        return report(timings, len(queries), elapsed, mean_stage_ms=mean_stage_ms)
+
+    return {"index": index_result, "query": asyncio.run(run())}
+
+
+def compare(results, baseline, path=()):
+    # Relative change of every COMPARED figure present in both reports; a
+    # positive "regression" means worse than the baseline
+    changes = {}
+    for key, value in results.items():
+        other = baseline.get(key) if isinstance(baseline, dict) else None
+        if isinstance(value, dict) and isinstance(other, dict):
+            changes.update(compare(value, other, path + (key,)))
+        elif key in COMPARED and other and value is not None:
+            change = (value - other) / other
+            changes[".".join(path + (key,))] = {
+                "baseline": other,
+                "current": value,
+                "change": change,
+                "regression": -change if COMPARED[key] else change,
+            }
+    return changes
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pages", type=int, default=100)
+    parser.add_argument("--files", type=int, default=5)
+    parser.add_argument("--formats", nargs="+", default=["pdf", "docx", "txt"])
+    parser.add_argument("--words-per-page", type=int, default=400)
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--stages", nargs="+", default=[*STAGES, "end_to_end"])
+    parser.add_argument("--chunk-methods", nargs="+", default=list(CHUNK_METHODS))
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--embed-batch-size", type=int, default=256)
+    parser.add_argument("--vector-backend", default="numpy")
+    parser.add_argument("--rerank-candidates", type=int, default=20)
+    parser.add_argument("--context-token-budget", type=int, default=1024)
+    parser.add_argument("--llm-concurrency", type=int, default=8)
+    parser.add_argument("--llm-ttft-ms", type=float, default=50.0)
+    parser.add_argument("--llm-tokens-per-second", type=float, default=500.0)
+    parser.add_argument("--embed-cost-ms", type=float, default=0.0)
+    parser.add_argument("--rerank-cost-ms", type=float, default=0.0)
+    parser.add_argument(
+        "--real-models",
+        action="store_true",
+        help="use the sentence-transformers models instead of the fakes",
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=None)
+    parser.add_argument("--baseline", default=None)
+    args = parser.parse_args()
+
+    if not args.real_models:
+        from benchmarks.fakes import install_fakes
+
+        install_fakes(
+            embed_cost_ms=args.embed_cost_ms, rerank_cost_ms=args.rerank_cost_ms
+        )
+
+    from benchmarks.mock_openai_server import start_server
+
+    server = start_server(
+        ttft_ms=args.llm_ttft_ms, tokens_per_second=args.llm_tokens_per_second
+    )
+    os.environ["OPENAI_BASE_URL"] = server.base_url
+    os.environ["OPENAI_API_KEY"] = "mock"
+
+    stages = set(args.stages)
+    queries = make_queries(args.queries, args.seed)
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        n_files = max(1, min(args.files, args.pages))
+        file_paths = generate_corpus(
+            os.path.join(directory, "corpus"),
+            n_files,
+            -(-args.pages // n_files),
+            formats=args.formats,
+            words_per_page=args.words_per_page,
+            seed=args.seed,
+        )
+        # Later stages consume the output of earlier ones, so those always run;
+        # only the selected ones are reported.
+        pages, results["load"] = bench_load(file_paths, args.workers)
+        if stages & {"chunk", "embed", "vector_store", "rerank", "prompt", "llm"}:
+            chunks, results["chunk"] = bench_chunk(pages, args.chunk_methods)
+        if stages & {"embed", "vector_store", "rerank", "prompt", "llm"}:
+            embeddings, results["embed"] = bench_embed(chunks, args.embed_batch_size)
+        if stages & {"vector_store", "rerank", "prompt", "llm"}:
+            vector_store, results["vector_store"] = bench_vector_store(
+                chunks, embeddings, queries, args.vector_backend, directory
+            )
+        if stages & {"rerank", "prompt", "llm"}:
+            reranked, results["rerank"] = bench_rerank(
+                vector_store, queries, args.rerank_candidates
+            )
+        if stages & {"prompt", "llm"}:
+            prompts, results["prompt"] = bench_prompt(
+                reranked, args.context_token_budget
+            )
+        if "llm" in stages:
+            results["llm"] = bench_llm(prompts, args.llm_concurrency)
+        if "end_to_end" in stages:
+            results["end_to_end"] = bench_end_to_end(
+                file_paths, queries, args.vector_backend, directory
+            )
+
+    output = {
+        "settings": vars(args),
+        "corpus": {"files": len(file_paths), "pages": len(pages)},
+        "results": {
+            stage: result for stage, result in results.items() if stage in stages
+        },
+    }
+    if args.baseline:
+        with open(args.baseline) as f:
+            output["comparison"] = compare(output["results"], json.load(f)["results"])
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(output, f, indent=2)
+    print(json.dumps(output, indent=2))
@@ -0,0 +1,147 @@
+"""Startup benchmark: import time of the server and the pipeline modules, and the
+cold start of the app (import + lifespan + first request), each measured in a
+fresh interpreter. Also lists the heavy dependencies an import pulled in, which
+should be none: they are loaded on first use.
+
+    python -m benchmarks.bench_startup --repeat 5
+    python -m benchmarks.bench_startup --max-import-ms 1500  # exits 1 if slower
+    MODEL_PRELOAD=sentence_transformer:all-MiniLM-L6-v2 python -m benchmarks.bench_startup
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+import numpy as np
+
+MODULES = ("main", "modules.pipeline_manager", "modules.data_chunker")
+HEAVY_MODULES = (
+    "openai",
+    "httpx",
+    "nltk",
+    "PyPDF2",
+    "docx",
+    "chromadb",
+    "sentence_transformers",
+    "torch",
+    "tiktoken",
+    "sklearn",
+)
+
+IMPORT_SNIPPET = """
+import json, sys, time
+initial_time = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - initial_time
+from modules.model_registry import process_rss_bytes
+print(json.dumps({{
+    "seconds": elapsed,
+    "rss_bytes": process_rss_bytes(),
+    "heavy_modules": [name for name in {heavy!r} if name in sys.modules],
+}}))
+"""
+
+COLD_START_SNIPPET = """
+import json, sys, time
+initial_time = time.perf_counter()
+import main
+imported = time.perf_counter() - initial_time
+heavy_modules = [name for name in {heavy!r} if name in sys.modules]
+from fastapi.testclient import TestClient
+with TestClient(main.app) as client:
+    status = client.get("/models").status_code
+elapsed = time.perf_counter() - initial_time
+from modules.model_registry import process_rss_bytes
+print(json.dumps({{
+    "seconds": elapsed,
+    "import_seconds": imported,
+    "status": status,
+    "rss_bytes": process_rss_bytes(),
+    "heavy_modules": heavy_modules,
+}}))
+"""
+
+
+def run_snippet(snippet, env):
+    output = subprocess.run(
+        [sys.executable, "-c", snippet],
+        capture_output=True,
+        text=True,
+        env=env,
+        check=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def summarize(runs):
+    seconds = [run["seconds"] for run in runs]
+    return {
+        "median_ms": float(np.median(seconds) * 1000),
+        "min_ms": float(np.min(seconds) * 1000),
+        "max_ms": float(np.max(seconds) * 1000),
+        "rss_bytes": int(np.median([run["rss_bytes"] for run in runs])),
+        "heavy_modules": runs[-1]["heavy_modules"],
+    }
+
+
+def slowest_imports(module, env, n=10):
+    # Self time per module from python -X importtime, slowest first
+    stderr = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        env=env,
+        check=True,
+    ).stderr
+    times = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:") :].split("|")
+        times.append((int(self_us), int(cumulative_us), name.strip()))
+    times.sort(reverse=True)
+    return [
+        {"module": name, "self_ms": self_us / 1000, "cumulative_ms": cumulative / 1000}
+        for self_us, cumulative, name in times[:n]
+    ]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--modules", nargs="+", default=list(MODULES))
+    parser.add_argument("--skip-cold-start", action="store_true")
+    parser.add_argument("--max-import-ms", type=float, default=None)
+    args = parser.parse_args()
+
+    # Models are not preloaded unless MODEL_PRELOAD is set explicitly
+    env = {**os.environ, "MODEL_PRELOAD": os.getenv("MODEL_PRELOAD", "")}
+    results = {"imports": {}}
+    for module in args.modules:
+        snippet = IMPORT_SNIPPET.format(module=module, heavy=HEAVY_MODULES)
+        results["imports"][module] = {
+            **summarize([run_snippet(snippet, env) for _ in range(args.repeat)]),
+            "slowest": slowest_imports(module, env),
+        }
+    if not args.skip_cold_start:
+        snippet = COLD_START_SNIPPET.format(heavy=HEAVY_MODULES)
+        runs = [run_snippet(snippet, env) for _ in range(args.repeat)]
+        results["cold_start"] = {
+            **summarize(runs),
+            "import_median_ms": float(
+                np.median([run["import_seconds"] for run in runs]) * 1000
+            ),
+        }
+    print(json.dumps(results, indent=2))
+
+    if args.max_import_ms is not None:
+        too_slow = {
+            module: result["median_ms"]
+            for module, result in results["imports"].items()
+            if result["median_ms"] > args.max_import_ms
+        }
+        if too_slow:
+            print(f"Imports slower than {args.max_import_ms} ms: {too_slow}")
+            sys.exit(1)
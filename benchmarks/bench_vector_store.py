@@ -0,0 +1,84 @@
+"""Vector store backend benchmark: insert time, query latency and RSS growth of
+the NumPy and Chroma backends on random normalized embeddings.
+
+    python -m benchmarks.bench_vector_store --chunks 100000 --dim 384 --backends numpy chroma
+"""
+
+import argparse
+import gc
+import json
+import time
+import uuid
+
+import numpy as np
+
+from modules.model_registry import process_rss_bytes
+from modules.vector_store import VectorStore
+
+
+def percentile_ms(timings, q):
+    return float(np.percentile(timings, q) * 1000)
+
+
+def run(backend, embeddings, queries, n_results, batch_queries, insert_batch=4096):
+    gc.collect()
+    rss_before = process_rss_bytes()
+    vector_store = VectorStore(f"bench_{uuid.uuid4().hex[:12]}", backend=backend)
+    ids = [str(i) for i in range(len(embeddings))]
+    documents = [f"chunk {i}" for i in range(len(embeddings))]
+
+    initial_time = time.perf_counter()
+    for start in range(0, len(embeddings), insert_batch):
+        end = start + insert_batch
+        vector_store.upsert_documents(
+            ids[start:end], documents[start:end], embeddings[start:end]
+        )
+    vector_store.mark_indexed()
+    insert_time = time.perf_counter() - initial_time
+
+    timings = []
+    for query in queries:
+        initial_time = time.perf_counter()
+        vector_store.query(query, n_results=n_results)
+        timings.append(time.perf_counter() - initial_time)
+
+    initial_time = time.perf_counter()
+    for start in range(0, len(queries), batch_queries):
+        vector_store.query(queries[start : start + batch_queries], n_results=n_results)
+    batched_time = time.perf_counter() - initial_time
+
+    return {
+        "backend": backend,
+        "insert_seconds": insert_time,
+        "query_p50_ms": percentile_ms(timings, 50),
+        "query_p95_ms": percentile_ms(timings, 95),
+        "query_p99_ms": percentile_ms(timings, 99),
+        "batched_queries_per_second": len(queries) / batched_time,
+        "rss_growth_bytes": process_rss_bytes() - rss_before,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chunks", type=int, default=100000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--n-results", type=int, default=5)
+    parser.add_argument("--batch-queries", type=int, default=32)
+    parser.add_argument("--backends", nargs="+", default=["numpy", "chroma"])
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    embeddings = rng.standard_normal((args.chunks, args.dim), dtype=np.float32)
+    embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+    queries = rng.standard_normal((args.queries, args.dim), dtype=np.float32)
+
+    results = [
+        run(backend, embeddings, queries, args.n_results, args.batch_queries)
+        for backend in args.backends
+    ]
+    print(
+        json.dumps(
+            {"chunks": args.chunks, "dim": args.dim, "results": results}, indent=2
+        )
+    )
@@ -0,0 +1,112 @@
+import os
+import random
+
+WORDS = (
+    "attention model layer encoder decoder token sequence vector query key value "
+    "network training loss gradient batch input output weight bias position "
+    "embedding head residual normalization dropout softmax matrix length data"
+).split()
+
+
+def make_page(rng, n_words=400):
+    sentences = []
+    while n_words > 0:
+        length = min(n_words, rng.randint(8, 24))
+        words = [rng.choice(WORDS) for _ in range(length)]
+        sentences.append(" ".join(words).capitalize() + ".")
+        n_words -= length
+    return " ".join(sentences)
+
+
+def wrap(text, width=90):
+    lines, line = [], []
+    for word in text.split():
+        if sum(len(w) + 1 for w in line) + len(word) > width:
+            lines.append(" ".join(line))
+            line = []
+        line.append(word)
+    if line:
+        lines.append(" ".join(line))
+    return lines
+
+
+def write_txt(path, pages):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("\n\n".join(pages))
+
+
+def write_docx(path, pages):
+    from docx import Document
+
+    doc = Document()
+    for page in pages:
+        doc.add_paragraph(page)
+    doc.save(path)
+
+
+def write_pdf(path, pages):
+    # Minimal PDF writer (one Helvetica text stream per page), enough for
+    # PyPDF2 text extraction without depending on a PDF library.
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        None,
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    page_ids = []
+    for page in pages:
+        lines = []
+        for line in wrap(page):
+            escaped = line.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+            lines.append(f"({escaped}) '")
+        stream = ("BT /F1 9 Tf 40 800 Td 11 TL\n" + "\n".join(lines) + "\nET").encode(
+            "latin-1", "replace"
+        )
+        objects.append(
+            b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream"
+        )
+        content_id = len(objects)
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+            b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % content_id
+        )
+        page_ids.append(len(objects))
+    kids = " ".join(f"{page_id} 0 R" for page_id in page_ids).encode()
+    objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (kids, len(page_ids))
+
+    with open(path, "wb") as f:
+        f.write(b"%PDF-1.4\n")
+        offsets = []
+        for number, body in enumerate(objects, start=1):
+            offsets.append(f.tell())
+            f.write(b"%d 0 obj\n" % number + body + b"\nendobj\n")
+        xref = f.tell()
+        f.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1))
+        for offset in offsets:
+            f.write(b"%010d 00000 n \n" % offset)
+        f.write(
+            b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n"
+            % (len(objects) + 1, xref)
+        )
+
+
+WRITERS = {"txt": write_txt, "docx": write_docx, "pdf": write_pdf}
+
+
+def generate_corpus(
+    directory,
+    n_files=10,
+    pages_per_file=20,
+    formats=("pdf",),
+    words_per_page=400,
+    seed=0,
+):
+    rng = random.Random(seed)
+    os.makedirs(directory, exist_ok=True)
+    file_paths = []
+    for i in range(n_files):
+        file_format = formats[i % len(formats)]
+        pages = [make_page(rng, words_per_page) for _ in range(pages_per_file)]
+        file_path = os.path.join(directory, f"doc_{i:04d}.{file_format}")
+        WRITERS[file_format](file_path, pages)
+        file_paths.append(file_path)
+    return file_paths
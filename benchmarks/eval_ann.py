@@ -0,0 +1,146 @@
+"""Recall@k vs. QPS of the IVF index against the exact NumPy index, for a sweep
+of nprobe values and both quantization modes.
+
+Embeddings come from EmbeddingGenerator over a generated corpus (chunked the
+way the pipeline does it), or from clustered Gaussian vectors with --synthetic:
+
+    python -m benchmarks.eval_ann --files 200 --pages 20 --nprobe 1 4 8 16 32
+    python -m benchmarks.eval_ann --synthetic --chunks 1000000 --dim 384
+"""
+
+import argparse
+import json
+import tempfile
+import time
+
+import numpy as np
+
+from modules.ann_index import IVFIndex
+from modules.vector_backends import NumpyIndex
+
+
+def corpus_embeddings(n_files, pages_per_file, n_queries, model_name, seed):
+    from benchmarks.corpus import generate_corpus
+    from modules.data_chunker import DataChunker
+    from modules.data_loader import DataLoader
+    from modules.embedding_generator import EmbeddingGenerator
+
+    with tempfile.TemporaryDirectory() as directory:
+        file_paths = generate_corpus(
+            directory, n_files, pages_per_file, formats=("txt",), seed=seed
+        )
+        data_chunker = DataChunker("", method="sentence", sentences_per_chunk=3)
+        records = DataLoader(file_paths).iter_records()
+        chunks = [record["text"] for record in data_chunker.iter_chunk_records(records)]
+    embedding_generator = EmbeddingGenerator(model_name)
+    embeddings = embedding_generator.generate_batch(chunks)
+    # Held-out queries: perturbed chunks, so the neighbours are not exact copies
+    rng = np.random.default_rng(seed)
+    queries = embeddings[rng.choice(len(embeddings), n_queries, replace=False)]
+    queries = queries + 0.05 * rng.standard_normal(queries.shape, dtype=np.float32)
+    return embeddings, queries
+
+
+def synthetic_embeddings(n_chunks, dim, n_queries, seed, n_clusters=1000):
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((n_clusters, dim), dtype=np.float32)
+
+    def sample(n):
+        labels = rng.integers(0, n_clusters, n)
+        return centers[labels] + 0.5 * rng.standard_normal((n, dim), dtype=np.float32)
+
+    return sample(n_chunks), sample(n_queries)
+
+
+def recall_at_k(results, ground_truth, k):
+    hits = [
+        len(set(found[:k]) & set(truth[:k]))
+        for found, truth in zip(results, ground_truth)
+    ]
+    return sum(hits) / (k * len(ground_truth))
+
+
+def timed_queries(query_fn, queries, batch_queries):
+    ids = []
+    initial_time = time.perf_counter()
+    for start in range(0, len(queries), batch_queries):
+        ids.extend(query_fn(queries[start : start + batch_queries])["ids"])
+    return ids, len(queries) / (time.perf_counter() - initial_time)
+
+
+def evaluate(embeddings, queries, k, nprobes, quantizations, n_lists, batch_queries):
+    ids = [str(i) for i in range(len(embeddings))]
+    documents = [None] * len(ids)
+
+    exact = NumpyIndex()
+    exact.upsert(ids, documents, embeddings)
+    ground_truth, exact_qps = timed_queries(
+        lambda batch: exact.query(batch, k), queries, batch_queries
+    )
+    results = [{"index": "exact", "queries_per_second": exact_qps, "recall": 1.0}]
+
+    for quantization in quantizations:
+        index = IVFIndex(n_lists=n_lists, quantization=quantization, train_threshold=0)
+        initial_time = time.perf_counter()
+        index.add(ids, documents, embeddings)
+        build_time = time.perf_counter() - initial_time
+        for nprobe in nprobes:
+            found, qps = timed_queries(
+                lambda batch: index.query(batch, k, nprobe=nprobe),
+                queries,
+                batch_queries,
+            )
+            results.append(
+                {
+                    "index": "ivf",
+                    "quantization": quantization,
+                    "n_lists": len(index.lists),
+                    "nprobe": nprobe,
+                    "build_seconds": build_time,
+                    "queries_per_second": qps,
+                    "recall": recall_at_k(found, ground_truth, k),
+                    "vector_bytes": index.codes[: index.n_rows].nbytes,
+                }
+            )
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--synthetic", action="store_true")
+    parser.add_argument("--chunks", type=int, default=100000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--files", type=int, default=100)
+    parser.add_argument("--pages", type=int, default=20)
+    parser.add_argument("--model-name", default="all-MiniLM-L6-v2")
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32])
+    parser.add_argument("--quantization", nargs="+", default=["int8", "none"])
+    parser.add_argument("--n-lists", type=int, default=None)
+    parser.add_argument("--batch-queries", type=int, default=32)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    if args.synthetic:
+        embeddings, queries = synthetic_embeddings(
+            args.chunks, args.dim, args.queries, args.seed
+        )
+    else:
+        embeddings, queries = corpus_embeddings(
+            args.files, args.pages, args.queries, args.model_name, args.seed
+        )
+    results = evaluate(
+        embeddings,
+        queries,
+        args.k,
+        args.nprobe,
+        args.quantization,
+        args.n_lists,
+        args.batch_queries,
+    )
+    print(
+        json.dumps(
+            {"chunks": len(embeddings), "k": args.k, "results": results}, indent=2
+        )
+    )
@@ -0,0 +1,89 @@
+"""Deterministic stand-ins for the local models, so benchmarks run offline and
+give the same results on every machine. install_fakes() registers them with the
+model registry in place of sentence-transformers; the LLM is faked by
+benchmarks.mock_openai_server.
+"""
+
+import re
+import time
+import zlib
+
+import numpy as np
+
+from modules.model_registry import model_registry
+
+WORD_PATTERN = re.compile(r"\w+|[^\w\s]")
+
+
+class FakeTokenizer:
+    # The slice of the Hugging Face fast tokenizer API that DataChunker uses
+    def __call__(self, text, return_offsets_mapping=False, **kwargs):
+        spans = [match.span() for match in WORD_PATTERN.finditer(text)]
+        encoding = {"input_ids": list(range(len(spans)))}
+        if return_offsets_mapping:
+            encoding["offset_mapping"] = spans
+        return encoding
+
+
+class FakeSentenceTransformer:
+    # Hashed bag-of-words embeddings: texts sharing words are similar, so
+    # retrieval behaves sensibly. cost_per_item_ms simulates the forward pass.
+    def __init__(self, dim=384, cost_per_item_ms=0.0, max_seq_length=256):
+        self.dim = dim
+        self.cost_per_item = cost_per_item_ms / 1000
+        self.max_seq_length = max_seq_length
+        self.tokenizer = FakeTokenizer()
+        self._word_vectors = {}
+
+    def word_vector(self, word):
+        vector = self._word_vectors.get(word)
+        if vector is None:
+            rng = np.random.default_rng(zlib.crc32(word.encode()))
+            vector = rng.standard_normal(self.dim).astype(np.float32)
+            self._word_vectors[word] = vector
+        return vector
+
+    def encode(self, sentences, normalize_embeddings=False, **kwargs):
+        if self.cost_per_item:
+            time.sleep(self.cost_per_item * len(sentences))
+        vectors = np.zeros((len(sentences), self.dim), dtype=np.float32)
+        for i, sentence in enumerate(sentences):
+            for word in sentence.lower().split()[: self.max_seq_length]:
+                vectors[i] += self.word_vector(word.strip(".,;:!?"))
+        if normalize_embeddings:
+            norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+            vectors /= np.maximum(norms, 1e-12)
+        return vectors
+
+
+class FakeCrossEncoder:
+    # Scores a pair by the share of query words found in the document, reading
+    # at most max_length tokens of the pair like the real tokenizer
+    def __init__(self, cost_per_item_ms=0.0, max_length=512):
+        self.cost_per_item = cost_per_item_ms / 1000
+        self.max_length = max_length
+
+    def predict(self, pairs, **kwargs):
+        if self.cost_per_item:
+            time.sleep(self.cost_per_item * len(pairs))
+        scores = []
+        for query, document in pairs:
+            query_tokens = WORD_PATTERN.findall(query.lower())
+            document_tokens = WORD_PATTERN.findall(document.lower())
+            # [CLS] query [SEP] document [SEP]
+            n_document_tokens = max(self.max_length - len(query_tokens) - 3, 0)
+            query_words = set(query_tokens)
+            document_words = set(document_tokens[:n_document_tokens])
+            scores.append(len(query_words & document_words) / max(len(query_words), 1))
+        return np.asarray(scores, dtype=np.float32)
+
+
+def install_fakes(embedding_dim=384, embed_cost_ms=0.0, rerank_cost_ms=0.0):
+    model_registry.clear()
+    model_registry.register_loader(
+        "sentence_transformer",
+        lambda name: FakeSentenceTransformer(embedding_dim, embed_cost_ms),
+    )
+    model_registry.register_loader(
+        "cross_encoder", lambda name: FakeCrossEncoder(rerank_cost_ms)
+    )
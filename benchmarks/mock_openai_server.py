@@ -0,0 +1,229 @@
+"""Local OpenAI-compatible stand-in for load tests and offline runs.
+
+Serves POST /v1/chat/completions (plain and `stream=True` SSE, with
+`stream_options.include_usage`) and POST /v1/embeddings, with configurable
+time-to-first-token, generation speed and injected 429s:
+
+    python -m benchmarks.mock_openai_server --port 8001 --ttft-ms 300 --tokens-per-second 50
+    OPENAI_BASE_URL=http://127.0.0.1:8001/v1 OPENAI_API_KEY=mock uvicorn main:app
+"""
+
+import argparse
+import hashlib
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+from benchmarks.corpus import WORDS
+
+CHARS_PER_TOKEN = 4
+
+
+def count_tokens(text):
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+class MockOpenAIHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    options = {}
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        stats = self.server.stats
+        with self.server.lock:
+            stats["requests"] += 1
+            stats["in_flight"] += 1
+            stats["max_in_flight"] = max(stats["max_in_flight"], stats["in_flight"])
+        try:
+            if random.random() < self.options["error_rate"]:
+                with self.server.lock:
+                    stats["rate_limited"] += 1
+                self.send_json(
+                    429,
+                    {"error": {"message": "Rate limit reached", "type": "requests"}},
+                    headers={"Retry-After": "0.05"},
+                )
+            elif self.path.endswith("/chat/completions"):
+                self.chat_completion(body)
+            elif self.path.endswith("/embeddings"):
+                self.embeddings(body)
+            else:
+                self.send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+        finally:
+            with self.server.lock:
+                stats["in_flight"] -= 1
+
+    def send_json(self, status, payload, headers=None):
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def chat_completion(self, body):
+        prompt = " ".join(message["content"] or "" for message in body["messages"])
+        n_tokens = min(
+            self.options["completion_tokens"], body.get("max_tokens") or 1 << 30
+        )
+        rng = random.Random(hashlib.sha256(prompt.encode()).hexdigest())
+        tokens = [f" {rng.choice(WORDS)}" for _ in range(n_tokens)]
+        usage = {
+            "prompt_tokens": count_tokens(prompt),
+            "completion_tokens": n_tokens,
+            "total_tokens": count_tokens(prompt) + n_tokens,
+        }
+        base = {
+            "id": "chatcmpl-mock",
+            "created": int(time.time()),
+            "model": body["model"],
+        }
+        time.sleep(self.options["ttft_ms"] / 1000)
+        if not body.get("stream"):
+            time.sleep(n_tokens / self.options["tokens_per_second"])
+            self.send_json(
+                200,
+                {
+                    **base,
+                    "object": "chat.completion",
+                    "choices": [
+                        {
+                            "index": 0,
+                            "message": {
+                                "role": "assistant",
+                                "content": "".join(tokens).strip(),
+                            },
+                            "finish_reason": "stop",
+                        }
+                    ],
+                    "usage": usage,
+                },
+            )
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        chunk = {**base, "object": "chat.completion.chunk"}
+        for i, token in enumerate(tokens):
+            if i:
+                time.sleep(1 / self.options["tokens_per_second"])
+            delta = {"content": token, **({"role": "assistant"} if i == 0 else {})}
+            self.send_event(
+                {
+                    **chunk,
+                    "choices": [{"index": 0, "delta": delta, "finish_reason": None}],
+                }
+            )
+        self.send_event(
+            {**chunk, "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}
+        )
+        if (body.get("stream_options") or {}).get("include_usage"):
+            self.send_event({**chunk, "choices": [], "usage": usage})
+        self.send_chunk(b"data: [DONE]\n\n")
+        self.send_chunk(b"")
+
+    def send_event(self, payload):
+        self.send_chunk(f"data: {json.dumps(payload)}\n\n".encode())
+
+    def send_chunk(self, data):
+        self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+        self.wfile.flush()
+
+    def embeddings(self, body):
+        inputs = body["input"] if isinstance(body["input"], list) else [body["input"]]
+        data = []
+        for i, text in enumerate(inputs):
+            seed = int.from_bytes(hashlib.sha256(text.encode()).digest()[:8], "little")
+            vector = np.random.default_rng(seed).standard_normal(
+                self.options["embedding_dim"]
+            )
+            vector /= np.linalg.norm(vector)
+            data.append(
+                {"object": "embedding", "index": i, "embedding": vector.tolist()}
+            )
+        n_tokens = sum(count_tokens(text) for text in inputs)
+        self.send_json(
+            200,
+            {
+                "object": "list",
+                "data": data,
+                "model": body["model"],
+                "usage": {"prompt_tokens": n_tokens, "total_tokens": n_tokens},
+            },
+        )
+
+
+def start_server(
+    host="127.0.0.1",
+    port=0,
+    ttft_ms=200.0,
+    tokens_per_second=100.0,
+    completion_tokens=100,
+    error_rate=0.0,
+    embedding_dim=1536,
+):
+    # Runs the server on a daemon thread; port=0 picks a free port. Returns the
+    # server, whose `base_url` can be passed to an OpenAI-compatible client.
+    handler = type(
+        "Handler",
+        (MockOpenAIHandler,),
+        {
+            "options": {
+                "ttft_ms": ttft_ms,
+                "tokens_per_second": tokens_per_second,
+                "completion_tokens": completion_tokens,
+                "error_rate": error_rate,
+                "embedding_dim": embedding_dim,
+            }
+        },
+    )
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    server.lock = threading.Lock()
+    server.stats = {
+        "requests": 0,
+        "in_flight": 0,
+        "max_in_flight": 0,
+        "rate_limited": 0,
+    }
+    server.base_url = f"http://{host}:{server.server_address[1]}/v1"
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--ttft-ms", type=float, default=200.0)
+    parser.add_argument("--tokens-per-second", type=float, default=100.0)
+    parser.add_argument("--completion-tokens", type=int, default=100)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--embedding-dim", type=int, default=1536)
+    args = parser.parse_args()
+
+    server = start_server(
+        args.host,
+        args.port,
+        args.ttft_ms,
+        args.tokens_per_second,
+        args.completion_tokens,
+        args.error_rate,
+        args.embedding_dim,
+    )
+    print(f"Mock OpenAI server listening on {server.base_url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
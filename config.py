@@ -1,4 +1,5 @@
 from pydantic import BaseModel
+from typing import Optional
 
 
 class Config(BaseModel):
@@ -13,6 +14,39 @@ class Config(BaseModel):
     sentences_per_chunk: int = 3
     delimiter: str = "\n"
     tokens_per_chunk: int = 512
-    semantic_clusters: int = 10
+    token_overlap: int = 0
+    # Defaults to the tokenizer of embedding_model
+    tokenizer: Optional[str] = None
+    semantic_window: int = 3
+    semantic_percentile: float = 20
     model_name: str = "gpt-4o-mini"
+    question: Optional[str] = None
+    embedding_model: str = "sentence-transformers/all-MiniLM-L6-v2"
+    reranker_model: str = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+    llm_provider: str = "openai"
     n_questions_per_chunk: int = 2
+    persist_directory: Optional[str] = None
+    embedding_cache_path: Optional[str] = None
+    collection_name: Optional[str] = None
+    ingest_mode: str = "full"
+    ingest_workers: int = 1
+    prefetch_batches: int = 2
+    vector_backend: str = "chroma"
+    ann_lists: Optional[int] = None
+    ann_nprobe: int = 8
+    ann_quantization: str = "int8"
+    retrieval: str = "hybrid"
+    dense_candidates: int = 20
+    lexical_candidates: int = 20
+    lexical_pruning: bool = False
+    rerank_candidates: int = 5
+    rerank_batch_size: int = 32
+    rerank_max_length: int = 512
+    rerank_top_n: Optional[int] = None
+    rerank_stop_threshold: Optional[float] = None
+    context_token_budget: int = 1024
+    context_truncate: bool = True
+    micro_batching: bool = True
+    response_cache: bool = True
+    response_cache_threshold: Optional[float] = None
+    profile: Optional[str] = None
@@ -1,16 +1,102 @@
-from fastapi import FastAPI, HTTPException, File, UploadFile, Form
+from fastapi import BackgroundTasks, FastAPI, HTTPException, File, UploadFile, Form
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse, PlainTextResponse, StreamingResponse
 from dotenv import load_dotenv
 from modules.pipeline_manager import PipelineManager
+from modules.concurrency import (
+    AdmissionController,
+    AdmissionRejected,
+    get_cpu_executor,
+    run_stage_graph,
+)
+from modules.corpus_manager import corpus_manager
+from modules.batch_qa import batch_jobs
+from modules.embedding_cache import get_embedding_cache
+from modules.model_registry import model_registry, parse_model_specs, DEFAULT_PRELOAD
+from modules.reranker import score_cache
+from modules.batching import batching_metrics
+from modules.data_chunker import check_source_names
+from modules.response_cache import response_cache
+from modules.llm_client import llm_metrics
+from modules.instrumentation import stage_metrics
 from config import Config
-from typing import List
+from typing import List, Optional
+from contextlib import AsyncExitStack, asynccontextmanager
 
 from datetime import datetime, timezone
+import asyncio
+import json
 import uuid
 import os
+import shutil
 
 load_dotenv()
 
-app = FastAPI()
+# With PRELOAD_BEFORE_FORK=1 the models are loaded when main is imported, so a
+# pre-forking server (gunicorn --preload) loads them once in the parent for
+# all its workers; the lifespan preload below then finds them loaded.
+if os.getenv("PRELOAD_BEFORE_FORK", "0") == "1":
+    model_registry.preload_before_fork(
+        parse_model_specs(os.getenv("MODEL_PRELOAD", DEFAULT_PRELOAD))
+    )
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Warm the shared models once so the first request doesn't pay for loading them.
+    # Set MODEL_PRELOAD="" to disable.
+    model_registry.preload(
+        parse_model_specs(os.getenv("MODEL_PRELOAD", DEFAULT_PRELOAD))
+    )
+    yield
+
+
+app = FastAPI(lifespan=lifespan)
+
+UPLOAD_CHUNK_BYTES = 1024 * 1024
+admission = AdmissionController(
+    max_in_flight=int(os.getenv("MAX_IN_FLIGHT_REQUESTS", 8)),
+    max_queue=int(os.getenv("MAX_QUEUED_REQUESTS", 32)),
+)
+
+
+def server_settings():
+    # Deployment-level Config fields, shared by every endpoint that builds one
+    return {
+        "persist_directory": os.getenv("VECTOR_STORE_DIR"),
+        "vector_backend": os.getenv("VECTOR_BACKEND", "chroma"),
+        "embedding_cache_path": os.getenv("EMBEDDING_CACHE_PATH"),
+    }
+
+
+def sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def new_run_id():
+    return (
+        f"{datetime.now(timezone.utc).strftime('%Y%m%d%H%M%S')}_{uuid.uuid4().hex[:8]}"
+    )
+
+
+async def save_upload(file: UploadFile, directory: str):
+    # Copy the upload in fixed-size chunks instead of reading it into memory.
+    # Each request gets its own directory, so concurrent uploads of files with
+    # the same name don't overwrite each other.
+    os.makedirs(directory, exist_ok=True)
+    file_location = os.path.join(directory, os.path.basename(file.filename))
+    with open(file_location, "wb") as f:
+        while chunk := await file.read(UPLOAD_CHUNK_BYTES):
+            await run_in_threadpool(f.write, chunk)
+    return file_location
+
+
+def check_uploads(files: List[UploadFile]):
+    # Uploads are saved, and their chunks keyed, by file name
+    try:
+        check_source_names(file.filename for file in files)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 
 @app.get("/health")
@@ -21,6 +107,49 @@ async def health_check():
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.get("/models")
+async def model_metrics():
+    return model_registry.metrics()
+
+
+@app.get("/admission")
+async def admission_metrics():
+    return admission.metrics()
+
+
+@app.get("/embedding-cache")
+async def embedding_cache_metrics():
+    return get_embedding_cache(os.getenv("EMBEDDING_CACHE_PATH")).metrics()
+
+
+@app.get("/batching")
+async def batching():
+    return batching_metrics()
+
+
+@app.get("/llm")
+async def llm_client_metrics():
+    return llm_metrics()
+
+
+@app.get("/response-cache")
+async def response_cache_metrics():
+    return response_cache.metrics()
+
+
+@app.get("/rerank-cache")
+async def rerank_cache_metrics():
+    return score_cache.metrics()
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    # Prometheus text format: per-stage latency histograms and throughput counters
+    return PlainTextResponse(
+        stage_metrics.render(), media_type="text/plain; version=0.0.4"
+    )
+
+
 @app.post("/chat/completion")
 async def chat_completion(
     files: List[UploadFile] = File(...),
@@ -32,17 +161,140 @@ async def chat_completion(
     sentences_per_chunk: int = Form(3),
     delimiter: str = Form("\n"),
     tokens_per_chunk: int = Form(512),
-    semantic_clusters: int = Form(10),
+    token_overlap: int = Form(0),
+    semantic_window: int = Form(3),
+    semantic_percentile: float = Form(20),
+    ingest_mode: str = Form("full"),
+    ingest_workers: int = Form(1),
+    collection_name: Optional[str] = Form(None),
+    question: Optional[str] = Form(None),
+    profile: Optional[str] = Form(None),
 ):
+    check_uploads(files)
+    try:
+        async with admission.slot():
+            run_id = new_run_id()
+            upload_directory = os.path.join("tmp", run_id)
+            try:
+                file_paths = [
+                    await save_upload(file, upload_directory) for file in files
+                ]
+                config = Config(
+                    file_paths=file_paths,
+                    method=method,
+                    model_name=model_name,
+                    n_questions_per_chunk=n_questions_per_chunk,
+                    chunk_size=chunk_size,
+                    words_per_chunk=words_per_chunk,
+                    sentences_per_chunk=sentences_per_chunk,
+                    delimiter=delimiter,
+                    tokens_per_chunk=tokens_per_chunk,
+                    token_overlap=token_overlap,
+                    semantic_window=semantic_window,
+                    semantic_percentile=semantic_percentile,
+                    ingest_mode=ingest_mode,
+                    ingest_workers=ingest_workers,
+                    collection_name=collection_name,
+                    question=question,
+                    profile=profile,
+                    **server_settings(),
+                )
+                pipeline_manager = PipelineManager(run_id, config)
+                model_response = await pipeline_manager.arun()
+            finally:
+                shutil.rmtree(upload_directory, ignore_errors=True)
+
+        return {
+            "status": "success",
+            "message": "Model response generated successfully.",
+            "data": model_response,
+        }
+    except AdmissionRejected as e:
+        raise HTTPException(
+            status_code=429, detail=str(e), headers={"Retry-After": "1"}
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+async def stream_answer(pipeline_manager, question, stack, index=False):
+    # SSE body: "retrieval" metadata, "token" events as the answer is generated,
+    # then "usage" with token counts and timings. Errors after the response has
+    # started are reported as an "error" event. `stack` holds the admission slot
+    # (and upload cleanup) until the stream ends.
+    async with stack:
+        try:
+            if index:
+                await run_stage_graph(pipeline_manager.stage_graph(question))
+            async for event, data in pipeline_manager.astream(question):
+                if event == "usage" and index:
+                    data["ingest_errors"] = pipeline_manager.data_loader.errors
+                yield sse(event, data)
+        except Exception as e:
+            yield sse("error", {"detail": str(e)})
+
+
+class EventStreamResponse(StreamingResponse):
+    # Closes `stack` (admission slot, upload cleanup) when the response is over,
+    # including when the client disconnects before the body generator starts
+    # and so never reaches its own `async with stack`
+    media_type = "text/event-stream"
+
+    def __init__(self, content, stack):
+        super().__init__(content)
+        self.stack = stack
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            await self.stack.aclose()
+
+
+async def open_stream(*cleanups):
+    # Takes the admission slot before the response starts, so overload is still
+    # answered with a plain 429.
+    stack = AsyncExitStack()
+    for cleanup in cleanups:
+        stack.callback(cleanup)
     try:
-        run_id = f"{datetime.now(timezone.utc).strftime('%Y%m%d%H%M%S')}_{uuid.uuid4().hex[:8]}"
-        file_paths = []
-        for file in files:
-            file_location = f"tmp/{file.filename}"
-            with open(file_location, "wb") as f:
-                f.write(await file.read())
-            file_paths.append(file_location)
+        await stack.enter_async_context(admission.slot())
+    except AdmissionRejected as e:
+        await stack.aclose()
+        raise HTTPException(
+            status_code=429, detail=str(e), headers={"Retry-After": "1"}
+        )
+    return stack
 
+
+@app.post("/chat/completion/stream")
+async def chat_completion_stream(
+    files: List[UploadFile] = File(...),
+    method: str = Form(...),
+    model_name: str = Form(...),
+    n_questions_per_chunk: int = Form(...),
+    chunk_size: int = Form(500),
+    words_per_chunk: int = Form(100),
+    sentences_per_chunk: int = Form(3),
+    delimiter: str = Form("\n"),
+    tokens_per_chunk: int = Form(512),
+    token_overlap: int = Form(0),
+    semantic_window: int = Form(3),
+    semantic_percentile: float = Form(20),
+    ingest_mode: str = Form("full"),
+    ingest_workers: int = Form(1),
+    collection_name: Optional[str] = Form(None),
+    question: Optional[str] = Form(None),
+    profile: Optional[str] = Form(None),
+):
+    check_uploads(files)
+    run_id = new_run_id()
+    upload_directory = os.path.join("tmp", run_id)
+    stack = await open_stream(
+        lambda: shutil.rmtree(upload_directory, ignore_errors=True)
+    )
+    try:
+        file_paths = [await save_upload(file, upload_directory) for file in files]
         config = Config(
             file_paths=file_paths,
             method=method,
@@ -53,21 +305,203 @@ async def chat_completion(
             sentences_per_chunk=sentences_per_chunk,
             delimiter=delimiter,
             tokens_per_chunk=tokens_per_chunk,
-            semantic_clusters=semantic_clusters,
+            token_overlap=token_overlap,
+            semantic_window=semantic_window,
+            semantic_percentile=semantic_percentile,
+            ingest_mode=ingest_mode,
+            ingest_workers=ingest_workers,
+            collection_name=collection_name,
+            question=question,
+            profile=profile,
+            **server_settings(),
         )
-        pipeline_manager = PipelineManager(run_id, config)
-        model_response = pipeline_manager.run()
+    except Exception as e:
+        await stack.aclose()
+        raise HTTPException(status_code=500, detail=str(e))
+    pipeline_manager = PipelineManager(run_id, config)
+    return EventStreamResponse(
+        stream_answer(pipeline_manager, pipeline_manager.question, stack, index=True),
+        stack,
+    )
+
+
+async def ingest_corpus(corpus_id: str, upload_directory: str):
+    corpus = corpus_manager.get(corpus_id)
+    pipeline_manager = PipelineManager(new_run_id(), corpus["config"])
+    try:
+        await asyncio.get_running_loop().run_in_executor(
+            get_cpu_executor(), corpus_manager.ingest, corpus_id, pipeline_manager
+        )
+    finally:
+        shutil.rmtree(upload_directory, ignore_errors=True)
 
-        for file_path in file_paths:
-            try:
-                os.remove(file_path)
-            except Exception as e:
-                print(f"Warning: could not delete {file_path}: {e}")
+
+@app.post("/corpora", status_code=202)
+async def create_corpus(
+    background_tasks: BackgroundTasks,
+    files: List[UploadFile] = File(...),
+    method: str = Form("character"),
+    chunk_size: int = Form(500),
+    words_per_chunk: int = Form(100),
+    sentences_per_chunk: int = Form(3),
+    delimiter: str = Form("\n"),
+    tokens_per_chunk: int = Form(512),
+    token_overlap: int = Form(0),
+    semantic_window: int = Form(3),
+    semantic_percentile: float = Form(20),
+    ingest_mode: str = Form("full"),
+    ingest_workers: int = Form(1),
+    collection_name: Optional[str] = Form(None),
+):
+    check_uploads(files)
+    try:
+        upload_directory = os.path.join("tmp", uuid.uuid4().hex)
+        file_paths = [await save_upload(file, upload_directory) for file in files]
+        config = Config(
+            file_paths=file_paths,
+            method=method,
+            chunk_size=chunk_size,
+            words_per_chunk=words_per_chunk,
+            sentences_per_chunk=sentences_per_chunk,
+            delimiter=delimiter,
+            tokens_per_chunk=tokens_per_chunk,
+            token_overlap=token_overlap,
+            semantic_window=semantic_window,
+            semantic_percentile=semantic_percentile,
+            ingest_mode=ingest_mode,
+            ingest_workers=ingest_workers,
+            collection_name=collection_name,
+            **server_settings(),
+        )
+        corpus_id = corpus_manager.create(config)
+        background_tasks.add_task(ingest_corpus, corpus_id, upload_directory)
+        return {
+            "status": "accepted",
+            "message": "Corpus ingestion started.",
+            "data": corpus_manager.status(corpus_id),
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.get("/corpora/{corpus_id}")
+async def corpus_status(corpus_id: str):
+    corpus = corpus_manager.status(corpus_id)
+    if corpus is None:
+        raise HTTPException(status_code=404, detail=f"Unknown corpus: {corpus_id}")
+    return corpus
+
+
+@app.post("/corpora/{corpus_id}/query")
+async def query_corpus(
+    corpus_id: str,
+    question: str = Form(...),
+    profile: Optional[str] = Form(None),
+):
+    corpus = corpus_manager.get(corpus_id)
+    if corpus is None:
+        raise HTTPException(status_code=404, detail=f"Unknown corpus: {corpus_id}")
+    if corpus["status"] != "ready":
+        raise HTTPException(
+            status_code=409, detail=f"Corpus is not ready: {corpus['status']}"
+        )
+    try:
+        async with admission.slot():
+            pipeline_manager = PipelineManager(
+                new_run_id(), corpus["config"].model_copy(update={"profile": profile})
+            )
+            pipeline_manager.open_index()
+            model_response = await pipeline_manager.aquery(question)
 
         return {
             "status": "success",
             "message": "Model response generated successfully.",
             "data": model_response,
         }
+    except AdmissionRejected as e:
+        raise HTTPException(
+            status_code=429, detail=str(e), headers={"Retry-After": "1"}
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.post("/corpora/{corpus_id}/query/stream")
+async def query_corpus_stream(
+    corpus_id: str,
+    question: str = Form(...),
+    profile: Optional[str] = Form(None),
+):
+    corpus = corpus_manager.get(corpus_id)
+    if corpus is None:
+        raise HTTPException(status_code=404, detail=f"Unknown corpus: {corpus_id}")
+    if corpus["status"] != "ready":
+        raise HTTPException(
+            status_code=409, detail=f"Corpus is not ready: {corpus['status']}"
+        )
+    stack = await open_stream()
+    try:
+        pipeline_manager = PipelineManager(
+            new_run_id(), corpus["config"].model_copy(update={"profile": profile})
+        )
+        pipeline_manager.open_index()
     except Exception as e:
+        await stack.aclose()
         raise HTTPException(status_code=500, detail=str(e))
+    return EventStreamResponse(stream_answer(pipeline_manager, question, stack), stack)
+
+
+@app.post("/corpora/{corpus_id}/batch", status_code=202)
+async def batch_corpus(
+    corpus_id: str,
+    background_tasks: BackgroundTasks,
+    questions: UploadFile = File(...),
+    job_id: Optional[str] = Form(None),
+):
+    # Answers a JSONL (or one-per-line text) file of questions in the
+    # background; passing the id of an earlier job resumes it
+    corpus = corpus_manager.get(corpus_id)
+    if corpus is None:
+        raise HTTPException(status_code=404, detail=f"Unknown corpus: {corpus_id}")
+    if corpus["status"] != "ready":
+        raise HTTPException(
+            status_code=409, detail=f"Corpus is not ready: {corpus['status']}"
+        )
+    try:
+        job_id = batch_jobs.create(corpus_id, job_id)
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    try:
+        questions_path = await save_upload(
+            questions, os.path.join(batch_jobs.directory, job_id)
+        )
+        pipeline_manager = PipelineManager(new_run_id(), corpus["config"])
+        pipeline_manager.open_index()
+    except Exception as e:
+        batch_jobs.update(job_id, status="failed", error=str(e))
+        raise HTTPException(status_code=500, detail=str(e))
+    background_tasks.add_task(batch_jobs.run, job_id, pipeline_manager, questions_path)
+    return {
+        "status": "accepted",
+        "message": "Batch job started.",
+        "data": batch_jobs.get(job_id),
+    }
+
+
+@app.get("/batch/{job_id}")
+async def batch_status(job_id: str):
+    job = batch_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown job: {job_id}")
+    return job
+
+
+@app.get("/batch/{job_id}/results")
+async def batch_results(job_id: str):
+    # Answers written so far, one JSON object per line
+    if batch_jobs.get(job_id) is None:
+        raise HTTPException(status_code=404, detail=f"Unknown job: {job_id}")
+    output_path = batch_jobs.output_path(job_id)
+    if not os.path.exists(output_path):
+        raise HTTPException(status_code=404, detail="No results yet")
+    return FileResponse(output_path, media_type="application/x-ndjson")
@@ -0,0 +1,343 @@
+import json
+import math
+import os
+import threading
+from array import array
+
+import numpy as np
+
+from modules.vector_backends import normalize_rows, top_k
+
+# Below this many vectors a flat scan is fast enough and k-means has too little
+# data to learn good lists, so the index stays flat until it is reached.
+DEFAULT_TRAIN_THRESHOLD = 10000
+# Lists are learned again once the index holds this many times the vectors it
+# was trained on, so they keep a bounded size as the corpus grows.
+RETRAIN_GROWTH = 4
+KMEANS_ITERATIONS = 10
+KMEANS_POINTS_PER_LIST = 256
+ASSIGN_BATCH = 16384
+
+
+def train_centroids(vectors, n_lists, seed=0):
+    # Spherical k-means (cosine) on a sample of the normalized vectors
+    rng = np.random.default_rng(seed)
+    n_sample = min(len(vectors), n_lists * KMEANS_POINTS_PER_LIST)
+    sample = vectors[rng.choice(len(vectors), n_sample, replace=False)]
+    centroids = sample[rng.choice(n_sample, n_lists, replace=False)].copy()
+    for _ in range(KMEANS_ITERATIONS):
+        labels = assign_lists(sample, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, labels, sample)
+        counts = np.bincount(labels, minlength=n_lists)
+        empty = counts == 0
+        sums[empty] = sample[rng.choice(n_sample, int(empty.sum()))]
+        centroids = normalize_rows(sums)
+    return centroids
+
+
+def assign_lists(vectors, centroids):
+    labels = np.empty(len(vectors), dtype=np.int64)
+    for start in range(0, len(vectors), ASSIGN_BATCH):
+        end = start + ASSIGN_BATCH
+        labels[start:end] = np.argmax(vectors[start:end] @ centroids.T, axis=1)
+    return labels
+
+
+def quantize(vectors):
+    # Symmetric per-vector int8: 4x smaller than float32, and for normalized
+    # vectors the rounding error barely moves cosine scores.
+    scales = np.abs(vectors).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    codes = np.round(vectors / scales[:, None]).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+
+class IVFIndex:
+    # Inverted-file ANN index: vectors are bucketed by their nearest k-means
+    # centroid and a query only scans the nprobe closest buckets. Vectors are
+    # stored as int8 codes (quantization="int8") or float32 ("none"). When
+    # persisted, the codes are opened memory-mapped and only copied into memory
+    # on the first write.
+    def __init__(
+        self,
+        directory=None,
+        n_lists=None,
+        nprobe=8,
+        quantization="int8",
+        train_threshold=DEFAULT_TRAIN_THRESHOLD,
+    ):
+        if quantization not in ("int8", "none"):
+            raise ValueError(f"Unsupported quantization: {quantization}")
+        self.directory = directory
+        self.n_lists = n_lists
+        self.nprobe = nprobe
+        self.quantization = quantization
+        self.train_threshold = train_threshold
+        self.lock = threading.RLock()
+
+        self.centroids = None
+        self.trained_size = 0
+        self.lists = []
+        self.codes = None
+        self.scales = np.empty(0, dtype=np.float32)
+        self.alive = np.empty(0, dtype=bool)
+        self.n_rows = 0
+
+        self.ids = []
+        self.documents = []
+        self.metadatas = []
+        self.rows = {}
+        self.indexed = False
+        if directory and os.path.exists(os.path.join(directory, "index.json")):
+            self.load()
+
+    @property
+    def size(self):
+        return len(self.rows)
+
+    @property
+    def trained(self):
+        return self.centroids is not None
+
+    def encode(self, vectors):
+        if self.quantization == "int8":
+            return quantize(vectors)
+        return vectors, np.ones(len(vectors), dtype=np.float32)
+
+    def decode(self, rows):
+        return self.codes[rows].astype(np.float32) * self.scales[rows, None]
+
+    def reserve(self, n_rows, dim):
+        dtype = np.int8 if self.quantization == "int8" else np.float32
+        if self.codes is None:
+            self.codes = np.empty((max(n_rows, 1024), dim), dtype=dtype)
+        if isinstance(self.codes, np.memmap) or n_rows > self.codes.shape[0]:
+            # Amortised doubling; also moves a read-only memory map into RAM
+            capacity = self.codes.shape[0]
+            capacity = max(n_rows, capacity * 2 if n_rows > capacity else capacity)
+            codes = np.empty((capacity, dim), dtype=dtype)
+            codes[: self.n_rows] = self.codes[: self.n_rows]
+            self.codes = codes
+        if n_rows > len(self.scales):
+            capacity = max(n_rows, len(self.scales) * 2)
+            self.scales = np.resize(self.scales, capacity)
+            alive = np.zeros(capacity, dtype=bool)
+            alive[: self.n_rows] = self.alive[: self.n_rows]
+            self.alive = alive
+
+    def add(self, ids, documents, embeddings, metadatas=None):
+        embeddings = normalize_rows(embeddings)
+        # An id repeated within one call is stored once, with its last values
+        last = {id_: i for i, id_ in enumerate(ids)}
+        if len(last) < len(ids):
+            keep = sorted(last.values())
+            ids = [ids[i] for i in keep]
+            documents = [documents[i] for i in keep]
+            embeddings = embeddings[keep]
+            metadatas = [metadatas[i] for i in keep] if metadatas else None
+        with self.lock:
+            # Replacing an id tombstones the old row and appends a new one
+            self.delete([id_ for id_ in ids if id_ in self.rows])
+            start = self.n_rows
+            self.reserve(start + len(ids), embeddings.shape[1])
+            codes, scales = self.encode(embeddings)
+            self.codes[start : start + len(ids)] = codes
+            self.scales[start : start + len(ids)] = scales
+            self.alive[start : start + len(ids)] = True
+            self.n_rows += len(ids)
+            for i, id_ in enumerate(ids):
+                self.rows[id_] = start + i
+                self.ids.append(id_)
+                self.documents.append(documents[i])
+                self.metadatas.append(metadatas[i] if metadatas else None)
+
+            if not self.trained:
+                if self.size >= self.train_threshold:
+                    self.train()
+            elif self.size > RETRAIN_GROWTH * self.trained_size:
+                self.train()
+            else:
+                self.add_to_lists(np.arange(start, self.n_rows), embeddings)
+
+    def add_to_lists(self, rows, vectors):
+        labels = assign_lists(vectors, self.centroids)
+        order = np.argsort(labels, kind="stable")
+        boundaries = np.searchsorted(labels[order], np.arange(len(self.lists) + 1))
+        for list_id in range(len(self.lists)):
+            members = rows[order[boundaries[list_id] : boundaries[list_id + 1]]]
+            if len(members):
+                self.lists[list_id].extend(members.tolist())
+
+    def train(self):
+        with self.lock:
+            live_rows = np.flatnonzero(self.alive[: self.n_rows])
+            vectors = normalize_rows(self.decode(live_rows))
+            n_lists = self.n_lists or max(1, int(4 * math.sqrt(len(live_rows))))
+            self.centroids = train_centroids(vectors, min(n_lists, len(live_rows)))
+            self.trained_size = len(live_rows)
+            self.lists = [array("q") for _ in range(len(self.centroids))]
+            self.add_to_lists(live_rows, vectors)
+
+    def delete(self, ids):
+        with self.lock:
+            for id_ in ids:
+                row = self.rows.pop(id_, None)
+                if row is not None:
+                    # Tombstone: list memberships are dropped on the next save
+                    self.alive[row] = False
+                    self.documents[row] = None
+
+    def update_metadatas(self, ids, metadatas):
+        with self.lock:
+            for id_, metadata in zip(ids, metadatas):
+                self.metadatas[self.rows[id_]] = metadata
+
+    def get_metadatas(self, sources):
+        sources = set(sources)
+        with self.lock:
+            return {
+                id_: self.metadatas[row]
+                for id_, row in self.rows.items()
+                if self.metadatas[row] and self.metadatas[row].get("source") in sources
+            }
+
+    def get_chunks(self, ids):
+        with self.lock:
+            return {
+                id_: (self.documents[self.rows[id_]], self.metadatas[self.rows[id_]])
+                for id_ in ids
+                if id_ in self.rows
+            }
+
+    def candidate_rows(self, query, nprobe):
+        if not self.trained:
+            return np.arange(self.n_rows)
+        probe = top_k((query @ self.centroids.T)[None, :], nprobe)[0]
+        return np.concatenate(
+            [np.frombuffer(self.lists[list_id], dtype=np.int64) for list_id in probe]
+        )
+
+    def query(self, query_embeddings, n_results=5, nprobe=None):
+        queries = normalize_rows(query_embeddings)
+        nprobe = nprobe or self.nprobe
+        results = {"ids": [], "documents": [], "metadatas": [], "distances": []}
+        with self.lock:
+            for query in queries:
+                rows = self.candidate_rows(query, nprobe)
+                rows = rows[self.alive[rows]]
+                if len(rows) == 0:
+                    best_rows, best_scores = [], []
+                else:
+                    scores = (self.codes[rows].astype(np.float32) @ query) * (
+                        self.scales[rows]
+                    )
+                    best = top_k(scores[None, :], n_results)[0]
+                    best_rows, best_scores = rows[best], scores[best]
+                results["ids"].append([self.ids[row] for row in best_rows])
+                results["documents"].append([self.documents[row] for row in best_rows])
+                results["metadatas"].append([self.metadatas[row] for row in best_rows])
+                results["distances"].append([1.0 - float(s) for s in best_scores])
+        return results
+
+    def compact(self):
+        # Drop tombstoned rows so deleted vectors stop costing memory and scan time
+        live_rows = np.flatnonzero(self.alive[: self.n_rows])
+        if len(live_rows) == self.n_rows:
+            return
+        remap = np.full(self.n_rows, -1, dtype=np.int64)
+        remap[live_rows] = np.arange(len(live_rows))
+        self.codes = self.codes[live_rows]
+        self.scales = self.scales[live_rows]
+        self.alive = np.ones(len(live_rows), dtype=bool)
+        self.ids = [self.ids[row] for row in live_rows]
+        self.documents = [self.documents[row] for row in live_rows]
+        self.metadatas = [self.metadatas[row] for row in live_rows]
+        self.rows = {id_: row for row, id_ in enumerate(self.ids)}
+        self.n_rows = len(live_rows)
+        for list_id, members in enumerate(self.lists):
+            rows = remap[np.frombuffer(members, dtype=np.int64)]
+            self.lists[list_id] = array("q", rows[rows >= 0].tolist())
+
+    def save(self):
+        if not self.directory:
+            return
+        with self.lock:
+            self.compact()
+            os.makedirs(self.directory, exist_ok=True)
+            # Still memory-mapped means no vector was written since load()
+            if self.codes is not None and not isinstance(self.codes, np.memmap):
+                np.save(
+                    os.path.join(self.directory, "codes.tmp.npy"),
+                    self.codes[: self.n_rows],
+                )
+                os.replace(
+                    os.path.join(self.directory, "codes.tmp.npy"),
+                    os.path.join(self.directory, "codes.npy"),
+                )
+            list_sizes = np.array([len(members) for members in self.lists])
+            arrays = {
+                "scales": self.scales[: self.n_rows],
+                "list_sizes": list_sizes,
+                "list_rows": (
+                    np.concatenate(
+                        [
+                            np.frombuffer(members, dtype=np.int64)
+                            for members in self.lists
+                        ]
+                    )
+                    if self.lists
+                    else np.empty(0, dtype=np.int64)
+                ),
+            }
+            if self.trained:
+                arrays["centroids"] = self.centroids
+            np.savez(os.path.join(self.directory, "ivf.tmp.npz"), **arrays)
+            os.replace(
+                os.path.join(self.directory, "ivf.tmp.npz"),
+                os.path.join(self.directory, "ivf.npz"),
+            )
+            with open(os.path.join(self.directory, "index.tmp.json"), "w") as f:
+                json.dump(
+                    {
+                        "ids": self.ids,
+                        "documents": self.documents,
+                        "metadatas": self.metadatas,
+                        "indexed": self.indexed,
+                        "quantization": self.quantization,
+                        "nprobe": self.nprobe,
+                        "trained_size": self.trained_size,
+                    },
+                    f,
+                )
+            os.replace(
+                os.path.join(self.directory, "index.tmp.json"),
+                os.path.join(self.directory, "index.json"),
+            )
+
+    def load(self):
+        with open(os.path.join(self.directory, "index.json")) as f:
+            state = json.load(f)
+        self.ids = state["ids"]
+        self.documents = state["documents"]
+        self.metadatas = state["metadatas"]
+        self.indexed = state["indexed"]
+        self.quantization = state["quantization"]
+        self.rows = {id_: row for row, id_ in enumerate(self.ids)}
+        self.n_rows = len(self.ids)
+        self.alive = np.ones(self.n_rows, dtype=bool)
+        if os.path.exists(os.path.join(self.directory, "codes.npy")):
+            self.codes = np.load(
+                os.path.join(self.directory, "codes.npy"), mmap_mode="r"
+            )
+        with np.load(os.path.join(self.directory, "ivf.npz")) as arrays:
+            self.scales = arrays["scales"]
+            if "centroids" in arrays:
+                self.centroids = arrays["centroids"]
+                self.trained_size = state.get("trained_size", self.n_rows)
+                offsets = np.concatenate([[0], np.cumsum(arrays["list_sizes"])])
+                list_rows = arrays["list_rows"]
+                self.lists = [
+                    array("q", list_rows[offsets[i] : offsets[i + 1]].tolist())
+                    for i in range(len(self.centroids))
+                ]
@@ -0,0 +1,309 @@
+import asyncio
+import json
+import os
+import threading
+import time
+import uuid
+
+from modules.concurrency import get_cpu_executor
+from modules.pipeline_manager import N_CONTEXTS, SYSTEM_PROMPT, iter_batches
+from modules.response_cache import response_cache
+
+# Questions embedded, searched and reranked together; the next batch is
+# prepared while the LLM answers the current one
+QUESTION_BATCH_SIZE = 256
+BATCH_DIRECTORY = os.getenv("BATCH_DIRECTORY", "batches")
+
+
+def read_questions(path):
+    # JSONL of {"id": ..., "question": ...} (or of plain strings), or a text
+    # file with one question per line; ids default to the line number
+    with open(path, encoding="utf-8") as f:
+        for line_number, line in enumerate(f):
+            line = line.strip()
+            if not line:
+                continue
+            if path.endswith(".jsonl"):
+                item = json.loads(line)
+                if isinstance(item, str):
+                    item = {"question": item}
+            else:
+                item = {"question": line}
+            yield {"id": str(item.get("id", line_number)), "question": item["question"]}
+
+
+def read_checkpoint(path, retry_failed=True):
+    # Ids already answered in `path`. A line cut short by a crash is dropped,
+    # so it is answered again; with `retry_failed`, so are the lines of failed
+    # questions (written with an "error").
+    done = set()
+    if not os.path.exists(path):
+        return done
+    kept = []
+    with open(path, "rb+") as f:
+        end = 0
+        for line in f:
+            if not line.endswith(b"\n"):
+                break
+            try:
+                result = json.loads(line)
+                id_ = result["id"]
+            except (ValueError, KeyError):
+                break
+            end += len(line)
+            if retry_failed and "error" in result:
+                continue
+            done.add(id_)
+            kept.append(line)
+        f.truncate(end)
+    if sum(map(len, kept)) < end:
+        partial_path = f"{path}.{os.getpid()}.partial"
+        with open(partial_path, "wb") as f:
+            f.writelines(kept)
+        os.replace(partial_path, path)
+    return done
+
+
+class BatchAnswerer:
+    # Answers many questions against one indexed corpus: questions are embedded
+    # in one pass per batch, searched with one top-k query, reranked in shared
+    # forward passes, and answered by concurrent LLM calls (bounded by the
+    # client pool). Results are appended to a JSONL file as batches finish;
+    # rerunning with the same output skips the questions already answered.
+    def __init__(
+        self, pipeline_manager, batch_size=QUESTION_BATCH_SIZE, retry_failed=True
+    ):
+        self.pipeline_manager = pipeline_manager
+        self.config = pipeline_manager.config
+        self.trace = pipeline_manager.trace
+        self.batch_size = batch_size
+        self.retry_failed = retry_failed
+        self.counters = {"answered": 0, "skipped": 0, "failed": 0, "cached": 0}
+
+    def prepare(self, items):
+        # Blocking: prompts (and context packing) for a batch of questions
+        pipeline_manager = self.pipeline_manager
+        questions = [item["question"] for item in items]
+        embedding_generator = pipeline_manager.load_embedding_model()
+        with self.trace.span(
+            "embed", items=len(questions), bytes=sum(map(len, questions))
+        ):
+            query_embeddings = embedding_generator.generate_batch(questions)
+        with self.trace.span("retrieve", items=len(questions)):
+            results = pipeline_manager.search_many(questions, query_embeddings)
+        candidates = [documents for _, documents, _ in results]
+        with self.trace.span(
+            "rerank",
+            items=sum(map(len, candidates)),
+            bytes=sum(len(doc) for docs in candidates for doc in docs),
+        ):
+            reranked = pipeline_manager.load_reranker().rerank_many(
+                questions,
+                candidates,
+                ids=[ids for ids, _, _ in results],
+                top_n=self.config.rerank_top_n,
+                stop_threshold=self.config.rerank_stop_threshold,
+                stop_after=N_CONTEXTS,
+            )
+        prepared = []
+        with self.trace.span("prompt", items=len(questions)):
+            for item, embedding, result, scores in zip(
+                items, query_embeddings, results, reranked
+            ):
+                prompt, packing = pipeline_manager.pack(
+                    item["question"], *result, scores
+                )
+                prepared.append((item, embedding, prompt, packing))
+        return prepared
+
+    async def answer(self, llm, item, query_embedding, prompt, packing):
+        pipeline_manager = self.pipeline_manager
+        scope = pipeline_manager.response_scope(packing["context_ids"])
+        result = None
+        if self.config.response_cache:
+            result = response_cache.lookup(
+                scope,
+                item["question"],
+                query_embedding,
+                threshold=self.config.response_cache_threshold,
+            )
+        if result is not None:
+            self.counters["cached"] += 1
+        else:
+            try:
+                result = await llm.agenerate(prompt, system_prompt=SYSTEM_PROMPT)
+            except Exception as e:
+                self.counters["failed"] += 1
+                return {**item, "error": f"{type(e).__name__}: {e}"}
+            self.trace.add(
+                "generate",
+                result["total_time"],
+                items=result["completion_tokens"],
+                bytes=len(result["model_response"]),
+            )
+            if self.config.response_cache:
+                response_cache.store(scope, item["question"], query_embedding, result)
+        self.counters["answered"] += 1
+        return {**item, **result, "context_ids": packing["context_ids"]}
+
+    async def run(self, questions, output_path, on_progress=None):
+        # Failed questions are written with an "error" and asked again on the
+        # next run, unless retry_failed is off
+        done = read_checkpoint(output_path, retry_failed=self.retry_failed)
+        pending = []
+        for item in questions:
+            if item["id"] in done:
+                self.counters["skipped"] += 1
+            else:
+                pending.append(item)
+        loop = asyncio.get_running_loop()
+        llm = self.pipeline_manager.make_llm()
+        prepare = self.trace.profiled(self.prepare)
+        batches = iter_batches(pending, self.batch_size)
+
+        def schedule():
+            batch = next(batches, None)
+            if batch is None:
+                return None
+            return loop.run_in_executor(get_cpu_executor(), prepare, batch)
+
+        os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+        with open(output_path, "a", encoding="utf-8") as f:
+            next_batch = schedule()
+            while next_batch is not None:
+                prepared = await next_batch
+                next_batch = schedule()
+                results = await asyncio.gather(
+                    *(self.answer(llm, *args) for args in prepared)
+                )
+                for result in results:
+                    f.write(json.dumps(result) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+                if on_progress:
+                    on_progress(self.metrics())
+        return self.metrics()
+
+    def metrics(self):
+        return {**self.counters, "timings": self.trace.summary()}
+
+
+class BatchJobManager:
+    # Batch jobs of the server; a job's results are written under
+    # BATCH_DIRECTORY and it resumes when started again with the same id
+    def __init__(self, directory=BATCH_DIRECTORY):
+        self.directory = directory
+        self.jobs = {}
+        self._lock = threading.Lock()
+
+    def output_path(self, job_id):
+        return os.path.join(self.directory, f"{job_id}.jsonl")
+
+    def create(self, corpus_id, job_id=None):
+        job_id = job_id or uuid.uuid4().hex
+        if not job_id.replace("-", "").replace("_", "").isalnum():
+            raise ValueError(f"Invalid job id: {job_id}")
+        with self._lock:
+            job = self.jobs.get(job_id)
+            if job is not None and job["status"] in ("pending", "running"):
+                raise ValueError(f"Job is already running: {job_id}")
+            self.jobs[job_id] = {
+                "job_id": job_id,
+                "corpus_id": corpus_id,
+                "status": "pending",
+                "progress": None,
+                "error": None,
+                "created_at": time.time(),
+                "elapsed_time": None,
+            }
+        return job_id
+
+    def get(self, job_id):
+        with self._lock:
+            job = self.jobs.get(job_id)
+            return dict(job) if job else None
+
+    def update(self, job_id, **fields):
+        with self._lock:
+            self.jobs[job_id].update(fields)
+
+    async def run(self, job_id, pipeline_manager, questions_path):
+        self.update(job_id, status="running")
+        initial_time = time.time()
+        answerer = BatchAnswerer(pipeline_manager)
+        try:
+            progress = await answerer.run(
+                read_questions(questions_path),
+                self.output_path(job_id),
+                on_progress=lambda progress: self.update(job_id, progress=progress),
+            )
+        except Exception as e:
+            self.update(job_id, status="failed", error=str(e))
+            return
+        pipeline_manager.trace.finish()
+        self.update(
+            job_id,
+            status="done",
+            progress=progress,
+            elapsed_time=time.time() - initial_time,
+        )
+
+
+batch_jobs = BatchJobManager()
+
+
+if __name__ == "__main__":
+    import argparse
+    from datetime import datetime, timezone
+
+    from config import Config
+    from modules.pipeline_manager import PipelineManager
+
+    parser = argparse.ArgumentParser(
+        description="Answer a file of questions against a corpus, to JSONL."
+    )
+    parser.add_argument("--questions", required=True)
+    parser.add_argument("--output", required=True)
+    parser.add_argument("--files", nargs="+", required=True)
+    parser.add_argument("--persist-directory", default=os.getenv("VECTOR_STORE_DIR"))
+    parser.add_argument("--collection-name", default=None)
+    parser.add_argument("--method", default="sentence")
+    parser.add_argument(
+        "--vector-backend", default=os.getenv("VECTOR_BACKEND", "chroma")
+    )
+    parser.add_argument("--embedding-model", default=Config().embedding_model)
+    parser.add_argument("--model-name", default=Config().model_name)
+    parser.add_argument("--batch-size", type=int, default=QUESTION_BATCH_SIZE)
+    parser.add_argument(
+        "--retry-failed", action=argparse.BooleanOptionalAction, default=True
+    )
+    args = parser.parse_args()
+
+    config = Config(
+        file_paths=args.files,
+        method=args.method,
+        persist_directory=args.persist_directory,
+        collection_name=args.collection_name,
+        vector_backend=args.vector_backend,
+        embedding_model=args.embedding_model,
+        model_name=args.model_name,
+        embedding_cache_path=os.getenv("EMBEDDING_CACHE_PATH"),
+    )
+    run_id = f"{datetime.now(timezone.utc).strftime('%Y%m%d%H%M%S')}_batch"
+    pipeline_manager = PipelineManager(run_id, config)
+    # Reuses the index of a previous run when persisted
+    pipeline_manager.index()
+    answerer = BatchAnswerer(
+        pipeline_manager, batch_size=args.batch_size, retry_failed=args.retry_failed
+    )
+    metrics = asyncio.run(
+        answerer.run(
+            read_questions(args.questions),
+            args.output,
+            on_progress=lambda progress: print(
+                f"answered {progress['answered']}, failed {progress['failed']}"
+            ),
+        )
+    )
+    metrics["timings"] = pipeline_manager.trace.finish()
+    print(json.dumps(metrics, indent=2))
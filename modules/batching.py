@@ -0,0 +1,176 @@
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from functools import partial
+
+import numpy as np
+
+from modules.embedding_generator import EmbeddingGenerator
+
+BATCH_MAX_SIZE = int(os.getenv("BATCH_MAX_SIZE", 64))
+BATCH_MAX_WAIT_MS = float(os.getenv("BATCH_MAX_WAIT_MS", 2))
+# Upper bounds of the batch size histogram buckets
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256)
+# Queue waits kept for the latency percentiles
+WAIT_SAMPLES = 4096
+
+_batchers = {}
+_batchers_lock = threading.Lock()
+
+
+class MicroBatcher:
+    # Collects items submitted from concurrent requests and runs them through
+    # `process_batch` (items -> results, same order) in one call, once
+    # `max_batch_size` items are queued or the oldest waited `max_wait_ms`.
+    # Results are scattered back through futures.
+    def __init__(
+        self,
+        name,
+        process_batch,
+        max_batch_size=BATCH_MAX_SIZE,
+        max_wait_ms=BATCH_MAX_WAIT_MS,
+    ):
+        self.name = name
+        self.process_batch = process_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self._queue = deque()
+        self._condition = threading.Condition()
+        self._waits = deque(maxlen=WAIT_SAMPLES)
+        self._histogram = dict.fromkeys(BATCH_SIZE_BUCKETS, 0)
+        self.counters = {"batches": 0, "items": 0, "errors": 0, "busy_seconds": 0.0}
+        self.started_at = time.time()
+        self._worker = threading.Thread(
+            target=self._run, name=f"batcher-{name}", daemon=True
+        )
+        self._worker.start()
+
+    def submit(self, item):
+        return self.submit_many([item])[0]
+
+    def submit_many(self, items):
+        futures = [Future() for _ in items]
+        now = time.perf_counter()
+        with self._condition:
+            self._queue.extend(zip(items, futures, [now] * len(items)))
+            self._condition.notify()
+        return futures
+
+    def map(self, items):
+        # Blocking convenience for callers running on worker threads
+        return [future.result() for future in self.submit_many(items)]
+
+    def _next_batch(self):
+        with self._condition:
+            while not self._queue:
+                self._condition.wait()
+            deadline = self._queue[0][2] + self.max_wait
+            while len(self._queue) < self.max_batch_size:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+            n_items = min(len(self._queue), self.max_batch_size)
+            return [self._queue.popleft() for _ in range(n_items)]
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            started = time.perf_counter()
+            try:
+                results = self.process_batch([item for item, _, _ in batch])
+            except Exception as e:
+                self._record(batch, started, failed=True)
+                for _, future, _ in batch:
+                    future.set_exception(e)
+                continue
+            self._record(batch, started)
+            for (_, future, _), result in zip(batch, results):
+                future.set_result(result)
+
+    def _record(self, batch, started, failed=False):
+        finished = time.perf_counter()
+        with self._condition:
+            self.counters["errors"] += int(failed)
+            self.counters["batches"] += 1
+            self.counters["items"] += len(batch)
+            self.counters["busy_seconds"] += finished - started
+            self._waits.extend(started - submitted for _, _, submitted in batch)
+            bucket = next(
+                (bound for bound in BATCH_SIZE_BUCKETS if len(batch) <= bound),
+                BATCH_SIZE_BUCKETS[-1],
+            )
+            self._histogram[bucket] += 1
+
+    def metrics(self):
+        with self._condition:
+            waits = np.array(self._waits) * 1000 if self._waits else np.zeros(1)
+            busy = self.counters["busy_seconds"]
+            return {
+                "name": self.name,
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": self.max_wait * 1000,
+                **self.counters,
+                "queued": len(self._queue),
+                "mean_batch_size": (
+                    self.counters["items"] / self.counters["batches"]
+                    if self.counters["batches"]
+                    else 0.0
+                ),
+                "batch_size_histogram": {
+                    f"<={bound}": count for bound, count in self._histogram.items()
+                },
+                "queue_wait_p50_ms": float(np.percentile(waits, 50)),
+                "queue_wait_p95_ms": float(np.percentile(waits, 95)),
+                "queue_wait_p99_ms": float(np.percentile(waits, 99)),
+                "items_per_busy_second": self.counters["items"] / busy if busy else 0.0,
+                "items_per_second": self.counters["items"]
+                / (time.time() - self.started_at),
+            }
+
+
+def get_batcher(name, process_batch):
+    # One batcher per model, shared by every request in the process. It lives
+    # as long as the process, so `process_batch` should look its model up on
+    # each call rather than hold it, or an evicted model is never freed.
+    with _batchers_lock:
+        if name not in _batchers:
+            _batchers[name] = MicroBatcher(name, process_batch)
+        return _batchers[name]
+
+
+def batching_metrics():
+    with _batchers_lock:
+        batchers = list(_batchers.values())
+    return {batcher.name: batcher.metrics() for batcher in batchers}
+
+
+def embed_batch(model, texts):
+    return list(EmbeddingGenerator(model).generate_batch(texts))
+
+
+class BatchedEmbeddingGenerator:
+    # Routes small embedding calls (single queries) through a shared batcher;
+    # calls that already fill a batch, like corpus indexing, go straight through.
+    def __init__(self, embedding_generator):
+        self.embedding_generator = embedding_generator
+        self.model = embedding_generator.model
+        self.batcher = get_batcher(
+            f"embedding:{self.model}", partial(embed_batch, self.model)
+        )
+
+    def estimate_tokens(self, text):
+        return self.embedding_generator.estimate_tokens(text)
+
+    def generate(self, text):
+        return self.batcher.submit(text).result()
+
+    def generate_batch(self, texts, max_batch_tokens=None):
+        texts = list(texts)
+        if not texts or len(texts) >= self.batcher.max_batch_size:
+            return self.embedding_generator.generate_batch(
+                texts, max_batch_tokens=max_batch_tokens
+            )
+        return np.stack(self.batcher.map(texts))
@@ -0,0 +1,48 @@
+import json
+import os
+
+import numpy as np
+
+
+def chunk_artifact_path(persist_directory, key):
+    return os.path.join(persist_directory, "chunks", f"{key}.jsonl")
+
+
+def has_chunk_records(path):
+    # Only complete artifacts exist under their final name
+    return os.path.exists(path)
+
+
+def read_chunk_records(path):
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            record = json.loads(line)
+            if "embedding" in record:
+                record["embedding"] = np.asarray(record["embedding"], dtype=np.float32)
+            yield record
+
+
+def write_chunk_records(records, path):
+    # Saves the whole chunk stream; the file only gets its final name once it
+    # is complete, so an interrupted run never leaves a truncated artifact.
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    partial_path = f"{path}.{os.getpid()}.partial"
+    n_records = 0
+    try:
+        with open(partial_path, "w", encoding="utf-8") as f:
+            for record in records:
+                line = dict(record)
+                if "embedding" in line:
+                    line["embedding"] = np.asarray(line["embedding"]).tolist()
+                f.write(json.dumps(line) + "\n")
+                n_records += 1
+        os.replace(partial_path, path)
+    finally:
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+    return n_records
+
+
+def remove_chunk_records(path):
+    if os.path.exists(path):
+        os.remove(path)
@@ -0,0 +1,140 @@
+import asyncio
+import os
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from graphlib import TopologicalSorter
+
+_cpu_executor = None
+_cpu_executor_lock = threading.Lock()
+
+
+def get_cpu_executor():
+    # Torch and tokenizers release the GIL during inference, so a bounded thread
+    # pool is enough to keep CPU stages off the event loop and use every core.
+    global _cpu_executor
+    with _cpu_executor_lock:
+        if _cpu_executor is None:
+            _cpu_executor = ThreadPoolExecutor(
+                max_workers=int(os.getenv("CPU_WORKERS", os.cpu_count() or 1)),
+                thread_name_prefix="pipeline-cpu",
+            )
+        return _cpu_executor
+
+
+async def run_stage_graph(stages, executor=None):
+    # stages: {name: (names it depends on, blocking fn)}. Each stage runs on the
+    # executor as soon as its dependencies are done, so independent stages
+    # overlap. Returns {name: result}; the first failure cancels what is left.
+    TopologicalSorter(
+        {name: deps for name, (deps, _) in stages.items()}
+    ).prepare()  # raises CycleError
+    unknown = {dep for deps, _ in stages.values() for dep in deps} - stages.keys()
+    if unknown:
+        raise ValueError(f"Unknown stages: {sorted(unknown)}")
+    loop = asyncio.get_running_loop()
+    executor = executor or get_cpu_executor()
+    tasks = {}
+
+    async def run(name):
+        deps, fn = stages[name]
+        await asyncio.gather(*(tasks[dep] for dep in deps))
+        return await loop.run_in_executor(executor, fn)
+
+    for name in stages:
+        tasks[name] = asyncio.ensure_future(run(name))
+    try:
+        results = await asyncio.gather(*tasks.values())
+    except BaseException:
+        for task in tasks.values():
+            task.cancel()
+        raise
+    return dict(zip(tasks, results))
+
+
+_DONE = object()
+
+
+def prefetch(iterable, depth=2):
+    # Produces the items of `iterable` on a background thread, at most `depth`
+    # ahead of the consumer, so producing the next item (e.g. parsing and
+    # chunking the next batch) overlaps with consuming the current one.
+    # Exceptions are re-raised in the consumer.
+    items = queue.Queue(maxsize=depth)
+    stopped = threading.Event()
+
+    def put(item):
+        while not stopped.is_set():
+            try:
+                items.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def produce():
+        try:
+            for item in iterable:
+                if not put((item, None)):
+                    return
+        except BaseException as e:
+            put((_DONE, e))
+        else:
+            put((_DONE, None))
+
+    thread = threading.Thread(target=produce, name="pipeline-prefetch", daemon=True)
+    thread.start()
+    try:
+        while True:
+            item, error = items.get()
+            if item is _DONE:
+                if error is not None:
+                    raise error
+                return
+            yield item
+    finally:
+        # The consumer stopped early (or failed): let the producer exit
+        stopped.set()
+
+
+class AdmissionRejected(Exception):
+    pass
+
+
+class AdmissionController:
+    def __init__(self, max_in_flight, max_queue):
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.in_flight = 0
+        self.waiting = 0
+        self.rejected = 0
+        self._semaphore = asyncio.Semaphore(max_in_flight)
+
+    @asynccontextmanager
+    async def slot(self):
+        if self._semaphore.locked() and self.waiting >= self.max_queue:
+            self.rejected += 1
+            raise AdmissionRejected(
+                f"Too many requests: {self.in_flight} in flight, {self.waiting} queued"
+            )
+        self.waiting += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.waiting -= 1
+        self.in_flight += 1
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+            self._semaphore.release()
+
+    def metrics(self):
+        return {
+            "max_in_flight": self.max_in_flight,
+            "max_queue": self.max_queue,
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "rejected": self.rejected,
+        }
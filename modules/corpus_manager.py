@@ -0,0 +1,73 @@
+import threading
+import time
+import uuid
+
+
+class CorpusManager:
+    def __init__(self):
+        self.corpora = {}
+        self._lock = threading.Lock()
+
+    def create(self, config):
+        corpus_id = uuid.uuid4().hex
+        with self._lock:
+            self.corpora[corpus_id] = {
+                "corpus_id": corpus_id,
+                "status": "pending",
+                "config": config,
+                "files": len(config.file_paths),
+                "chunks_indexed": 0,
+                "collection_name": None,
+                "ingest_errors": [],
+                "error": None,
+                "created_at": time.time(),
+                "ingest_time": None,
+                "timings": None,
+            }
+        return corpus_id
+
+    def get(self, corpus_id):
+        with self._lock:
+            corpus = self.corpora.get(corpus_id)
+            return dict(corpus) if corpus else None
+
+    def update(self, corpus_id, **fields):
+        with self._lock:
+            self.corpora[corpus_id].update(fields)
+
+    def status(self, corpus_id):
+        corpus = self.get(corpus_id)
+        if corpus is None:
+            return None
+        corpus.pop("config")
+        return corpus
+
+    def ingest(self, corpus_id, pipeline_manager):
+        # Runs the load -> chunk -> embed -> index stages, meant to be called from
+        # a background worker; progress and errors are recorded on the corpus.
+        self.update(corpus_id, status="indexing")
+        initial_time = time.time()
+        try:
+            vector_store = pipeline_manager.index(
+                on_progress=lambda n_chunks: self.update(
+                    corpus_id, chunks_indexed=n_chunks
+                )
+            )
+        except Exception as e:
+            self.update(corpus_id, status="failed", error=str(e))
+            return
+        config = self.get(corpus_id)["config"]
+        self.update(
+            corpus_id,
+            status="ready",
+            chunks_indexed=vector_store.count(),
+            collection_name=vector_store.name,
+            # Queries reopen the collection by name; the uploads are gone by then
+            config=config.model_copy(update={"collection_name": vector_store.name}),
+            ingest_errors=pipeline_manager.data_loader.errors,
+            ingest_time=time.time() - initial_time,
+            timings=pipeline_manager.trace.finish(),
+        )
+
+
+corpus_manager = CorpusManager()
@@ -1,10 +1,93 @@
-from sentence_transformers import SentenceTransformer
-from sklearn.cluster import KMeans
-import nltk
+import bisect
+import copy
+import hashlib
+import logging
+import os
+import re
 
-nltk.download("punkt_tab")
-# If using tiktoken for OpenAI models:
-# import tiktoken
+import numpy as np
+
+from modules.embedding_generator import DEFAULT_EMBEDDING_MODEL, embedding_tokenizer
+from modules.model_registry import model_registry
+from modules.nltk_data import punkt_tokenizer
+
+# Text chunked at once when streaming records; bounds peak memory per source
+DEFAULT_WINDOW_CHARS = 256 * 1024
+# "kind:name" of the tokenizer token chunks are measured with: the embedding
+# model's own tokenizer, or e.g. "tiktoken:cl100k_base" for OpenAI models
+DEFAULT_TOKENIZER = embedding_tokenizer(DEFAULT_EMBEDDING_MODEL)
+
+logger = logging.getLogger(__name__)
+# (tokenizer, tokens_per_chunk) settings already warned about
+_capped_settings = set()
+# Upper bound on the sentences of one semantic chunk
+SEMANTIC_MAX_SENTENCES = 15
+
+
+def token_windows(starts, ends, size, overlap):
+    # (start, end) character spans of windows of `size` tokens, each sharing
+    # `overlap` tokens with the previous one
+    n_tokens = len(starts)
+    if n_tokens == 0:
+        return np.empty((0, 2), dtype=np.int64)
+    first = np.arange(0, max(n_tokens - overlap, 1), size - overlap)
+    last = np.minimum(first + size, n_tokens) - 1
+    return np.stack([starts[first], ends[last]], axis=1)
+
+
+def sentence_splitter(language="english"):
+    return punkt_tokenizer(language)
+
+
+def semantic_breakpoints(embeddings, window, percentile, max_sentences):
+    # Indices of the sentences that start a new chunk: the gaps where the mean
+    # embeddings of the `window` sentences before and after are least similar
+    # (bottom `percentile` of the gaps), plus forced splits at max_sentences.
+    n_sentences = len(embeddings)
+    if n_sentences < 2:
+        return []
+    sums = np.concatenate(
+        [np.zeros((1, embeddings.shape[1])), np.cumsum(embeddings, axis=0)]
+    )
+    gaps = np.arange(1, n_sentences)
+    left = sums[gaps] - sums[np.maximum(gaps - window, 0)]
+    right = sums[np.minimum(gaps + window, n_sentences)] - sums[gaps]
+    similarity = np.einsum("ij,ij->i", left, right) / np.maximum(
+        np.linalg.norm(left, axis=1) * np.linalg.norm(right, axis=1), 1e-12
+    )
+    candidates = set(gaps[similarity <= np.percentile(similarity, percentile)])
+
+    breakpoints, start = [], 0
+    for gap in range(1, n_sentences):
+        if gap in candidates or gap - start >= max_sentences:
+            breakpoints.append(gap)
+            start = gap
+    return breakpoints
+
+
+def source_name(file_path):
+    # Chunks are keyed by file name rather than path, so a new upload of a
+    # document matches the chunks of its previous version
+    return os.path.basename(file_path)
+
+
+def check_source_names(file_paths):
+    seen = {}
+    for file_path in file_paths:
+        name = source_name(file_path)
+        if name in seen:
+            raise ValueError(
+                f"{seen[name]} and {file_path} have the same file name; "
+                "files are identified by name, so rename one of them"
+            )
+        seen[name] = file_path
+
+
+def chunk_id(source, content_hash, occurrence=0):
+    # The offset is deliberately not part of the id: an edit early in a document
+    # shifts every later offset, and those chunks must still match on re-ingest.
+    source_hash = hashlib.sha256(source.encode()).hexdigest()
+    return f"{source_hash[:12]}-{content_hash[:20]}-{occurrence}"
 
 
 class DataChunker:
@@ -17,7 +100,11 @@ class DataChunker:
         sentences_per_chunk=3,
         delimiter="\n",
         tokens_per_chunk=512,
-        semantic_clusters=10,
+        token_overlap=0,
+        tokenizer=DEFAULT_TOKENIZER,
+        semantic_window=3,
+        semantic_percentile=20,
+        embedding_fn=None,
     ):
         self.text = text
         self.method = method
@@ -26,7 +113,13 @@ class DataChunker:
         self.sentences_per_chunk = sentences_per_chunk
         self.delimiter = delimiter
         self.tokens_per_chunk = tokens_per_chunk
-        self.semantic_clusters = semantic_clusters
+        self.token_overlap = token_overlap
+        self.tokenizer = tokenizer
+        self.semantic_window = semantic_window
+        self.semantic_percentile = semantic_percentile
+        # texts -> embeddings; the pipeline passes its cached embedding
+        # generator, so sentences encoded here are not encoded again
+        self.embedding_fn = embedding_fn
 
     def chunk_by_character(self):
         return [
@@ -42,7 +135,7 @@ class DataChunker:
         ]
 
     def chunk_by_sentence(self):
-        sentences = nltk.sent_tokenize(self.text)
+        sentences = sentence_splitter().tokenize(self.text)
         return [
             " ".join(sentences[i : i + self.sentences_per_chunk])
             for i in range(0, len(sentences), self.sentences_per_chunk)
@@ -57,47 +150,244 @@ class DataChunker:
         ]
 
     def chunk_by_token(self):
-        # Using nltk for tokenization
-        tokens = nltk.word_tokenize(self.text)
-        return [
-            " ".join(tokens[i : i + self.tokens_per_chunk])
-            for i in range(0, len(tokens), self.tokens_per_chunk)
-        ]
-        # If using tiktoken, replace above with:
-        # enc = tiktoken.get_encoding("cl100k_base")
-        # tokens = enc.encode(self.text)
-        # return [enc.decode(tokens[i:i+tokens_per_chunk]) for i in range(0, len(tokens), tokens_per_chunk)]
+        return [self.text[start:end] for start, end in self.token_spans()]
+
+    def token_offsets(self):
+        # Character (start, end) arrays of the tokenizer's tokens, plus the
+        # longest sequence the model accepts (None when unbounded)
+        kind, _, name = self.tokenizer.partition(":")
+        model = model_registry.get(kind, name)
+        if kind == "tiktoken":
+            tokens = model.encode_ordinary(self.text)
+            _, starts = model.decode_with_offsets(tokens)
+            starts = np.asarray(starts, dtype=np.int64)
+            ends = np.append(starts[1:], len(self.text))
+            return starts, ends, None
+        encoding = model.tokenizer(
+            self.text,
+            add_special_tokens=False,
+            return_offsets_mapping=True,
+            return_attention_mask=False,
+            verbose=False,
+        )
+        offsets = np.asarray(encoding["offset_mapping"], dtype=np.int64)
+        offsets = offsets.reshape(-1, 2)
+        # [CLS] and [SEP] take two positions of the model's window
+        return offsets[:, 0], offsets[:, 1], model.max_seq_length - 2
+
+    def token_spans(self):
+        # Windows of tokens_per_chunk tokens as spans into the original text,
+        # so chunks keep its spacing and map straight back to their offsets
+        starts, ends, max_tokens = self.token_offsets()
+        size = min(self.tokens_per_chunk, max_tokens or self.tokens_per_chunk)
+        if size < self.tokens_per_chunk:
+            setting = (self.tokenizer, self.tokens_per_chunk)
+            if setting not in _capped_settings:
+                _capped_settings.add(setting)
+                logger.warning(
+                    "tokens_per_chunk=%d is over the %d tokens %s accepts; "
+                    "chunks are cut to %d tokens",
+                    self.tokens_per_chunk,
+                    max_tokens,
+                    self.tokenizer,
+                    size,
+                )
+        if not 0 <= self.token_overlap < size:
+            raise ValueError(
+                f"token_overlap must be smaller than the chunk size ({size} tokens)"
+            )
+        spans = []
+        for start, end in token_windows(starts, ends, size, self.token_overlap):
+            # Byte-level tokens carry their leading whitespace
+            while start < end and self.text[start].isspace():
+                start += 1
+            spans.append((int(start), int(end)))
+        return spans
 
     def chunk_by_semantic(self):
-        sentences = nltk.sent_tokenize(self.text)
-        model = SentenceTransformer("all-MiniLM-L6-v2")
-        embeddings = model.encode(sentences)
-        kmeans = KMeans(
-            n_clusters=min(self.semantic_clusters, len(sentences)), random_state=0
+        return [chunk for chunk, _, _ in self.semantic_spans()]
+
+    def embed_sentences(self, sentences):
+        if self.embedding_fn is not None:
+            embeddings = self.embedding_fn(sentences)
+        else:
+            model = model_registry.get("sentence_transformer", "all-MiniLM-L6-v2")
+            embeddings = model.encode(sentences, show_progress_bar=False)
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        return embeddings / np.maximum(norms, 1e-12)
+
+    def semantic_spans(self):
+        # [(chunk, offset, embedding)]: runs of contiguous sentences split where
+        # the topic shifts, in one linear pass. A chunk's embedding is the mean
+        # of its (normalized) sentence embeddings, so indexing can reuse it.
+        spans = list(sentence_splitter().span_tokenize(self.text))
+        if not spans:
+            return []
+        embeddings = self.embed_sentences(
+            [self.text[start:end] for start, end in spans]
+        )
+        breakpoints = semantic_breakpoints(
+            embeddings,
+            self.semantic_window,
+            self.semantic_percentile,
+            SEMANTIC_MAX_SENTENCES,
         )
-        labels = kmeans.fit_predict(embeddings)
-        clusters = [[] for _ in range(max(labels) + 1)]
-        for sentence, label in zip(sentences, labels):
-            clusters[label].append(sentence)
-        return [" ".join(cluster) for cluster in clusters if cluster]
+        chunks = []
+        for first, last in zip([0, *breakpoints], [*breakpoints, len(spans)]):
+            start, end = spans[first][0], spans[last - 1][1]
+            embedding = embeddings[first:last].mean(axis=0)
+            embedding /= max(np.linalg.norm(embedding), 1e-12)
+            chunks.append((self.text[start:end], start, embedding))
+        return chunks
+
+    def find_offset(self, chunk, cursor):
+        offset = self.text.find(chunk, cursor)
+        words = chunk.split()
+        if words:
+            # word/sentence/token chunks are re-joined with single spaces, so they
+            # only match the source up to whitespace; take the earliest match.
+            pattern = r"\s+".join(re.escape(word) for word in words)
+            if chunk[0].isspace():
+                pattern = r"\s+" + pattern
+            end = offset + len(chunk) if offset >= 0 else len(self.text)
+            match = re.compile(pattern).search(self.text, cursor, end)
+            if match:
+                offset = match.start()
+        return offset
+
+    def chunk_spans(self):
+        # [(chunk, offset, embedding)]; token and semantic chunks are spans
+        # already, other methods' chunks are located in the text (-1 when not
+        # found). Only semantic chunks come with an embedding.
+        if self.method == "token":
+            return [
+                (self.text[start:end], start, None) for start, end in self.token_spans()
+            ]
+        if self.method == "semantic":
+            return self.semantic_spans()
+        spans, cursor = [], 0
+        for chunk in self.chunk_text():
+            offset = self.find_offset(chunk, cursor)
+            if offset >= 0:
+                cursor = offset + len(chunk)
+            spans.append((chunk, offset, None))
+        return spans
+
+    def chunk_records(self, source):
+        return list(
+            self.iter_chunk_records(
+                [{"file_path": source, "page": None, "text": self.text}],
+                window_chars=None,
+            )
+        )
+
+    def iter_chunk_records(self, records, window_chars=DEFAULT_WINDOW_CHARS):
+        # Consumes DataLoader.iter_records() and chunks a bounded window of text
+        # at a time. The last (possibly incomplete) chunk of a window is carried
+        # over as the start of the next one, so chunks don't break at windows.
+        file_path, state, parts, pages, size = None, None, [], [], 0
+        file_paths = {}
+        for record in records:
+            if record["file_path"] != file_path:
+                if file_path is not None:
+                    yield from self.chunk_window(state, parts, pages, final=True)
+                # Records of one file come in one run; a name seen before is
+                # another file with the same name (or the same file again)
+                file_path, source = record["file_path"], source_name(
+                    record["file_path"]
+                )
+                if source in file_paths:
+                    check_source_names([file_paths[source], file_path])
+                file_paths[source] = file_path
+                state = {"source": source, "base_offset": 0, "occurrences": {}}
+                parts, pages, size = [], [], 0
+            pages.append((size, record["page"]))
+            parts.append(record["text"])
+            size += len(record["text"]) + 1
+            if window_chars and size >= window_chars:
+                parts, pages, size = yield from self.chunk_window(
+                    state, parts, pages, final=False
+                )
+        if file_path is not None:
+            yield from self.chunk_window(state, parts, pages, final=True)
+
+    def chunk_window(self, state, parts, pages, final):
+        text = "\n".join(parts)
+        window = copy.copy(self)
+        window.text = text
+        chunks = window.chunk_spans()
+        if not final and len(chunks) < 2:
+            return parts, pages, len(text) + 1
+
+        page_starts = [start for start, _ in pages]
+        carry_from = len(text)
+        for i, (chunk, offset, embedding) in enumerate(chunks):
+            if not final and i == len(chunks) - 1 and offset > 0:
+                carry_from = offset
+                break
+            page = pages[bisect.bisect_right(page_starts, max(offset, 0)) - 1][1]
+            yield self.make_record(state, chunk, offset, page, embedding)
+        if final:
+            return None
+
+        carry = text[carry_from:]
+        carry_page = pages[bisect.bisect_right(page_starts, carry_from) - 1][1]
+        carry_pages = [(0, carry_page)] + [
+            (start - carry_from, page) for start, page in pages if start > carry_from
+        ]
+        state["base_offset"] += carry_from
+        return [carry], carry_pages, len(carry) + 1
+
+    def make_record(self, state, chunk, offset, page, embedding=None):
+        content_hash = hashlib.sha256(chunk.encode()).hexdigest()
+        occurrence = state["occurrences"].get(content_hash, 0)
+        state["occurrences"][content_hash] = occurrence + 1
+        record = {
+            "id": chunk_id(state["source"], content_hash, occurrence),
+            "text": chunk,
+            "source": state["source"],
+            "page": page,
+            "offset": state["base_offset"] + offset if offset >= 0 else -1,
+            "content_hash": content_hash,
+        }
+        if embedding is not None:
+            record["embedding"] = embedding
+        return record
 
     def chunk_text(self):
-        if self.method == "character":
-            return self.chunk_by_character()
-        elif self.method == "word":
-            return self.chunk_by_word()
-        elif self.method == "sentence":
-            return self.chunk_by_sentence()
-        elif self.method == "paragraph":
-            return self.chunk_by_paragraph()
-        elif self.method == "delimiter":
-            return self.chunk_by_delimiter()
-        elif self.method == "token":
-            return self.chunk_by_token()
-        elif self.method == "semantic":
-            return self.chunk_by_semantic()
-        else:
+        if self.method not in CHUNKERS:
             raise ValueError("Unknown chunking method.")
+        chunk_fn, _ = CHUNKERS[self.method]
+        return chunk_fn(self)
+
+    def options(self):
+        # The settings the chunks of this method depend on, in a stable order
+        # (collection names and cached chunk artifacts are keyed by them)
+        _, option_names = CHUNKERS[self.method]
+        return [getattr(self, name) for name in option_names]
+
+
+# method -> (chunk function taking the DataChunker, options it depends on)
+CHUNKERS = {
+    "character": (DataChunker.chunk_by_character, ("chunk_size",)),
+    "word": (DataChunker.chunk_by_word, ("words_per_chunk",)),
+    "sentence": (DataChunker.chunk_by_sentence, ("sentences_per_chunk",)),
+    "paragraph": (DataChunker.chunk_by_paragraph, ()),
+    "delimiter": (DataChunker.chunk_by_delimiter, ("delimiter",)),
+    "token": (
+        DataChunker.chunk_by_token,
+        ("tokens_per_chunk", "token_overlap", "tokenizer"),
+    ),
+    "semantic": (
+        DataChunker.chunk_by_semantic,
+        ("semantic_window", "semantic_percentile"),
+    ),
+}
+
+
+def register_chunker(method, chunk_fn, option_names=()):
+    CHUNKERS[method] = (chunk_fn, tuple(option_names))
 
 
 if __name__ == "__main__":
@@ -129,6 +419,6 @@ if __name__ == "__main__":
     token_chunks = DataChunker(data, method="token", tokens_per_chunk=512).chunk_text()
     print(f"Number of token chunks: {len(token_chunks)}")
     semantic_chunks = DataChunker(
-        data, method="semantic", semantic_clusters=10
+        data, method="semantic", semantic_percentile=20
     ).chunk_text()
     print(f"Number of semantic chunks: {len(semantic_chunks)}")
@@ -1,31 +1,58 @@
+import collections
+import multiprocessing
 import os
-from docx import Document
-from PyPDF2 import PdfReader
+import threading
+from concurrent.futures import ProcessPoolExecutor
 from typing import List
 
+TXT_BLOCK_CHARS = 64 * 1024
+# Large PDFs are split into page ranges so one file can use several workers
+PDF_PAGES_PER_TASK = 32
+
+_process_pools = {}
+_process_pools_lock = threading.Lock()
+
+
+def get_process_pool(max_workers):
+    # Pools are kept for the life of the process: spawning workers is far more
+    # expensive than parsing a typical file. "spawn" avoids forking a parent
+    # that already holds model threads.
+    with _process_pools_lock:
+        if max_workers not in _process_pools:
+            _process_pools[max_workers] = ProcessPoolExecutor(
+                max_workers=max_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return _process_pools[max_workers]
+
+
+def parse_file_task(file_path, start=0, stop=None):
+    data_loader = DataLoader()
+    if file_path.lower().endswith(".pdf"):
+        pages = data_loader.iter_pdf_pages(file_path, start, stop)
+    else:
+        pages = data_loader.iter_file(file_path)
+    return [(page, text) for page, text in pages if text.strip()]
+
 
 class DataLoader:
-    def __init__(self, file_paths: List[str] = None):
+    def __init__(self, file_paths: List[str] = None, max_workers: int = None):
         self.file_paths = file_paths
+        self.max_workers = max_workers
+        self.errors = []
 
     def read_pdf(self, file_path):
         try:
-            reader = PdfReader(file_path)
-            text = ""
-            for page in reader.pages:
-                text += page.extract_text() + "\n"
-            return text.strip()
+            return "\n".join(text for _, text in self.iter_pdf_pages(file_path)).strip()
         except Exception as e:
             print(f"Error reading PDF file {file_path}: {e}")
             return None
 
     def read_docx(self, file_path):
         try:
-            doc = Document(file_path)
-            text = ""
-            for para in doc.paragraphs:
-                text += para.text + "\n"
-            return text.strip()
+            return "\n".join(
+                text for _, text in self.iter_docx_paragraphs(file_path)
+            ).strip()
         except Exception as e:
             print(f"Error reading DOCX file {file_path}: {e}")
             return None
@@ -39,6 +66,109 @@ class DataLoader:
             print(f"Error reading TXT file {file_path}: {e}")
             return None
 
+    def iter_pdf_pages(self, file_path, start=0, stop=None):
+        from PyPDF2 import PdfReader
+
+        reader = PdfReader(file_path)
+        stop = len(reader.pages) if stop is None else min(stop, len(reader.pages))
+        for index in range(start, stop):
+            yield index + 1, reader.pages[index].extract_text() or ""
+
+    def iter_docx_paragraphs(self, file_path):
+        from docx import Document
+
+        doc = Document(file_path)
+        for paragraph_number, para in enumerate(doc.paragraphs, start=1):
+            yield paragraph_number, para.text
+
+    def iter_txt_blocks(self, file_path, block_chars=TXT_BLOCK_CHARS):
+        # Plain text has no pages: yield blocks of whole lines of about block_chars
+        with open(file_path, "r", encoding="utf-8") as file:
+            block_number, lines, size = 1, [], 0
+            for line in file:
+                lines.append(line)
+                size += len(line)
+                if size >= block_chars:
+                    yield block_number, "".join(lines).rstrip("\n")
+                    block_number, lines, size = block_number + 1, [], 0
+            if lines:
+                yield block_number, "".join(lines).rstrip("\n")
+
+    def iter_file(self, file_path: str):
+        _, ext = os.path.splitext(file_path)
+        ext = ext.lower()
+
+        if ext == ".pdf":
+            return self.iter_pdf_pages(file_path)
+        elif ext == ".docx":
+            return self.iter_docx_paragraphs(file_path)
+        elif ext == ".txt":
+            return self.iter_txt_blocks(file_path)
+        else:
+            raise ValueError(f"Unsupported file type: {ext}")
+
+    def iter_records(self):
+        # Lazily yields one record per PDF page / DOCX paragraph / TXT block, so
+        # a whole file (or corpus) never has to be held as a single string.
+        if self.max_workers and self.max_workers > 1:
+            yield from self.iter_records_parallel()
+            return
+        for file_path in self.file_paths or []:
+            try:
+                for page, text in self.iter_file(file_path):
+                    if text.strip():
+                        yield {"file_path": file_path, "page": page, "text": text}
+            except Exception as e:
+                self.errors.append({"file_path": file_path, "error": str(e)})
+
+    def plan_tasks(self):
+        from PyPDF2 import PdfReader
+
+        tasks = []
+        for file_path in self.file_paths or []:
+            if file_path.lower().endswith(".pdf"):
+                try:
+                    n_pages = len(PdfReader(file_path).pages)
+                except Exception as e:
+                    self.errors.append({"file_path": file_path, "error": str(e)})
+                    continue
+                for start in range(0, n_pages, PDF_PAGES_PER_TASK):
+                    tasks.append((file_path, start, start + PDF_PAGES_PER_TASK))
+            else:
+                tasks.append((file_path, 0, None))
+        return tasks
+
+    def iter_records_parallel(self):
+        # Tasks are submitted with a bounded look-ahead and consumed in submission
+        # order, so records come back in the same order as the sequential path.
+        # As there, a file stops at its first failing range.
+        pool = get_process_pool(self.max_workers)
+        tasks = iter(self.plan_tasks())
+        pending = collections.deque()
+        failed = set()
+        while True:
+            while len(pending) < self.max_workers * 2:
+                task = next(tasks, None)
+                if task is None:
+                    break
+                if task[0] in failed:
+                    continue
+                pending.append((task[0], pool.submit(parse_file_task, *task)))
+            if not pending:
+                break
+            file_path, future = pending.popleft()
+            if file_path in failed:
+                future.cancel()
+                continue
+            try:
+                pages = future.result()
+            except Exception as e:
+                failed.add(file_path)
+                self.errors.append({"file_path": file_path, "error": str(e)})
+                continue
+            for page, text in pages:
+                yield {"file_path": file_path, "page": page, "text": text}
+
     def read_file(self, file_path: str):
         _, ext = os.path.splitext(file_path)
         ext = ext.lower()
@@ -0,0 +1,167 @@
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import unicodedata
+from collections import OrderedDict
+
+import numpy as np
+
+# SQLite caps the number of host parameters per statement
+SQLITE_MAX_VARIABLES = 900
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def normalize_text(text):
+    text = unicodedata.normalize("NFKC", text)
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def cache_key(model, text):
+    return hashlib.sha256(f"{model}\0{normalize_text(text)}".encode()).hexdigest()
+
+
+class EmbeddingCache:
+    def __init__(self, path=None, max_memory_mb=256):
+        self.path = path
+        self.max_memory_bytes = int(max_memory_mb * 1024 * 1024)
+        self._memory = OrderedDict()
+        self._memory_bytes = 0
+        self._lock = threading.Lock()
+        self.counters = {
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "saved_tokens": 0,
+            "evictions": 0,
+        }
+        self._db = None
+        if path:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings "
+                "(key TEXT PRIMARY KEY, model TEXT, dim INTEGER, vector BLOB)"
+            )
+            self._db.commit()
+
+    def get_many(self, keys):
+        found = {}
+        with self._lock:
+            missing = []
+            for key in keys:
+                vector = self._memory.get(key)
+                if vector is None:
+                    missing.append(key)
+                    continue
+                self._memory.move_to_end(key)
+                found[key] = vector
+            self.counters["memory_hits"] += len(found)
+
+            if self._db is not None:
+                for start in range(0, len(missing), SQLITE_MAX_VARIABLES):
+                    batch = missing[start : start + SQLITE_MAX_VARIABLES]
+                    rows = self._db.execute(
+                        "SELECT key, vector FROM embeddings WHERE key IN "
+                        f"({','.join('?' * len(batch))})",
+                        batch,
+                    ).fetchall()
+                    for key, blob in rows:
+                        vector = np.frombuffer(blob, dtype=np.float32)
+                        found[key] = vector
+                        self._remember(key, vector)
+                    self.counters["disk_hits"] += len(rows)
+            self.counters["misses"] += len(keys) - len(found)
+        return found
+
+    def put_many(self, model, items):
+        with self._lock:
+            rows = []
+            for key, vector in items:
+                vector = np.ascontiguousarray(vector, dtype=np.float32)
+                self._remember(key, vector)
+                rows.append((key, model, vector.shape[0], vector.tobytes()))
+            if self._db is not None and rows:
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?, ?)", rows
+                )
+                self._db.commit()
+
+    def record_saved_tokens(self, n_tokens):
+        with self._lock:
+            self.counters["saved_tokens"] += n_tokens
+
+    def _remember(self, key, vector):
+        if key in self._memory:
+            self._memory.move_to_end(key)
+            return
+        self._memory[key] = vector
+        self._memory_bytes += vector.nbytes
+        while self._memory_bytes > self.max_memory_bytes and self._memory:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= evicted.nbytes
+            self.counters["evictions"] += 1
+
+    def metrics(self):
+        with self._lock:
+            hits = self.counters["memory_hits"] + self.counters["disk_hits"]
+            lookups = hits + self.counters["misses"]
+            return {
+                **self.counters,
+                "hit_rate": hits / lookups if lookups else 0.0,
+                "memory_entries": len(self._memory),
+                "memory_bytes": self._memory_bytes,
+                "path": self.path,
+            }
+
+
+def get_embedding_cache(path=None):
+    with _caches_lock:
+        if path not in _caches:
+            _caches[path] = EmbeddingCache(
+                path=path,
+                max_memory_mb=float(os.getenv("EMBEDDING_CACHE_MEMORY_MB", 256)),
+            )
+        return _caches[path]
+
+
+class CachedEmbeddingGenerator:
+    def __init__(self, embedding_generator, cache):
+        self.embedding_generator = embedding_generator
+        self.cache = cache
+        self.model = embedding_generator.model
+
+    def generate(self, text):
+        return self.generate_batch([text])[0]
+
+    def generate_batch(self, texts, max_batch_tokens=None):
+        texts = list(texts)
+        keys = [cache_key(self.model, text) for text in texts]
+        found = self.cache.get_many(list(dict.fromkeys(keys)))
+
+        # Each distinct missing text is embedded once, even if repeated in the input
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in found and key not in missing:
+                missing[key] = text
+        if missing:
+            vectors = self.embedding_generator.generate_batch(
+                list(missing.values()), max_batch_tokens=max_batch_tokens
+            )
+            found.update(zip(missing.keys(), vectors))
+            self.cache.put_many(self.model, zip(missing.keys(), vectors))
+
+        self.cache.record_saved_tokens(
+            sum(
+                self.embedding_generator.estimate_tokens(text)
+                for key, text in zip(keys, texts)
+                if key not in missing
+            )
+        )
+        if not texts:
+            return np.empty((0, 0), dtype=np.float32)
+        return np.stack([found[key] for key in keys]).astype(np.float32, copy=False)
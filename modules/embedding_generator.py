@@ -1,34 +1,128 @@
+import numpy as np
+
+from modules.model_registry import model_registry
+
+# Rough token estimate, good enough to size batches without running a tokenizer
+CHARS_PER_TOKEN = 4
+LOCAL_MAX_BATCH_TOKENS = 16384
+LOCAL_MAX_BATCH_SIZE = 256
+# OpenAI embeddings limits: 2048 inputs and 300k tokens per request
+OPENAI_MAX_INPUTS_PER_REQUEST = 2048
+OPENAI_MAX_REQUEST_TOKENS = 250000
+
+
+# model -> (model registry kind, name); "openai" models are served by the API
+EMBEDDING_MODELS = {
+    "text-embedding-3-small": ("openai", "text-embedding-3-small"),
+    "sentence-transformers/all-mpnet-base-v2": (
+        "sentence_transformer",
+        "all-mpnet-base-v2",
+    ),
+    "sentence-transformers/all-MiniLM-L6-v2": (
+        "sentence_transformer",
+        "all-MiniLM-L6-v2",
+    ),
+}
+
+
+DEFAULT_EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+
+
+def register_embedding_model(model, kind, name):
+    EMBEDDING_MODELS[model] = (kind, name)
+
+
+def embedding_tokenizer(model):
+    # "kind:name" of the tokenizer that counts tokens the way `model` does:
+    # tiktoken for API models, the model's own tokenizer otherwise
+    if model not in EMBEDDING_MODELS:
+        raise ValueError(f"Unsupported model: {model}")
+    kind, name = EMBEDDING_MODELS[model]
+    if kind == "openai":
+        return f"tiktoken:{name}"
+    return f"{kind}:{name}"
+
+
 class EmbeddingGenerator:
     def __init__(self, model):
         self.model = model
+        if self.model not in EMBEDDING_MODELS:
+            raise ValueError(f"Unsupported model: {self.model}")
+        self.kind, self.name = EMBEDDING_MODELS[self.model]
         self.client = self.load_model()
 
     def load_model(self):
-        if self.model == "text-embedding-3-small":
-            from openai import OpenAI
+        if self.kind == "openai":
+            from modules.llm_client import get_llm_pool
 
-            client = OpenAI()
-        elif self.model == "sentence-transformers/all-mpnet-base-v2":
-            from sentence_transformers import SentenceTransformer
+            # Shares the keep-alive connections, concurrency cap, rate limits
+            # and retries of the chat client
+            self.pool = get_llm_pool()
+            return self.pool.client
+        return model_registry.get(self.kind, self.name)
 
-            client = SentenceTransformer("all-mpnet-base-v2")
-
-        elif self.model == "sentence-transformers/all-MiniLM-L6-v2":
-            from sentence_transformers import SentenceTransformer
+    def generate(self, text):
+        return self.generate_batch([text])[0]
 
-            client = SentenceTransformer("all-MiniLM-L6-v2")
+    def generate_batch(self, texts, max_batch_tokens=None):
+        texts = list(texts)
+        if self.kind == "openai":
+            batch_tokens = max_batch_tokens or OPENAI_MAX_REQUEST_TOKENS
+            max_items = OPENAI_MAX_INPUTS_PER_REQUEST
         else:
-            raise ValueError(f"Unsupported model: {self.model}")
-        return client
+            batch_tokens = max_batch_tokens or LOCAL_MAX_BATCH_TOKENS
+            max_items = LOCAL_MAX_BATCH_SIZE
 
-    def generate(self, text):
-        if self.model == "text-embedding-3-small":
-            response = self.client.embeddings.create(input=text, model=self.model)
-        elif self.model == "sentence-transformers/all-MiniLM-L6-v2":
-            response = self.client.encode(text)
-        elif self.model == "sentence-transformers/all-mpnet-base-v2":
-            response = self.client.encode(text)
-        return response
+        embeddings = None
+        for indices in self.make_batches(texts, batch_tokens, max_items):
+            vectors = self.encode([texts[i] for i in indices])
+            if embeddings is None:
+                embeddings = np.empty((len(texts), vectors.shape[1]), dtype=np.float32)
+            embeddings[indices] = vectors
+        if embeddings is None:
+            return np.empty((0, 0), dtype=np.float32)
+        return embeddings
+
+    def make_batches(self, texts, max_batch_tokens, max_items):
+        # Longest first, so each batch pads to a similar length; a batch costs
+        # roughly (number of items) x (longest item) tokens.
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]), reverse=True)
+        batch, width = [], 0
+        for i in order:
+            if batch and (
+                len(batch) >= max_items or (len(batch) + 1) * width > max_batch_tokens
+            ):
+                yield batch
+                batch = []
+            if not batch:
+                width = self.estimate_tokens(texts[i])
+            batch.append(i)
+        if batch:
+            yield batch
+
+    def estimate_tokens(self, text):
+        tokens = len(text) // CHARS_PER_TOKEN + 1
+        max_seq_length = getattr(self.client, "max_seq_length", None)
+        if max_seq_length:
+            # sentence-transformers truncates longer inputs anyway
+            tokens = min(tokens, max_seq_length)
+        return tokens
+
+    def encode(self, texts):
+        if self.kind == "openai":
+            inputs = [text or " " for text in texts]
+            tokens = sum(map(self.estimate_tokens, inputs))
+            with self.pool.slot(tokens):
+                response = self.pool.retry(
+                    lambda: self.client.embeddings.create(input=inputs, model=self.name)
+                )
+            self.pool.settle(tokens, response.usage)
+            data = sorted(response.data, key=lambda item: item.index)
+            return np.asarray([item.embedding for item in data], dtype=np.float32)
+        vectors = self.client.encode(
+            texts, batch_size=len(texts), convert_to_numpy=True
+        )
+        return np.asarray(vectors, dtype=np.float32)
 
 
 if __name__ == "__main__":
@@ -47,6 +141,5 @@ if __name__ == "__main__":
         model="sentence-transformers/all-MiniLM-L6-v2"
     )
 
-    for chunk in chunks:
-        embedding = embedding_generator.generate(chunk)
-        print(f"Embedding Length: {len(embedding)}\n")
+    embeddings = embedding_generator.generate_batch(chunks)
+    print(f"Embeddings shape: {embeddings.shape}\n")
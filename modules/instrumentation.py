@@ -0,0 +1,351 @@
+import contextvars
+import io
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from modules.model_registry import peak_rss_bytes, process_rss_bytes
+
+logger = logging.getLogger(__name__)
+
+STAGES = (
+    "load",
+    "chunk",
+    "embed",
+    "index",
+    "retrieve",
+    "rerank",
+    "prompt",
+    "generate",
+)
+# Upper bounds (seconds) of the per-run stage duration histogram buckets
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+PROFILERS = ("cprofile", "pyinstrument")
+# Lines of cProfile output kept per profiled call
+PROFILE_LINES = int(os.getenv("PROFILE_LINES", 40))
+
+# Innermost open span of the current thread or task; nested spans are timed
+# exclusively, so a parent's time does not include its children's.
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+
+class RunTrace:
+    # Per-run stage timings: wall and CPU (thread) time, items, bytes and how
+    # much the process peak RSS grew during the stage, summed over every span of
+    # the stage. Optionally profiles the calls wrapped with profiled().
+    def __init__(self, run_id, profiler=None):
+        if profiler is not None and profiler not in PROFILERS:
+            raise ValueError(f"Unsupported profiler: {profiler}")
+        self.run_id = run_id
+        self.profiler = profiler
+        self.stages = {}
+        self.started_at = time.time()
+        self._profiles = []
+        self._lock = threading.Lock()
+        self._exported = False
+
+    def _stage(self, stage):
+        return self.stages.setdefault(
+            stage,
+            {
+                "calls": 0,
+                "wall_seconds": 0.0,
+                "cpu_seconds": 0.0,
+                "items": 0,
+                "bytes": 0,
+                "peak_rss_growth_bytes": 0,
+                "started_at": None,
+                "ended_at": None,
+            },
+        )
+
+    def _record(self, stage, wall, cpu, items, n_bytes, started_at, rss_growth=0):
+        with self._lock:
+            totals = self._stage(stage)
+            totals["calls"] += 1
+            totals["wall_seconds"] += wall
+            totals["cpu_seconds"] += cpu
+            totals["items"] += items
+            totals["bytes"] += n_bytes
+            totals["peak_rss_growth_bytes"] += rss_growth
+            if totals["started_at"] is None:
+                totals["started_at"] = started_at
+            totals["ended_at"] = started_at + wall
+
+    def _open(self):
+        span = {
+            "started_at": time.time(),
+            "wall": time.perf_counter(),
+            "cpu": time.thread_time(),
+            "peak_rss": peak_rss_bytes(),
+            "child_wall": 0.0,
+            "child_cpu": 0.0,
+            "child_rss_growth": 0,
+        }
+        return span, _current_span.set(span)
+
+    def _close(self, span, token):
+        wall = time.perf_counter() - span["wall"]
+        cpu = time.thread_time() - span["cpu"]
+        rss_growth = peak_rss_bytes() - span["peak_rss"]
+        _current_span.reset(token)
+        parent = _current_span.get()
+        if parent is not None:
+            parent["child_wall"] += wall
+            parent["child_cpu"] += cpu
+            parent["child_rss_growth"] += rss_growth
+        return (
+            wall - span["child_wall"],
+            max(cpu - span["child_cpu"], 0.0),
+            max(rss_growth - span["child_rss_growth"], 0),
+        )
+
+    @contextmanager
+    def span(self, stage, items=0, bytes=0):
+        # Yields a dict whose "items"/"bytes" the caller may fill in
+        counts = {"items": items, "bytes": bytes}
+        span, token = self._open()
+        try:
+            yield counts
+        finally:
+            wall, cpu, rss_growth = self._close(span, token)
+            self._record(
+                stage,
+                wall,
+                cpu,
+                counts["items"],
+                counts["bytes"],
+                span["started_at"],
+                rss_growth,
+            )
+
+    def add(self, stage, wall_seconds, items=0, bytes=0, started_at=None):
+        # A stage timed by the caller; it has no CPU time
+        started_at = started_at or time.time() - wall_seconds
+        self._record(stage, wall_seconds, 0.0, items, bytes, started_at)
+
+    def iterate(self, stage, iterable, size=None):
+        # Charges the time spent producing each item of a lazy iterable (e.g.
+        # the loader -> chunker stream) to `stage`, counting items and size(item)
+        iterator = iter(iterable)
+        while True:
+            span, token = self._open()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                wall, cpu, rss_growth = self._close(span, token)
+                self._record(stage, wall, cpu, 0, 0, span["started_at"], rss_growth)
+                return
+            except BaseException:
+                self._close(span, token)
+                raise
+            wall, cpu, rss_growth = self._close(span, token)
+            self._record(
+                stage,
+                wall,
+                cpu,
+                1,
+                size(item) if size else 0,
+                span["started_at"],
+                rss_growth,
+            )
+            yield item
+
+    def profiled(self, fn):
+        # Wraps a (blocking) stage call so it runs under the requested profiler
+        if self.profiler is None:
+            return fn
+
+        def run(*args, **kwargs):
+            if self.profiler == "pyinstrument":
+                from pyinstrument import Profiler
+
+                profiler = Profiler()
+                profiler.start()
+                try:
+                    return fn(*args, **kwargs)
+                finally:
+                    profiler.stop()
+                    self._profiles.append(profiler.output_text())
+            import cProfile
+            import pstats
+
+            profiler = cProfile.Profile()
+            profiler.enable()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                profiler.disable()
+                output = io.StringIO()
+                stats = pstats.Stats(profiler, stream=output)
+                stats.sort_stats("cumulative").print_stats(PROFILE_LINES)
+                self._profiles.append(output.getvalue())
+
+        return run
+
+    def summary(self):
+        with self._lock:
+            stages = {
+                stage: {
+                    key: value
+                    for key, value in totals.items()
+                    if key not in ("started_at", "ended_at")
+                }
+                for stage, totals in sorted(self.stages.items(), key=stage_order)
+            }
+        summary = {
+            "run_id": self.run_id,
+            "total_seconds": time.time() - self.started_at,
+            "stages": stages,
+        }
+        if self._profiles:
+            summary["profile"] = "\n".join(self._profiles)
+        return summary
+
+    def finish(self):
+        # Exports the run's stage totals to the process metrics (and OpenTelemetry
+        # when enabled) once; returns the summary for the response payload.
+        summary = self.summary()
+        if not self._exported:
+            self._exported = True
+            stage_metrics.observe(summary)
+            export_otel(self)
+        return summary
+
+
+def stage_order(item):
+    return STAGES.index(item[0]) if item[0] in STAGES else len(STAGES)
+
+
+class StageMetrics:
+    # Process-wide aggregates rendered in the Prometheus text format
+    def __init__(self, buckets=DURATION_BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self.runs = 0
+        self.stages = {}
+
+    def observe(self, summary):
+        with self._lock:
+            self.runs += 1
+            for stage, totals in summary["stages"].items():
+                metrics = self.stages.setdefault(
+                    stage,
+                    {
+                        "histogram": [0] * len(self.buckets),
+                        "count": 0,
+                        "sum": 0.0,
+                        "cpu_seconds": 0.0,
+                        "items": 0,
+                        "bytes": 0,
+                    },
+                )
+                for i, bound in enumerate(self.buckets):
+                    if totals["wall_seconds"] <= bound:
+                        metrics["histogram"][i] += 1
+                metrics["count"] += 1
+                metrics["sum"] += totals["wall_seconds"]
+                metrics["cpu_seconds"] += totals["cpu_seconds"]
+                metrics["items"] += totals["items"]
+                metrics["bytes"] += totals["bytes"]
+
+    def render(self):
+        with self._lock:
+            lines = [
+                "# HELP rag_runs_total Pipeline runs that finished.",
+                "# TYPE rag_runs_total counter",
+                f"rag_runs_total {self.runs}",
+                "# HELP rag_stage_duration_seconds Wall time of a stage per run.",
+                "# TYPE rag_stage_duration_seconds histogram",
+            ]
+            for stage, metrics in self.stages.items():
+                for bound, count in zip(self.buckets, metrics["histogram"]):
+                    lines.append(
+                        f'rag_stage_duration_seconds_bucket{{stage="{stage}",le="{bound}"}} {count}'
+                    )
+                lines += [
+                    f'rag_stage_duration_seconds_bucket{{stage="{stage}",le="+Inf"}} {metrics["count"]}',
+                    f'rag_stage_duration_seconds_sum{{stage="{stage}"}} {metrics["sum"]}',
+                    f'rag_stage_duration_seconds_count{{stage="{stage}"}} {metrics["count"]}',
+                ]
+            for name, key, help_text in (
+                ("rag_stage_cpu_seconds_total", "cpu_seconds", "CPU time of a stage."),
+                ("rag_stage_items_total", "items", "Items processed by a stage."),
+                (
+                    "rag_stage_bytes_total",
+                    "bytes",
+                    "Bytes of text processed by a stage.",
+                ),
+            ):
+                lines += [f"# HELP {name} {help_text}", f"# TYPE {name} counter"]
+                lines += [
+                    f'{name}{{stage="{stage}"}} {metrics[key]}'
+                    for stage, metrics in self.stages.items()
+                ]
+            lines += [
+                "# HELP rag_process_resident_memory_bytes Resident memory of the process.",
+                "# TYPE rag_process_resident_memory_bytes gauge",
+                f"rag_process_resident_memory_bytes {process_rss_bytes()}",
+            ]
+        return "\n".join(lines) + "\n"
+
+
+stage_metrics = StageMetrics()
+
+_otel_tracer = None
+_otel_lock = threading.Lock()
+
+
+def get_otel_tracer():
+    # OpenTelemetry is optional: enabled with OTEL_TRACING=1 when the SDK is
+    # installed and configured (e.g. through opentelemetry-instrument)
+    global _otel_tracer
+    if os.getenv("OTEL_TRACING", "0") != "1":
+        return None
+    with _otel_lock:
+        if _otel_tracer is None:
+            try:
+                from opentelemetry import trace
+            except ImportError:
+                logger.warning("OTEL_TRACING=1 but opentelemetry is not installed")
+                _otel_tracer = False
+            else:
+                _otel_tracer = trace.get_tracer("rag-pipeline")
+        return _otel_tracer or None
+
+
+def export_otel(run_trace):
+    # One span per run with a child span per stage, from the recorded times;
+    # a stage's span covers its first to last call, its busy time is an attribute.
+    tracer = get_otel_tracer()
+    if tracer is None or not run_trace.stages:
+        return
+    from opentelemetry import trace
+
+    with run_trace._lock:
+        stages = {stage: dict(totals) for stage, totals in run_trace.stages.items()}
+    ns = 1_000_000_000
+    root = tracer.start_span(
+        "rag.run",
+        start_time=int(run_trace.started_at * ns),
+        attributes={"rag.run_id": run_trace.run_id},
+    )
+    context = trace.set_span_in_context(root)
+    for stage, totals in stages.items():
+        span = tracer.start_span(
+            f"rag.{stage}",
+            context=context,
+            start_time=int(totals["started_at"] * ns),
+            attributes={
+                "rag.run_id": run_trace.run_id,
+                **{
+                    f"rag.{key}": value
+                    for key, value in totals.items()
+                    if key not in ("started_at", "ended_at")
+                },
+            },
+        )
+        span.end(end_time=int(totals["ended_at"] * ns))
+    root.end()
@@ -0,0 +1,270 @@
+import json
+import math
+import os
+import re
+import threading
+from array import array
+from collections import Counter
+
+import numpy as np
+
+from modules.vector_backends import top_k
+
+# Words, plus identifiers such as "ERR-404", "v2.3.1" or "x_max" kept whole
+TOKEN_PATTERN = re.compile(r"\w+(?:[-_./:]\w+)*")
+# Reciprocal rank fusion constant from Cormack et al.; damps the top ranks
+RRF_K = 60
+
+_indexes = {}
+_lock = threading.Lock()
+
+
+def tokenize(text):
+    # Compound identifiers are indexed whole and by their parts, so "ERR-404"
+    # is found by an exact query as well as by "404".
+    tokens = []
+    for match in TOKEN_PATTERN.finditer(text.lower()):
+        token = match.group()
+        tokens.append(token)
+        if not token.isalnum():
+            tokens.extend(re.findall(r"[^\W_]+", token))
+    return tokens
+
+
+def reciprocal_rank_fusion(rankings, k=RRF_K):
+    # Rankings are lists of ids, best first; only ranks matter, so BM25 and
+    # cosine scores never have to be put on the same scale.
+    scores = {}
+    for ranking in rankings:
+        for rank, id_ in enumerate(ranking):
+            scores[id_] = scores.get(id_, 0.0) + 1.0 / (k + rank + 1)
+    return sorted(scores, key=scores.get, reverse=True)
+
+
+class BM25Index:
+    # Inverted index over chunk texts. Each term's postings are two parallel
+    # array('I') buffers (row, term frequency) that numpy reads without copying;
+    # rows are append-only and deletes are tombstones dropped on save.
+    def __init__(self, directory=None, k1=1.2, b=0.75):
+        self.directory = directory
+        self.k1 = k1
+        self.b = b
+        self.lock = threading.RLock()
+        self.postings = {}
+        self.lengths = array("I")
+        self.alive = bytearray()
+        self.ids = []
+        self.sources = []
+        self.rows = {}
+        self.total_length = 0
+        self.indexed = False
+        if directory and os.path.exists(os.path.join(directory, "bm25.json")):
+            self.load()
+
+    @property
+    def size(self):
+        return len(self.rows)
+
+    def add(self, ids, documents, sources=None):
+        with self.lock:
+            self.delete([id_ for id_ in ids if id_ in self.rows])
+            for i, (id_, document) in enumerate(zip(ids, documents)):
+                row = len(self.ids)
+                term_counts = Counter(tokenize(document))
+                for term, count in term_counts.items():
+                    postings = self.postings.get(term)
+                    if postings is None:
+                        postings = self.postings[term] = (array("I"), array("I"))
+                    postings[0].append(row)
+                    postings[1].append(count)
+                length = sum(term_counts.values())
+                self.lengths.append(length)
+                self.alive.append(1)
+                self.ids.append(id_)
+                self.sources.append(sources[i] if sources else None)
+                self.rows[id_] = row
+                self.total_length += length
+
+    def mark_indexed(self):
+        with self.lock:
+            self.indexed = True
+            self.save()
+
+    def delete(self, ids):
+        with self.lock:
+            for id_ in ids:
+                row = self.rows.pop(id_, None)
+                if row is not None:
+                    self.alive[row] = 0
+                    self.total_length -= self.lengths[row]
+
+    def sync(self, records):
+        # Mirrors VectorStore.sync_documents for the sources in `records`
+        sources = {record["source"] for record in records}
+        current_ids = {record["id"] for record in records}
+        with self.lock:
+            stale_ids = [
+                id_
+                for id_, row in self.rows.items()
+                if self.sources[row] in sources and id_ not in current_ids
+            ]
+            self.delete(stale_ids)
+            new_records = [
+                record for record in records if record["id"] not in self.rows
+            ]
+            self.add(
+                [record["id"] for record in new_records],
+                [record["text"] for record in new_records],
+                [record["source"] for record in new_records],
+            )
+
+    def term_scores(self, tfs, lengths, idf, avg_length):
+        norm = self.k1 * (1.0 - self.b + self.b * lengths / avg_length)
+        return idf * tfs * (self.k1 + 1.0) / (tfs + norm)
+
+    def search(self, query, n_results=10, prune=False):
+        # Returns [(id, score)], best first. With `prune`, a query that has a
+        # selective term only scores the chunks containing one: faster, but
+        # chunks matching only common terms are left out, so it is not exact BM25.
+        with self.lock:
+            n_docs = self.size
+            if n_docs == 0:
+                return []
+            n_rows = len(self.ids)
+            avg_length = self.total_length / n_docs
+            lengths = np.frombuffer(self.lengths, dtype=np.uint32)
+            postings = []
+            for term in set(tokenize(query)):
+                if term in self.postings:
+                    rows = np.frombuffer(self.postings[term][0], dtype=np.uint32)
+                    tfs = np.frombuffer(self.postings[term][1], dtype=np.uint32)
+                    # df counts tombstoned rows too until the next compaction
+                    df = len(rows)
+                    idf = max(0.0, math.log(1.0 + (n_docs - df + 0.5) / (df + 0.5)))
+                    postings.append((rows, tfs.astype(np.float32), idf))
+            if not postings:
+                return []
+
+            rare = [rows for rows, _, _ in postings if len(rows) * 16 < n_rows]
+            if prune and rare:
+                # Candidates come from the selective terms only; common terms just
+                # add their score to those rows, looked up by binary search since
+                # postings are sorted by row.
+                candidates = np.unique(np.concatenate(rare))
+                scores = np.zeros(len(candidates), dtype=np.float32)
+                for rows, tfs, idf in postings:
+                    positions = np.searchsorted(rows, candidates)
+                    positions[positions == len(rows)] = 0
+                    hit = rows[positions] == candidates
+                    scores[hit] += self.term_scores(
+                        tfs[positions[hit]], lengths[candidates[hit]], idf, avg_length
+                    )
+            else:
+                dense = np.zeros(n_rows, dtype=np.float32)
+                for rows, tfs, idf in postings:
+                    dense[rows] += self.term_scores(tfs, lengths[rows], idf, avg_length)
+                candidates = np.flatnonzero(dense)
+                scores = dense[candidates]
+            live = np.frombuffer(self.alive, dtype=np.bool_)[candidates]
+            candidates, scores = candidates[live], scores[live]
+            best = top_k(scores[None, :], n_results)[0]
+            return [(self.ids[candidates[i]], float(scores[i])) for i in best]
+
+    def compact(self):
+        live_rows = [row for row in range(len(self.ids)) if self.alive[row]]
+        if len(live_rows) == len(self.ids):
+            return
+        remap = np.full(len(self.ids), -1, dtype=np.int64)
+        remap[live_rows] = np.arange(len(live_rows))
+        for term in list(self.postings):
+            rows = np.frombuffer(self.postings[term][0], dtype=np.uint32)
+            tfs = np.frombuffer(self.postings[term][1], dtype=np.uint32)
+            new_rows = remap[rows]
+            keep = new_rows >= 0
+            if keep.any():
+                self.postings[term] = (
+                    array("I", new_rows[keep].astype(np.uint32).tobytes()),
+                    array("I", tfs[keep].tobytes()),
+                )
+            else:
+                del self.postings[term]
+        self.lengths = array("I", [self.lengths[row] for row in live_rows])
+        self.alive = bytearray(b"\x01" * len(live_rows))
+        self.ids = [self.ids[row] for row in live_rows]
+        self.sources = [self.sources[row] for row in live_rows]
+        self.rows = {id_: row for row, id_ in enumerate(self.ids)}
+
+    def save(self):
+        if not self.directory:
+            return
+        with self.lock:
+            self.compact()
+            os.makedirs(self.directory, exist_ok=True)
+            terms = list(self.postings)
+            sizes = np.array([len(self.postings[term][0]) for term in terms])
+            np.savez(
+                os.path.join(self.directory, "bm25.tmp.npz"),
+                sizes=sizes,
+                rows=np.frombuffer(
+                    b"".join(self.postings[term][0].tobytes() for term in terms),
+                    dtype=np.uint32,
+                ),
+                tfs=np.frombuffer(
+                    b"".join(self.postings[term][1].tobytes() for term in terms),
+                    dtype=np.uint32,
+                ),
+                lengths=np.frombuffer(self.lengths, dtype=np.uint32),
+            )
+            os.replace(
+                os.path.join(self.directory, "bm25.tmp.npz"),
+                os.path.join(self.directory, "bm25.npz"),
+            )
+            with open(os.path.join(self.directory, "bm25.tmp.json"), "w") as f:
+                json.dump(
+                    {
+                        "terms": terms,
+                        "ids": self.ids,
+                        "sources": self.sources,
+                        "indexed": self.indexed,
+                    },
+                    f,
+                )
+            os.replace(
+                os.path.join(self.directory, "bm25.tmp.json"),
+                os.path.join(self.directory, "bm25.json"),
+            )
+
+    def load(self):
+        with open(os.path.join(self.directory, "bm25.json")) as f:
+            state = json.load(f)
+        self.ids = state["ids"]
+        self.sources = state["sources"]
+        self.indexed = state["indexed"]
+        self.rows = {id_: row for row, id_ in enumerate(self.ids)}
+        self.alive = bytearray(b"\x01" * len(self.ids))
+        with np.load(os.path.join(self.directory, "bm25.npz")) as arrays:
+            self.lengths = array("I", arrays["lengths"].tobytes())
+            self.total_length = int(arrays["lengths"].sum())
+            offsets = np.concatenate([[0], np.cumsum(arrays["sizes"])]).astype(int)
+            rows, tfs = arrays["rows"], arrays["tfs"]
+            self.postings = {
+                term: (
+                    array("I", rows[offsets[i] : offsets[i + 1]].tobytes()),
+                    array("I", tfs[offsets[i] : offsets[i + 1]].tobytes()),
+                )
+                for i, term in enumerate(state["terms"])
+            }
+
+
+def get_lexical_index(collection_name, persist_directory=None):
+    # Shared per process and stored next to the vector index of the collection
+    directory = (
+        os.path.join(persist_directory, "bm25", collection_name)
+        if persist_directory
+        else None
+    )
+    key = (directory, collection_name)
+    with _lock:
+        if key not in _indexes:
+            _indexes[key] = BM25Index(directory)
+        return _indexes[key]
@@ -1,39 +1,164 @@
-from openai import OpenAI
 import dotenv
 import os
-from openai import OpenAI
 import re
 import time
 
+from modules.llm_client import get_llm_pool
+
 dotenv.load_dotenv()
 
+# provider -> environment variable with the base URL of its OpenAI-compatible
+# endpoint (unset means OpenAI itself)
+LLM_PROVIDERS = {
+    "openai": "OPENAI_BASE_URL",
+}
+
+
+def register_llm_provider(provider, base_url_env):
+    LLM_PROVIDERS[provider] = base_url_env
+
 
 class LLM:
-    def __init__(self, model_name):
+    def __init__(self, model_name, base_url=None, provider="openai"):
+        # Any model served by the provider's OpenAI-compatible endpoint, or the
+        # one at `base_url`; clients are shared per process.
+        if provider not in LLM_PROVIDERS:
+            raise ValueError(f"Unsupported LLM provider: {provider}")
         self.model_name = model_name
+        self.provider = provider
+        self.pool = get_llm_pool(base_url or os.getenv(LLM_PROVIDERS[provider]))
+        self.client = self.pool.client
+
+    def messages(self, prompt, system_prompt=None):
+        return [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": prompt},
+        ]
+
+    def request(self, prompt, system_prompt=None, stream=False):
+        request = {
+            "model": self.model_name,
+            "messages": self.messages(prompt, system_prompt),
+            "max_tokens": 1500,
+        }
+        if stream:
+            request["stream"] = True
+            request["stream_options"] = {"include_usage": True}
+        return request
 
-        if self.model_name == "gpt-4.1-mini":
-            self.client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+    def estimate_tokens(self, request):
+        return self.pool.estimate_tokens(request["messages"], request["max_tokens"])
 
     def generate(self, prompt, system_prompt=None):
+        request = self.request(prompt, system_prompt)
+        tokens = self.estimate_tokens(request)
         initial_time = time.time()
-        response = self.client.chat.completions.create(
-            model=self.model_name,
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": prompt},
-            ],
-            max_tokens=1500,
-        )
+        with self.pool.slot(tokens):
+            response = self.pool.retry(
+                lambda: self.client.chat.completions.create(**request)
+            )
         total_time = time.time() - initial_time
-        model_response = response.choices[0].message.content.strip()
+        self.pool.settle(tokens, response.usage)
+        return self.results(response, total_time)
+
+    async def agenerate(self, prompt, system_prompt=None):
+        request = self.request(prompt, system_prompt)
+        tokens = self.estimate_tokens(request)
+        initial_time = time.time()
+        async with self.pool.aslot(tokens):
+            response = await self.pool.aretry(
+                lambda: self.pool.async_client.chat.completions.create(**request)
+            )
+        total_time = time.time() - initial_time
+        self.pool.settle(tokens, response.usage)
+        return self.results(response, total_time)
+
+    def stream(self, prompt, system_prompt=None):
+        # Yields ("token", text) as the completion arrives, then ("usage", results)
+        request = self.request(prompt, system_prompt, stream=True)
+        tokens = self.estimate_tokens(request)
+        initial_time = time.time()
+        state = {"parts": [], "usage": None, "first_token_time": None}
+        # The concurrency slot is held until the whole completion is read
+        with self.pool.slot(tokens):
+            response = self.pool.retry(
+                lambda: self.client.chat.completions.create(**request)
+            )
+            for chunk in response:
+                token = self.read_chunk(chunk, state, initial_time)
+                if token:
+                    yield "token", token
+        self.pool.settle(tokens, state["usage"])
+        yield "usage", self.stream_results(state, time.time() - initial_time)
+
+    async def astream(self, prompt, system_prompt=None):
+        request = self.request(prompt, system_prompt, stream=True)
+        tokens = self.estimate_tokens(request)
+        initial_time = time.time()
+        state = {"parts": [], "usage": None, "first_token_time": None}
+        async with self.pool.aslot(tokens):
+            response = await self.pool.aretry(
+                lambda: self.pool.async_client.chat.completions.create(**request)
+            )
+            async for chunk in response:
+                token = self.read_chunk(chunk, state, initial_time)
+                if token:
+                    yield "token", token
+        self.pool.settle(tokens, state["usage"])
+        yield "usage", self.stream_results(state, time.time() - initial_time)
+
+    def read_chunk(self, chunk, state, initial_time):
+        if chunk.usage is not None:
+            state["usage"] = chunk.usage
+        if not chunk.choices or not chunk.choices[0].delta.content:
+            return None
+        if state["first_token_time"] is None:
+            state["first_token_time"] = time.time() - initial_time
+        state["parts"].append(chunk.choices[0].delta.content)
+        return chunk.choices[0].delta.content
+
+    def stream_results(self, state, total_time):
+        usage = state["usage"]
+        return self.summarize(
+            "".join(state["parts"]).strip(),
+            usage.prompt_tokens if usage else None,
+            # Without usage (server ignores stream_options) count the chunks
+            usage.completion_tokens if usage else len(state["parts"]),
+            total_time,
+            state["first_token_time"],
+        )
+
+    def results(self, response, total_time):
+        # Without streaming, the first token is only seen with the last one
+        return self.summarize(
+            response.choices[0].message.content.strip(),
+            response.usage.prompt_tokens,
+            response.usage.completion_tokens,
+            total_time,
+            total_time,
+        )
 
+    def summarize(
+        self,
+        model_response,
+        prompt_tokens,
+        completion_tokens,
+        total_time,
+        time_to_first_token,
+    ):
+        generation_time = total_time - (time_to_first_token or 0.0)
         results = {
             "model_response": model_response,
-            "prompt_tokens": response.usage.prompt_tokens,
-            "completion_tokens": response.usage.completion_tokens,
-            "total_tokens": response.usage.total_tokens,
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": (prompt_tokens or 0) + completion_tokens,
             "total_time": total_time,
+            "time_to_first_token": time_to_first_token,
+            "tokens_per_second": (
+                completion_tokens / (generation_time or total_time)
+                if total_time
+                else None
+            ),
         }
 
         return results
@@ -58,7 +183,7 @@ if __name__ == "__main__":
     embedding_generator = EmbeddingGenerator(
         model="sentence-transformers/all-MiniLM-L6-v2"
     )
-    embeddings = [embedding_generator.generate(chunk) for chunk in chunks]
+    embeddings = embedding_generator.generate_batch(chunks)
 
     vector_store = VectorStore(collection_name="test_collection")
     vector_store.add_documents(chunks, embeddings)
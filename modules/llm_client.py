@@ -0,0 +1,265 @@
+import asyncio
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager, contextmanager
+
+BACKOFF_BASE_SECONDS = 0.5
+BACKOFF_MAX_SECONDS = 20.0
+CHARS_PER_TOKEN = 4
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+class TokenBucket:
+    # Per-minute budget refilled continuously. reserve() always succeeds and
+    # returns how long the caller must wait for its share, so callers are served
+    # in arrival order; refund() returns over-estimated tokens.
+    def __init__(self, per_minute):
+        self.capacity = float(per_minute)
+        self.rate = self.capacity / 60.0
+        self.level = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, amount):
+        with self._lock:
+            now = time.monotonic()
+            self.level = min(
+                self.capacity, self.level + (now - self.updated) * self.rate
+            )
+            self.updated = now
+            self.level -= amount
+            return max(0.0, -self.level / self.rate)
+
+    def refund(self, amount):
+        with self._lock:
+            self.level = min(self.capacity, self.level + amount)
+
+
+class LLMClientPool:
+    # Process-wide OpenAI-compatible clients for one base URL: keep-alive
+    # connection pools, a cap on concurrent calls, requests/tokens-per-minute
+    # buckets and jittered retries on rate limits and transient errors.
+    def __init__(
+        self,
+        base_url=None,
+        api_key=None,
+        max_concurrency=16,
+        requests_per_minute=None,
+        tokens_per_minute=None,
+        max_retries=4,
+        timeout=60.0,
+        max_connections=100,
+    ):
+        # openai (and httpx) are imported on first use, not at startup
+        import httpx
+        from openai import (
+            APIConnectionError,
+            APITimeoutError,
+            AsyncOpenAI,
+            DefaultAsyncHttpxClient,
+            DefaultHttpxClient,
+            InternalServerError,
+            OpenAI,
+            RateLimitError,
+        )
+
+        self.base_url = base_url
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        # Errors worth retrying; anything else (bad request, auth) fails immediately
+        self.retryable_errors = (
+            RateLimitError,
+            APIConnectionError,
+            APITimeoutError,
+            InternalServerError,
+        )
+        self.rate_limit_error = RateLimitError
+        limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_connections,
+        )
+        # Retries are done here (with the rate limiter in the loop), not by the SDK
+        self.client = OpenAI(
+            base_url=base_url,
+            api_key=api_key,
+            max_retries=0,
+            timeout=timeout,
+            http_client=DefaultHttpxClient(limits=limits, timeout=timeout),
+        )
+        # Async clients are made per event loop, see async_client
+        self._make_async_client = lambda: AsyncOpenAI(
+            base_url=base_url,
+            api_key=api_key,
+            max_retries=0,
+            timeout=timeout,
+            http_client=DefaultAsyncHttpxClient(limits=limits, timeout=timeout),
+        )
+        self._async_clients = {}
+        self.request_bucket = (
+            TokenBucket(requests_per_minute) if requests_per_minute else None
+        )
+        self.token_bucket = (
+            TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        )
+        # One cap shared by sync and async callers
+        self._semaphore = threading.BoundedSemaphore(max_concurrency)
+        # Async callers wait for a slot on these threads, not on the event loop
+        self._slot_executor = ThreadPoolExecutor(
+            max_workers=max_concurrency, thread_name_prefix="llm-slot"
+        )
+        self._lock = threading.Lock()
+        self.counters = {
+            "calls": 0,
+            "in_flight": 0,
+            "retries": 0,
+            "rate_limited": 0,
+            "failures": 0,
+            "throttled_seconds": 0.0,
+        }
+
+    @property
+    def async_client(self):
+        # An async client's keep-alive connections belong to the event loop that
+        # opened them, so each running loop gets its own client. Clients of
+        # closed loops are dropped; their connections died with the loop.
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            for other in [other for other in self._async_clients if other.is_closed()]:
+                del self._async_clients[other]
+            if loop not in self._async_clients:
+                self._async_clients[loop] = self._make_async_client()
+            return self._async_clients[loop]
+
+    def estimate_tokens(self, messages, max_tokens):
+        # Charged up front and corrected with the real usage afterwards
+        chars = sum(len(message.get("content") or "") for message in messages)
+        return chars // CHARS_PER_TOKEN + (max_tokens or 0)
+
+    def throttle_delay(self, tokens):
+        delay = 0.0
+        if self.request_bucket:
+            delay = max(delay, self.request_bucket.reserve(1))
+        if self.token_bucket:
+            delay = max(delay, self.token_bucket.reserve(tokens))
+        if delay:
+            self._count("throttled_seconds", delay)
+        return delay
+
+    def settle(self, estimated_tokens, usage):
+        if self.token_bucket and usage is not None:
+            self.token_bucket.refund(estimated_tokens - usage.total_tokens)
+
+    def backoff(self, attempt, error):
+        delay = random.uniform(
+            0, min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2**attempt)
+        )
+        response = getattr(error, "response", None)
+        retry_after = (
+            response.headers.get("retry-after") if response is not None else None
+        )
+        try:
+            delay = max(delay, float(retry_after))
+        except (TypeError, ValueError):
+            pass
+        if isinstance(error, self.rate_limit_error):
+            self._count("rate_limited")
+        self._count("retries")
+        return delay
+
+    def _count(self, counter, amount=1):
+        with self._lock:
+            self.counters[counter] += amount
+
+    @contextmanager
+    def slot(self, tokens):
+        time.sleep(self.throttle_delay(tokens))
+        self._semaphore.acquire()
+        self._count("in_flight")
+        try:
+            yield
+        finally:
+            self._count("in_flight", -1)
+            self._semaphore.release()
+
+    @asynccontextmanager
+    async def aslot(self, tokens):
+        await asyncio.sleep(self.throttle_delay(tokens))
+        if not self._semaphore.acquire(blocking=False):
+            acquired = self._slot_executor.submit(self._semaphore.acquire)
+            try:
+                await asyncio.wrap_future(acquired)
+            except asyncio.CancelledError:
+                # The waiting thread may still get the slot; give it back
+                acquired.add_done_callback(
+                    lambda future: future.cancelled() or self._semaphore.release()
+                )
+                raise
+        self._count("in_flight")
+        try:
+            yield
+        finally:
+            self._count("in_flight", -1)
+            self._semaphore.release()
+
+    def retry(self, request):
+        for attempt in range(self.max_retries + 1):
+            self._count("calls")
+            try:
+                return request()
+            except self.retryable_errors as e:
+                if attempt == self.max_retries:
+                    self._count("failures")
+                    raise
+                time.sleep(self.backoff(attempt, e))
+
+    async def aretry(self, request):
+        for attempt in range(self.max_retries + 1):
+            self._count("calls")
+            try:
+                return await request()
+            except self.retryable_errors as e:
+                if attempt == self.max_retries:
+                    self._count("failures")
+                    raise
+                await asyncio.sleep(self.backoff(attempt, e))
+
+    def metrics(self):
+        with self._lock:
+            return {
+                "base_url": str(self.client.base_url),
+                "max_concurrency": self.max_concurrency,
+                **self.counters,
+            }
+
+
+def get_llm_pool(base_url=None):
+    base_url = base_url or os.getenv("OPENAI_BASE_URL")
+    with _pools_lock:
+        if base_url not in _pools:
+            requests_per_minute = os.getenv("LLM_REQUESTS_PER_MINUTE")
+            tokens_per_minute = os.getenv("LLM_TOKENS_PER_MINUTE")
+            _pools[base_url] = LLMClientPool(
+                base_url=base_url,
+                api_key=os.getenv("OPENAI_API_KEY"),
+                max_concurrency=int(os.getenv("LLM_MAX_CONCURRENCY", 16)),
+                requests_per_minute=(
+                    float(requests_per_minute) if requests_per_minute else None
+                ),
+                tokens_per_minute=(
+                    float(tokens_per_minute) if tokens_per_minute else None
+                ),
+                max_retries=int(os.getenv("LLM_MAX_RETRIES", 4)),
+                timeout=float(os.getenv("LLM_TIMEOUT_SECONDS", 60)),
+            )
+        return _pools[base_url]
+
+
+def llm_metrics():
+    with _pools_lock:
+        pools = list(_pools.values())
+    return [pool.metrics() for pool in pools]
@@ -0,0 +1,200 @@
+import gc
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+
+def load_sentence_transformer(name):
+    from sentence_transformers import SentenceTransformer
+
+    return SentenceTransformer(name)
+
+
+def load_cross_encoder(name):
+    from sentence_transformers import CrossEncoder
+
+    return CrossEncoder(name)
+
+
+def load_tiktoken(name):
+    import tiktoken
+
+    try:
+        return tiktoken.encoding_for_model(name)
+    except KeyError:
+        return tiktoken.get_encoding(name)
+
+
+LOADERS = {
+    "sentence_transformer": load_sentence_transformer,
+    "cross_encoder": load_cross_encoder,
+    "tiktoken": load_tiktoken,
+}
+
+DEFAULT_PRELOAD = (
+    "sentence_transformer:all-MiniLM-L6-v2,"
+    "cross_encoder:cross-encoder/ms-marco-MiniLM-L-6-v2"
+)
+
+
+def parse_model_specs(value):
+    # "kind:name,kind:name" -> [(kind, name), ...]
+    specs = []
+    for item in (value or "").split(","):
+        item = item.strip()
+        if not item:
+            continue
+        kind, _, name = item.partition(":")
+        if not name:
+            raise ValueError(f"Invalid model spec: {item}")
+        specs.append((kind.strip(), name.strip()))
+    return specs
+
+
+def estimate_model_bytes(model):
+    # CrossEncoder wraps a transformers model; SentenceTransformer is a torch module
+    module = model if hasattr(model, "parameters") else getattr(model, "model", None)
+    if module is None or not hasattr(module, "parameters"):
+        return 0
+    total = sum(p.numel() * p.element_size() for p in module.parameters())
+    if hasattr(module, "buffers"):
+        total += sum(b.numel() * b.element_size() for b in module.buffers())
+    return total
+
+
+def process_rss_bytes():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        import resource
+
+        # ru_maxrss is the peak, in KiB on Linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def peak_rss_bytes():
+    import resource
+
+    # ru_maxrss is in KiB on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+class ModelRegistry:
+    def __init__(self, memory_budget_mb=None):
+        self.memory_budget_bytes = (
+            int(float(memory_budget_mb) * 1024 * 1024) if memory_budget_mb else None
+        )
+        self.loaders = dict(LOADERS)
+        self._models = OrderedDict()
+        self._lock = threading.Lock()
+        self._key_locks = {}
+        self._counters = {"loads": 0, "hits": 0, "evictions": 0}
+
+    def register_loader(self, kind, loader):
+        self.loaders[kind] = loader
+
+    def get(self, kind, name):
+        key = (kind, name)
+        with self._lock:
+            model = self._touch(key)
+            if model is not None:
+                return model
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+
+        # Per-key lock: concurrent requests for the same model wait for a single
+        # load, while different models can still load in parallel.
+        with key_lock:
+            with self._lock:
+                model = self._touch(key)
+                if model is not None:
+                    return model
+            if kind not in self.loaders:
+                raise ValueError(f"Unsupported model kind: {kind}")
+
+            initial_time = time.perf_counter()
+            model = self.loaders[kind](name)
+            load_time = time.perf_counter() - initial_time
+
+            with self._lock:
+                now = time.time()
+                self._models[key] = {
+                    "model": model,
+                    "bytes": estimate_model_bytes(model),
+                    "load_time": load_time,
+                    "loaded_at": now,
+                    "last_used": now,
+                    "hits": 0,
+                }
+                self._counters["loads"] += 1
+                self._evict(keep=key)
+            return model
+
+    def _touch(self, key):
+        entry = self._models.get(key)
+        if entry is None:
+            return None
+        self._models.move_to_end(key)
+        entry["last_used"] = time.time()
+        entry["hits"] += 1
+        self._counters["hits"] += 1
+        return entry["model"]
+
+    def _evict(self, keep):
+        if self.memory_budget_bytes is None:
+            return
+        while self.resident_bytes() > self.memory_budget_bytes:
+            victim = next((key for key in self._models if key != keep), None)
+            if victim is None:
+                break
+            del self._models[victim]
+            self._counters["evictions"] += 1
+
+    def preload(self, specs):
+        for kind, name in specs:
+            self.get(kind, name)
+
+    def preload_before_fork(self, specs):
+        # For pre-forking servers: the parent loads the models once and the
+        # workers share their pages copy-on-write. gc.freeze() keeps the workers'
+        # collections from writing to (and so copying) everything loaded so far.
+        # Tokenizers must not start their thread pool before the fork.
+        os.environ.setdefault("TOKENIZERS_PARALLELISM", "false")
+        self.preload(specs)
+        gc.freeze()
+
+    def resident_bytes(self):
+        return sum(entry["bytes"] for entry in self._models.values())
+
+    def clear(self):
+        with self._lock:
+            self._models.clear()
+
+    def metrics(self):
+        with self._lock:
+            models = [
+                {
+                    "kind": kind,
+                    "name": name,
+                    "load_time": entry["load_time"],
+                    "resident_bytes": entry["bytes"],
+                    "hits": entry["hits"],
+                    "idle_seconds": time.time() - entry["last_used"],
+                }
+                for (kind, name), entry in self._models.items()
+            ]
+            return {
+                **self._counters,
+                "models": models,
+                "resident_bytes": self.resident_bytes(),
+                "memory_budget_bytes": self.memory_budget_bytes,
+                "process_rss_bytes": process_rss_bytes(),
+            }
+
+
+model_registry = ModelRegistry(
+    memory_budget_mb=os.getenv("MODEL_REGISTRY_MEMORY_BUDGET_MB")
+)
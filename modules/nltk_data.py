@@ -0,0 +1,49 @@
+"""NLTK data is read from a local directory and never downloaded at runtime.
+Fetch it once, e.g. while building the image:
+
+    python -m modules.nltk_data
+"""
+
+import os
+from functools import lru_cache
+
+NLTK_PACKAGES = ("punkt_tab",)
+# Bundled next to the code unless NLTK_DATA_DIR points elsewhere
+NLTK_DATA_DIR = os.getenv(
+    "NLTK_DATA_DIR",
+    os.path.join(
+        os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "nltk_data"
+    ),
+)
+
+
+@lru_cache(maxsize=None)
+def load_nltk():
+    import nltk
+
+    if NLTK_DATA_DIR not in nltk.data.path:
+        nltk.data.path.insert(0, NLTK_DATA_DIR)
+    return nltk
+
+
+@lru_cache(maxsize=None)
+def punkt_tokenizer(language="english"):
+    nltk = load_nltk()
+    try:
+        return nltk.tokenize.PunktTokenizer(language)
+    except LookupError:
+        raise LookupError(
+            f"NLTK punkt_tab data not found in {NLTK_DATA_DIR}; "
+            "install it with `python -m modules.nltk_data`"
+        ) from None
+
+
+def download(directory=NLTK_DATA_DIR):
+    nltk = load_nltk()
+    for package in NLTK_PACKAGES:
+        nltk.download(package, download_dir=directory, raise_on_error=True)
+
+
+if __name__ == "__main__":
+    download()
+    print(f"NLTK data installed in {NLTK_DATA_DIR}")
@@ -1,10 +1,50 @@
+import asyncio
+import itertools
+import threading
+import time
+
+import numpy as np
+
 from modules.data_loader import DataLoader
-from modules.data_chunker import DataChunker
-from modules.embedding_generator import EmbeddingGenerator
-from modules.vector_store import VectorStore
+from modules.data_chunker import CHUNKERS, DataChunker, check_source_names
+from modules.embedding_generator import EmbeddingGenerator, embedding_tokenizer
+from modules.batching import BatchedEmbeddingGenerator
+from modules.embedding_cache import CachedEmbeddingGenerator, get_embedding_cache
+from modules.vector_store import (
+    VectorStore,
+    chunk_metadata,
+    corpus_collection_name,
+    source_collection_name,
+)
+from modules.lexical_index import get_lexical_index, reciprocal_rank_fusion
 from modules.reranker import Reranker
 from modules.prompt_constructor import PromptConstructor
 from modules.llm import LLM
+from modules.response_cache import response_cache, response_scope
+from modules.chunk_artifacts import (
+    chunk_artifact_path,
+    has_chunk_records,
+    read_chunk_records,
+    remove_chunk_records,
+    write_chunk_records,
+)
+from modules.concurrency import get_cpu_executor, prefetch, run_stage_graph
+from modules.instrumentation import RunTrace
+
+QUESTION = "What is the attention mechanism?"
+PROMPT_TEMPLATE = "Given the following contexts, answer the question:\n\nContexts:\n -- \n\n{contexts}\n\nQuestion: {question}\n\nAnswer:"
+SYSTEM_PROMPT = "You are a helpful assistant that provides concise and accurate answers based on the provided contexts."
+
+# Reranked chunks that must pass rerank_stop_threshold before scoring stops early
+N_CONTEXTS = 3
+# Chunks embedded and written to the index per step while streaming a corpus
+INDEX_BATCH_SIZE = 1024
+
+
+def iter_batches(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(itertools.islice(iterator, size)):
+        yield batch
 
 
 class PipelineManager:
@@ -15,48 +55,492 @@ class PipelineManager:
         self.data_chunker = None
         self.embedding_generator = None
         self.vector_storage = None
+        self.lexical_index = None
+        self.query_embedding = None
+        self.context_ids = []
+        self.context_packing = None
         self.reranker = None
         self.prompt_constructor = None
         self.llm_inference = None
+        # Stage timings of this run, returned with the answer as "timings"
+        self.trace = RunTrace(run_id, profiler=config.profile)
+        self._embedding_lock = threading.Lock()
+        self._reranker_lock = threading.Lock()
+        self._query = None
 
-    def run(self):
-        data_loader = DataLoader(file_paths=["assets/attention_is_all_you_need.pdf"])
-        data = data_loader.load_data()
-        data = data_loader.flatten_content(data)
+    @property
+    def question(self):
+        return self.config.question or QUESTION
+
+    def make_chunker(self):
+        if self.config.method not in CHUNKERS:
+            raise ValueError(f"Unknown chunking method: {self.config.method}")
+        return DataChunker(
+            "",
+            method=self.config.method,
+            chunk_size=self.config.chunk_size,
+            words_per_chunk=self.config.words_per_chunk,
+            sentences_per_chunk=self.config.sentences_per_chunk,
+            delimiter=self.config.delimiter,
+            tokens_per_chunk=self.config.tokens_per_chunk,
+            token_overlap=self.config.token_overlap,
+            tokenizer=self.config.tokenizer
+            or embedding_tokenizer(self.config.embedding_model),
+            semantic_window=self.config.semantic_window,
+            semantic_percentile=self.config.semantic_percentile,
+            # Loads the model on first use, so parsing is not held up by it
+            embedding_fn=lambda texts: self.load_embedding_model().generate_batch(
+                texts
+            ),
+        )
+
+    def corpus_params(self):
+        # Chunking and embedding settings that collection names are keyed by
+        return (
+            self.config.method,
+            *self.make_chunker().options(),
+            self.config.embedding_model,
+        )
+
+    def load_embedding_model(self):
+        # Called by the models stage and by whichever stage needs embeddings
+        # first, possibly at the same time; the model is loaded once.
+        with self._embedding_lock:
+            if self.embedding_generator is None:
+                embedding_generator = EmbeddingGenerator(
+                    model=self.config.embedding_model
+                )
+                if self.config.micro_batching:
+                    embedding_generator = BatchedEmbeddingGenerator(embedding_generator)
+                self.embedding_generator = CachedEmbeddingGenerator(
+                    embedding_generator,
+                    get_embedding_cache(self.config.embedding_cache_path),
+                )
+            return self.embedding_generator
+
+    def load_reranker(self):
+        with self._reranker_lock:
+            if self.reranker is None:
+                self.reranker = Reranker(
+                    model=self.config.reranker_model,
+                    batch_size=self.config.rerank_batch_size,
+                    max_length=self.config.rerank_max_length,
+                    micro_batching=self.config.micro_batching,
+                )
+            return self.reranker
+
+    def load_models(self):
+        self.load_embedding_model()
+        self.load_reranker()
 
-        data_chunker = DataChunker(data, method="sentence", sentences_per_chunk=3)
-        chunks = data_chunker.chunk_text()
-        print(f"Number of chunks: {len(chunks)}")
+    def iter_chunk_records(self, file_paths):
+        # Pages are streamed from the loader into the chunker, so only a bounded
+        # window of each file is held in memory at a time.
+        self.data_loader = DataLoader(
+            file_paths=file_paths, max_workers=self.config.ingest_workers
+        )
+        data_chunker = self.make_chunker()
+        records = self.trace.iterate(
+            "load",
+            self.data_loader.iter_records(),
+            size=lambda record: len(record["text"]),
+        )
+        return self.trace.iterate(
+            "chunk",
+            data_chunker.iter_chunk_records(records),
+            size=lambda record: len(record["text"]),
+        )
+
+    def chunk_artifact_path(self):
+        # Full-mode ingests with a persist_directory save their chunk records
+        # first, keyed by file contents and settings
+        if (
+            self.config.ingest_mode == "incremental"
+            or not self.config.persist_directory
+        ):
+            return None
+        return chunk_artifact_path(
+            self.config.persist_directory,
+            corpus_collection_name(self.config.file_paths, *self.corpus_params()),
+        )
+
+    def iter_corpus_records(self, artifact_path=None):
+        # With an artifact path, loading and chunking finish (and are saved)
+        # before anything is embedded, so a run that stops while embedding or
+        # indexing resumes from the saved records instead of parsing again;
+        # embeddings already computed come from the embedding cache.
+        if artifact_path is None:
+            return self.iter_chunk_records(self.config.file_paths)
+        if has_chunk_records(artifact_path):
+            print(f"Resuming from chunk records '{artifact_path}'")
+        else:
+            write_chunk_records(
+                self.iter_chunk_records(self.config.file_paths), artifact_path
+            )
+        return self.trace.iterate(
+            "load",
+            read_chunk_records(artifact_path),
+            size=lambda record: len(record["text"]),
+        )
 
-        embedding_generator = EmbeddingGenerator(
-            model="sentence-transformers/all-MiniLM-L6-v2"
+    def embed_records(self, records):
+        # Semantic chunks already carry an embedding from chunking
+        missing = [record["text"] for record in records if "embedding" not in record]
+        embedding_generator = self.load_embedding_model()
+        with self.trace.span("embed", items=len(missing), bytes=sum(map(len, missing))):
+            embeddings = iter(
+                embedding_generator.generate_batch(missing) if missing else ()
+            )
+        return np.stack(
+            [
+                record["embedding"] if "embedding" in record else next(embeddings)
+                for record in records
+            ]
         )
-        embeddings = [embedding_generator.generate(chunk) for chunk in chunks]
 
-        vector_store = VectorStore(collection_name="test_collection")
-        vector_store.add_documents(chunks, embeddings)
+    def open_index(self):
+        # Opens the collection only; models are loaded when first needed
+        make_collection_name = (
+            source_collection_name
+            if self.config.ingest_mode == "incremental"
+            else corpus_collection_name
+        )
+        collection_name = self.config.collection_name or make_collection_name(
+            self.config.file_paths, *self.corpus_params()
+        )
+        self.vector_storage = VectorStore(
+            collection_name=collection_name,
+            persist_directory=self.config.persist_directory,
+            backend=self.config.vector_backend,
+            n_lists=self.config.ann_lists,
+            nprobe=self.config.ann_nprobe,
+            quantization=self.config.ann_quantization,
+        )
+        if self.config.retrieval == "hybrid":
+            self.lexical_index = get_lexical_index(
+                collection_name, self.config.persist_directory
+            )
+        elif self.config.retrieval != "dense":
+            raise ValueError(f"Unsupported retrieval mode: {self.config.retrieval}")
+        return self.vector_storage
+
+    def index(self, on_progress=None):
+        check_source_names(self.config.file_paths or [])
+        vector_store = self.open_index()
+        lexical_index = self.lexical_index
+        incremental = self.config.ingest_mode == "incremental"
+        # A collection indexed before hybrid retrieval has no lexical index yet;
+        # it is rebuilt, which only re-reads embeddings from the cache.
+        if (
+            not incremental
+            and vector_store.is_indexed()
+            and (lexical_index is None or lexical_index.indexed)
+        ):
+            print(
+                f"Reusing index '{vector_store.name}' "
+                f"({vector_store.count()} chunks)"
+            )
+            return vector_store
+
+        artifact_path = self.chunk_artifact_path()
+        records = self.iter_corpus_records(artifact_path)
+        if incremental:
+            records = list(records)
+            with self.trace.span("index", items=len(records)):
+                stats = vector_store.sync_documents(records, self.embed_records)
+                if lexical_index is not None:
+                    lexical_index.sync(records)
+                    lexical_index.mark_indexed()
+            if on_progress:
+                on_progress(stats["added"])
+        else:
+            # Records are produced on a producer thread, a few batches ahead of
+            # embedding and indexing
+            n_chunks = 0
+            for batch in prefetch(
+                iter_batches(records, INDEX_BATCH_SIZE),
+                depth=self.config.prefetch_batches,
+            ):
+                embeddings = self.embed_records(batch)
+                with self.trace.span("index", items=len(batch)):
+                    vector_store.upsert_documents(
+                        [record["id"] for record in batch],
+                        [record["text"] for record in batch],
+                        embeddings,
+                        [chunk_metadata(record) for record in batch],
+                    )
+                    if lexical_index is not None:
+                        lexical_index.add(
+                            [record["id"] for record in batch],
+                            [record["text"] for record in batch],
+                            [record["source"] for record in batch],
+                        )
+                n_chunks += len(batch)
+                if on_progress:
+                    on_progress(n_chunks)
+            vector_store.mark_indexed()
+            if lexical_index is not None:
+                lexical_index.mark_indexed()
+            if artifact_path is not None:
+                remove_chunk_records(artifact_path)
+            print(f"Number of chunks: {n_chunks}")
+        return vector_store
+
+    def retrieve(self, question):
+        # Dense candidates, fused with BM25 candidates by reciprocal rank in hybrid
+        # mode; the rerank pool stays at rerank_candidates either way. Returns
+        # ids, documents and metadatas (source and offset, used for packing).
+        query_embedding = self.embed_query(question)
+        with self.trace.span("retrieve") as span:
+            ids, documents, metadatas = self.search(question, query_embedding)
+            span["items"] = len(ids)
+        return ids, documents, metadatas
+
+    def embed_query(self, question):
+        # Reuses the embedding computed by the query stage of arun()
+        if self._query != question:
+            embedding_generator = self.load_embedding_model()
+            with self.trace.span("embed", items=1, bytes=len(question)):
+                self.query_embedding = embedding_generator.generate(question)
+            self._query = question
+        return self.query_embedding
 
-        user_query = "What is the attention mechanism?"
-        query_embedding = embedding_generator.generate(user_query)
-        relevant_chunks = vector_store.query(query_embedding)
+    def search(self, question, query_embedding):
+        return self.search_many([question], [query_embedding])[0]
 
-        reranker = Reranker(model="cross-encoder/ms-marco-MiniLM-L-6-v2")
-        reranked = reranker.rerank(user_query, relevant_chunks["documents"][0])
-        contexts = [doc for doc, score in reranked[:3]]
-        context_str = "\n\n -- \n\n".join(contexts)
-        prompt_template = "Given the following contexts, answer the question:\n\nContexts:\n -- \n\n{contexts}\n\nQuestion: {question}\n\nAnswer:"
+    def search_many(self, questions, query_embeddings):
+        # One dense top-k query for all the questions; returns (ids, documents,
+        # metadatas) per question
+        query_embeddings = np.atleast_2d(np.asarray(query_embeddings))
+        if self.lexical_index is None:
+            dense = self.vector_storage.query(
+                query_embeddings, n_results=self.config.rerank_candidates
+            )
+            return list(zip(dense["ids"], dense["documents"], dense["metadatas"]))
 
-        prompt_constructor = PromptConstructor(template=prompt_template)
-        final_prompt = prompt_constructor.construct(
+        dense = self.vector_storage.query(
+            query_embeddings, n_results=self.config.dense_candidates
+        )
+        results = []
+        for question, dense_ids, documents, metadatas in zip(
+            questions, dense["ids"], dense["documents"], dense["metadatas"]
+        ):
+            lexical = self.lexical_index.search(
+                question,
+                self.config.lexical_candidates,
+                prune=self.config.lexical_pruning,
+            )
+            fused_ids = reciprocal_rank_fusion(
+                [dense_ids, [id_ for id_, score in lexical]]
+            )[: self.config.rerank_candidates]
+            chunks = dict(zip(dense_ids, zip(documents, metadatas)))
+            missing_ids = [id_ for id_ in fused_ids if id_ not in chunks]
+            if missing_ids:
+                chunks.update(self.vector_storage.get_chunks(missing_ids))
+            fused_ids = [id_ for id_ in fused_ids if id_ in chunks]
+            results.append(
+                (
+                    fused_ids,
+                    [chunks[id_][0] for id_ in fused_ids],
+                    [chunks[id_][1] for id_ in fused_ids],
+                )
+            )
+        return results
+
+    def build_prompt(self, user_query):
+        chunk_ids, relevant_chunks, metadatas = self.retrieve(user_query)
+
+        reranker = self.load_reranker()
+        with self.trace.span(
+            "rerank",
+            items=len(relevant_chunks),
+            bytes=sum(map(len, relevant_chunks)),
+        ):
+            reranked = reranker.rerank(
+                user_query,
+                relevant_chunks,
+                ids=chunk_ids,
+                top_n=self.config.rerank_top_n,
+                stop_threshold=self.config.rerank_stop_threshold,
+                stop_after=N_CONTEXTS,
+            )
+        with self.trace.span("prompt") as span:
+            prompt = self.pack_prompt(
+                user_query, chunk_ids, relevant_chunks, metadatas, reranked
+            )
+            span["items"] = len(self.context_ids)
+            span["bytes"] = len(prompt)
+        return prompt
+
+    def pack_prompt(self, user_query, chunk_ids, relevant_chunks, metadatas, reranked):
+        prompt, self.context_packing = self.pack(
+            user_query, chunk_ids, relevant_chunks, metadatas, reranked
+        )
+        self.context_ids = self.context_packing["context_ids"]
+        return prompt
+
+    def pack(self, user_query, chunk_ids, relevant_chunks, metadatas, reranked):
+        # Returns the prompt and its context packing stats
+        candidates = {}
+        for id_, doc, metadata in zip(chunk_ids, relevant_chunks, metadatas):
+            candidates.setdefault(
+                doc,
+                {
+                    "id": id_,
+                    "text": doc,
+                    "source": (metadata or {}).get("source"),
+                    "offset": (metadata or {}).get("offset"),
+                },
+            )
+
+        if self.prompt_constructor is None:
+            self.prompt_constructor = PromptConstructor(
+                template=PROMPT_TEMPLATE, model=self.config.model_name
+            )
+        context_str, packing = self.prompt_constructor.pack_contexts(
+            [{**candidates[doc], "score": score} for doc, score in reranked],
+            max_tokens=self.config.context_token_budget,
+            truncate=self.config.context_truncate,
+        )
+        prompt = self.prompt_constructor.construct(
             contexts=context_str, question=user_query
         )
+        return prompt, packing
+
+    def stage_graph(self, question):
+        # {stage: (stages it waits for, blocking fn)}: the corpus is indexed
+        # while the models load and the question is embedded; answering starts
+        # once all of them are done.
+        return {
+            "index": ((), self.trace.profiled(self.index)),
+            "models": ((), self.load_models),
+            "query_embedding": (("models",), lambda: self.embed_query(question)),
+        }
+
+    def run(self):
+        # Only the stage graph goes through an event loop; the LLM is called
+        # with the blocking client (the async one is tied to the server's loop)
+        asyncio.run(run_stage_graph(self.stage_graph(self.question)))
+        final_prompt = self.trace.profiled(self.build_prompt)(self.question)
+
+        answer = self.cached_response(self.question)
+        if answer is None:
+            self.llm_inference = self.make_llm()
+            with self.trace.span("generate") as span:
+                answer = self.llm_inference.generate(
+                    final_prompt, system_prompt=SYSTEM_PROMPT
+                )
+                span["items"] = answer["completion_tokens"]
+                span["bytes"] = len(answer["model_response"])
+            self.cache_response(self.question, answer)
+        answer["context_packing"] = self.context_packing
+        answer["ingest_errors"] = self.data_loader.errors
+        answer["timings"] = self.trace.finish()
+
+        return answer
 
-        llm = LLM(model_name="gpt-4.1-mini")
-        system_prompt = "You are a helpful assistant that provides concise and accurate answers based on the provided contexts."
-        answer = llm.generate(final_prompt, system_prompt=system_prompt)
+    async def arun(self):
+        # The CPU-bound stages (parsing, chunking, encoding, cross-encoder
+        # scoring) run on the shared bounded executor and the LLM call is
+        # awaited, so the event loop keeps serving requests.
+        await run_stage_graph(self.stage_graph(self.question))
+        answer = await self.aquery(self.question)
+        answer["ingest_errors"] = self.data_loader.errors
 
         return answer
 
+    async def aquery(self, question):
+        # Query an existing index only: embed the question, retrieve, rerank and
+        # call the LLM. Call open_index() (or index()) first.
+        loop = asyncio.get_running_loop()
+        final_prompt = await loop.run_in_executor(
+            get_cpu_executor(), self.trace.profiled(self.build_prompt), question
+        )
+
+        answer = self.cached_response(question)
+        if answer is None:
+            self.llm_inference = self.make_llm()
+            with self.trace.span("generate") as span:
+                answer = await self.llm_inference.agenerate(
+                    final_prompt, system_prompt=SYSTEM_PROMPT
+                )
+                span["items"] = answer["completion_tokens"]
+                span["bytes"] = len(answer["model_response"])
+            self.cache_response(question, answer)
+        answer["context_packing"] = self.context_packing
+        answer["timings"] = self.trace.finish()
+        return answer
+
+    async def astream(self, question):
+        # Streaming variant of aquery(): yields ("retrieval", metadata) once the
+        # contexts are chosen, ("token", text) as the answer arrives, then
+        # ("usage", token counts and timings).
+        loop = asyncio.get_running_loop()
+        initial_time = time.time()
+        final_prompt = await loop.run_in_executor(
+            get_cpu_executor(), self.trace.profiled(self.build_prompt), question
+        )
+        yield "retrieval", {
+            "collection_name": self.vector_storage.name,
+            "context_ids": self.context_ids,
+            "context_packing": self.context_packing,
+            "retrieval_time": time.time() - initial_time,
+        }
+
+        answer = self.cached_response(question)
+        if answer is None:
+            self.llm_inference = self.make_llm()
+            async for event, data in self.llm_inference.astream(
+                final_prompt, system_prompt=SYSTEM_PROMPT
+            ):
+                if event == "token":
+                    yield event, data
+                else:
+                    answer = data
+            # Timed by the LLM rather than a span, which would stay open across
+            # the yields above
+            self.trace.add(
+                "generate",
+                answer["total_time"],
+                items=answer["completion_tokens"],
+                bytes=len(answer["model_response"]),
+            )
+            self.cache_response(question, answer)
+        else:
+            yield "token", answer["model_response"]
+        yield "usage", {
+            **{key: value for key, value in answer.items() if key != "model_response"},
+            "timings": self.trace.finish(),
+        }
+
+    def make_llm(self):
+        return LLM(model_name=self.config.model_name, provider=self.config.llm_provider)
+
+    def response_scope(self, context_ids=None):
+        return response_scope(
+            self.config.model_name,
+            SYSTEM_PROMPT,
+            self.vector_storage.name,
+            self.context_ids if context_ids is None else context_ids,
+        )
+
+    def cached_response(self, question):
+        # Call after build_prompt(): the lookup is scoped to its context ids
+        if not self.config.response_cache:
+            return None
+        return response_cache.lookup(
+            self.response_scope(),
+            question,
+            self.query_embedding,
+            threshold=self.config.response_cache_threshold,
+        )
+
+    def cache_response(self, question, answer):
+        if self.config.response_cache:
+            response_cache.store(
+                self.response_scope(), question, self.query_embedding, answer
+            )
+
 
 if __name__ == "__main__":
     from config import Config
@@ -1,47 +1,152 @@
+import re
+from functools import lru_cache
+
+from modules.embedding_generator import CHARS_PER_TOKEN
+
+CONTEXT_SEPARATOR = "\n\n -- \n\n"
+SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+# Below this many free tokens a truncated chunk is not worth adding
+MIN_TRUNCATED_TOKENS = 32
+
+
+class ApproximateTokenizer:
+    # Used when tiktoken or its encoding files are unavailable (e.g. offline)
+    def encode(self, text):
+        return range(len(text) // CHARS_PER_TOKEN + 1 if text else 0)
+
+
+@lru_cache(maxsize=None)
+def get_tokenizer(model):
+    try:
+        import tiktoken
+
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            return tiktoken.get_encoding("o200k_base")
+    except Exception as e:
+        print(f"Falling back to approximate token counts for {model}: {e}")
+        return ApproximateTokenizer()
+
+
 class PromptConstructor:
-    def __init__(self, template):
+    def __init__(self, template, model="gpt-4.1-mini"):
         self.template = template
+        self.model = model
+        self.tokenizer = get_tokenizer(model)
 
     # Constructs a prompt using the provided parameters (could vary based on prompt template)
     def construct(self, **kwargs):
         return self.template.format(**kwargs)
 
+    def count_tokens(self, text):
+        return len(self.tokenizer.encode(text))
 
-if __name__ == "__main__":
-    from data_loader import DataLoader
-    from data_chunker import DataChunker
-    from embedding_generator import EmbeddingGenerator
-    from vector_store import VectorStore
-    from reranker import Reranker
+    def truncate(self, text, max_tokens):
+        # Keep whole sentences while they fit
+        kept, used = [], 0
+        for sentence in SENTENCE_END.split(text):
+            tokens = self.count_tokens(sentence + " ")
+            if used + tokens > max_tokens:
+                break
+            kept.append(sentence)
+            used += tokens
+        return " ".join(kept)
 
-    data_loader = DataLoader(file_paths=["assets/attention_is_all_you_need.pdf"])
-    data = data_loader.load_data()
-    data = data_loader.flatten_content(data)
+    def pack_contexts(self, candidates, max_tokens, truncate=True):
+        # Greedy by score: candidates are {"id", "text", "score", "source",
+        # "offset"} dicts. Chunks repeating or contained in an already chosen
+        # chunk of the same source are skipped, and chosen chunks that touch or
+        # overlap in their source are merged into one context.
+        candidates = sorted(candidates, key=lambda c: c["score"], reverse=True)
+        separator_tokens = self.count_tokens(CONTEXT_SEPARATOR)
+        candidate_tokens = sum(self.count_tokens(c["text"]) for c in candidates)
+        candidate_tokens += separator_tokens * max(len(candidates) - 1, 0)
 
-    data_chunker = DataChunker(data, method="sentence", sentences_per_chunk=3)
-    chunks = data_chunker.chunk_text()
-    print(f"Number of chunks: {len(chunks)}")
+        selected, texts, used = [], set(), 0
+        stats = {"duplicates": 0, "truncated": 0, "dropped": 0, "merged": 0}
+        for candidate in candidates:
+            if candidate["text"] in texts or any(
+                contains(chosen, candidate) for chosen in selected
+            ):
+                stats["duplicates"] += 1
+                continue
+            cost = self.count_tokens(candidate["text"])
+            cost += separator_tokens if selected else 0
+            if used + cost > max_tokens:
+                free = max_tokens - used - (separator_tokens if selected else 0)
+                if truncate and free >= MIN_TRUNCATED_TOKENS:
+                    text = self.truncate(candidate["text"], free)
+                    if text:
+                        candidate = {**candidate, "text": text}
+                        cost = self.count_tokens(text)
+                        cost += separator_tokens if selected else 0
+                        stats["truncated"] += 1
+                if used + cost > max_tokens:
+                    stats["dropped"] += 1
+                    continue
+            selected.append(candidate)
+            texts.add(candidate["text"])
+            used += cost
 
-    embedding_generator = EmbeddingGenerator(
-        model="sentence-transformers/all-MiniLM-L6-v2"
-    )
-    embeddings = [embedding_generator.generate(chunk) for chunk in chunks]
+        contexts = merge_adjacent(selected)
+        stats["merged"] = len(selected) - len(contexts)
+        context_str = CONTEXT_SEPARATOR.join(context["text"] for context in contexts)
+        context_tokens = self.count_tokens(context_str)
+        return context_str, {
+            "context_tokens": context_tokens,
+            "candidate_tokens": candidate_tokens,
+            "tokens_saved": candidate_tokens - context_tokens,
+            "token_budget": max_tokens,
+            "chunks": len(selected),
+            "contexts": len(contexts),
+            "context_ids": [c["id"] for c in selected],
+            **stats,
+        }
 
-    vector_store = VectorStore(collection_name="test_collection")
-    vector_store.add_documents(chunks, embeddings)
 
-    user_query = "What is the attention mechanism?"
-    query_embedding = embedding_generator.generate(user_query)
-    relevant_chunks = vector_store.query(query_embedding)
+def span(chunk):
+    if (
+        chunk.get("source") is None
+        or chunk.get("offset") is None
+        or chunk["offset"] < 0
+    ):
+        return None
+    return chunk["source"], chunk["offset"], chunk["offset"] + len(chunk["text"])
+
+
+def contains(outer, inner):
+    outer, inner = span(outer), span(inner)
+    return (
+        outer is not None
+        and inner is not None
+        and outer[0] == inner[0]
+        and outer[1] <= inner[1]
+        and inner[2] <= outer[2]
+    )
 
-    reranker = Reranker(model="cross-encoder/ms-marco-MiniLM-L-6-v2")
-    reranked = reranker.rerank(user_query, relevant_chunks["documents"][0])
 
-    prompt_template = "Given the following contexts, answer the question:\n\nContexts:\n -- \n\n{contexts}\n\nQuestion: {question}\n\nAnswer:"
-    contexts = [doc for doc, score in reranked[:3]]
-    context_str = "\n\n -- \n\n".join(contexts)
-    prompt_constructor = PromptConstructor(template=prompt_template)
-    final_prompt = prompt_constructor.construct(
-        contexts=context_str, question=user_query
+def merge_adjacent(chunks):
+    # Chunks of one source whose spans overlap or touch (up to a whitespace gap)
+    # become one context, in source order; contexts keep their best rank.
+    groups = []
+    located = sorted(
+        (span(chunk), rank, chunk["text"])
+        for rank, chunk in enumerate(chunks)
+        if span(chunk)
     )
-    print(final_prompt)
+    for (source, start, end), rank, text in located:
+        group = groups[-1] if groups else None
+        if group and group["source"] == source and start <= group["end"] + 1:
+            overlap = group["end"] - start
+            group["text"] += text[overlap:] if overlap >= 0 else " " + text
+            group["end"] = max(group["end"], end)
+            group["rank"] = min(group["rank"], rank)
+        else:
+            groups.append({"source": source, "end": end, "text": text, "rank": rank})
+    groups += [
+        {"text": chunk["text"], "rank": rank}
+        for rank, chunk in enumerate(chunks)
+        if not span(chunk)
+    ]
+    return sorted(groups, key=lambda group: group["rank"])
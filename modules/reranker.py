@@ -1,19 +1,209 @@
-from sentence_transformers import CrossEncoder
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from functools import partial
+
+from modules.batching import get_batcher
+from modules.embedding_cache import cache_key
+from modules.model_registry import model_registry
+
+RERANK_BATCH_SIZE = 32
+RERANK_MAX_LENGTH = 512
+# model -> (model registry kind, name)
+RERANK_MODELS = {
+    "cross-encoder/ms-marco-MiniLM-L-6-v2": (
+        "cross_encoder",
+        "cross-encoder/ms-marco-MiniLM-L-6-v2",
+    ),
+}
+
+
+class ScoreCache:
+    # LRU of cross-encoder scores keyed by (query hash, chunk id), so repeated
+    # or paginated queries over the same candidates are not rescored.
+    def __init__(self, max_entries=100000):
+        self.max_entries = max_entries
+        self._scores = OrderedDict()
+        self._lock = threading.Lock()
+        self.counters = {"hits": 0, "misses": 0, "evictions": 0}
+
+    def get_many(self, keys):
+        found = {}
+        with self._lock:
+            for key in keys:
+                score = self._scores.get(key)
+                if score is not None:
+                    self._scores.move_to_end(key)
+                    found[key] = score
+            self.counters["hits"] += len(found)
+            self.counters["misses"] += len(keys) - len(found)
+        return found
+
+    def put_many(self, items):
+        with self._lock:
+            for key, score in items:
+                self._scores[key] = score
+                self._scores.move_to_end(key)
+            while len(self._scores) > self.max_entries:
+                self._scores.popitem(last=False)
+                self.counters["evictions"] += 1
+
+    def metrics(self):
+        with self._lock:
+            lookups = self.counters["hits"] + self.counters["misses"]
+            return {
+                **self.counters,
+                "hit_rate": self.counters["hits"] / lookups if lookups else 0.0,
+                "entries": len(self._scores),
+            }
+
+
+score_cache = ScoreCache(int(os.getenv("RERANK_CACHE_ENTRIES", 100000)))
+
+# A cross-encoder is shared by every Reranker of the process, and each call sets
+# its max_length; calls to one model take turns.
+_model_locks = {}
+_model_locks_lock = threading.Lock()
+
+
+def model_lock(model):
+    with _model_locks_lock:
+        return _model_locks.setdefault(model, threading.Lock())
+
+
+def predict_batch(model, batch_size, max_length, pairs):
+    return Reranker(model, batch_size=batch_size, max_length=max_length).predict(pairs)
 
 
 class Reranker:
-    def __init__(self, model):
+    def __init__(
+        self,
+        model,
+        batch_size=RERANK_BATCH_SIZE,
+        max_length=RERANK_MAX_LENGTH,
+        cache=score_cache,
+        micro_batching=False,
+    ):
         self.model = model
-        if self.model == "cross-encoder/ms-marco-MiniLM-L-6-v2":
-            self.client = CrossEncoder(self.model)
-        else:
+        if self.model not in RERANK_MODELS:
             raise ValueError(f"Unsupported model: {self.model}")
+        self.client = model_registry.get(*RERANK_MODELS[self.model])
+        self.batch_size = batch_size
+        self.max_length = max_length
+        self.cache = cache
+        # Pairs from concurrent requests share forward passes; the batcher is
+        # per model and settings, and looks the model up for every batch.
+        self.batcher = (
+            get_batcher(
+                f"rerank:{model}:{batch_size}:{max_length}",
+                partial(predict_batch, model, batch_size, max_length),
+            )
+            if micro_batching
+            else None
+        )
+
+    def score(self, pairs):
+        if not pairs:
+            return []
+        if self.batcher is not None:
+            return self.batcher.map(pairs)
+        return self.predict(pairs)
+
+    def predict(self, pairs):
+        # (query, chunk) pairs are cut to max_length tokens by the tokenizer;
+        # None keeps the model's own limit
+        with model_lock(self.model):
+            default_max_length = self.client.max_length
+            if self.max_length:
+                self.client.max_length = self.max_length
+            try:
+                scores = self.client.predict(
+                    pairs, batch_size=self.batch_size, show_progress_bar=False
+                )
+            finally:
+                self.client.max_length = default_max_length
+        return [float(score) for score in scores]
+
+    def rerank(
+        self,
+        query_text,
+        top_documents,
+        ids=None,
+        top_n=None,
+        stop_threshold=None,
+        stop_after=None,
+    ):
+        return self.rerank_many(
+            [query_text],
+            [top_documents],
+            [ids] if ids is not None else None,
+            top_n=top_n,
+            stop_threshold=stop_threshold,
+            stop_after=stop_after,
+        )[0]
+
+    def rerank_many(
+        self,
+        queries,
+        documents,
+        ids=None,
+        top_n=None,
+        stop_threshold=None,
+        stop_after=None,
+    ):
+        # Reranks several (query, candidates) lists with shared forward passes.
+        # Early exit: only the first `top_n` candidates (in retrieval order) are
+        # scored, and with `stop_threshold` candidates are scored one batch at a
+        # time until `stop_after` of them reach the threshold. Unscored
+        # candidates are left out of the result.
+        # Scores depend on how much of each chunk the model saw
+        query_keys = [
+            cache_key(f"{self.model}:{self.max_length}", query) for query in queries
+        ]
+        if ids is None:
+            ids = [
+                [hashlib.sha256(doc.encode()).hexdigest() for doc in docs]
+                for docs in documents
+            ]
+        pending = [list(range(len(docs)))[:top_n] for docs in documents]
+        scores = [{} for _ in queries]
+
+        while any(pending):
+            batch = []
+            for q, rows in enumerate(pending):
+                take = self.batch_size if stop_threshold is not None else len(rows)
+                batch.extend((q, row) for row in rows[:take])
+                pending[q] = rows[take:]
+
+            keys = [(query_keys[q], ids[q][row]) for q, row in batch]
+            found = self.cache.get_many(keys)
+            missing = [
+                (item, key) for item, key in zip(batch, keys) if key not in found
+            ]
+            computed = self.score(
+                [(queries[q], documents[q][row]) for (q, row), _ in missing]
+            )
+            computed = [(key, score) for (_, key), score in zip(missing, computed)]
+            self.cache.put_many(computed)
+            found.update(computed)
+            for (q, row), key in zip(batch, keys):
+                scores[q][row] = found[key]
+
+            if stop_threshold is not None:
+                for q in range(len(queries)):
+                    confident = sum(s >= stop_threshold for s in scores[q].values())
+                    if confident >= (stop_after or 1):
+                        pending[q] = []
 
-    def rerank(self, query_text, top_documents):
-        pairs = [(query_text, doc) for doc in top_documents]
-        scores = self.client.predict(pairs)
-        reranked = sorted(zip(top_documents, scores), key=lambda x: x[1], reverse=True)
-        return reranked
+        return [
+            sorted(
+                ((documents[q][row], score) for row, score in scores[q].items()),
+                key=lambda x: x[1],
+                reverse=True,
+            )
+            for q in range(len(queries))
+        ]
 
 
 if __name__ == "__main__":
@@ -33,7 +223,7 @@ if __name__ == "__main__":
     embedding_generator = EmbeddingGenerator(
         model="sentence-transformers/all-MiniLM-L6-v2"
     )
-    embeddings = [embedding_generator.generate(chunk) for chunk in chunks]
+    embeddings = embedding_generator.generate_batch(chunks)
 
     vector_store = VectorStore(collection_name="test_collection")
     vector_store.add_documents(chunks, embeddings)
@@ -0,0 +1,139 @@
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from modules.embedding_cache import normalize_text
+
+USAGE_FIELDS = ("prompt_tokens", "completion_tokens", "total_tokens")
+
+
+def response_scope(model, system_prompt, corpus_version, context_ids):
+    # Answers are only reused for the same model and instructions over the same
+    # retrieved chunks; chunk ids are content hashes, so edited chunks miss.
+    digest = hashlib.sha256()
+    for part in (model, system_prompt or "", corpus_version, *context_ids):
+        digest.update(str(part).encode() + b"\0")
+    return digest.hexdigest()
+
+
+class ResponseCache:
+    # Exact tier: (scope, normalized question). Semantic tier (when a threshold
+    # is given): any live entry of the same scope whose question embedding has
+    # cosine similarity >= threshold. Entries expire after `ttl_seconds` and
+    # the least recently used ones are evicted beyond `max_entries`.
+    def __init__(self, max_entries=10000, ttl_seconds=3600):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()
+        self._scopes = {}
+        self._lock = threading.Lock()
+        self.counters = {
+            "exact_hits": 0,
+            "semantic_hits": 0,
+            "misses": 0,
+            "evictions": 0,
+            "expirations": 0,
+            **{f"saved_{field}": 0 for field in USAGE_FIELDS},
+        }
+
+    def key(self, scope, question):
+        return hashlib.sha256(
+            f"{scope}\0{normalize_text(question).lower()}".encode()
+        ).hexdigest()
+
+    def lookup(self, scope, question, query_embedding=None, threshold=None):
+        now = time.time()
+        with self._lock:
+            key = self.key(scope, question)
+            entry = self._live_entry(key, now)
+            tier = "exact"
+            if entry is None and threshold is not None and query_embedding is not None:
+                key, entry = self._nearest(scope, query_embedding, threshold, now)
+                tier = "semantic"
+            if entry is None:
+                self.counters["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self.counters[f"{tier}_hits"] += 1
+            for field in USAGE_FIELDS:
+                self.counters[f"saved_{field}"] += entry["response"].get(field) or 0
+            return {
+                **entry["response"],
+                "cache": {"tier": tier, "age_seconds": now - entry["created_at"]},
+            }
+
+    def store(self, scope, question, query_embedding, response):
+        embedding = None
+        if query_embedding is not None:
+            embedding = np.asarray(query_embedding, dtype=np.float32).ravel()
+            embedding = embedding / (np.linalg.norm(embedding) or 1.0)
+        with self._lock:
+            key = self.key(scope, question)
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = {
+                "scope": scope,
+                "embedding": embedding,
+                "response": dict(response),
+                "created_at": time.time(),
+            }
+            self._scopes.setdefault(scope, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+                self.counters["evictions"] += 1
+
+    def _live_entry(self, key, now):
+        entry = self._entries.get(key)
+        if entry is not None and now - entry["created_at"] > self.ttl_seconds:
+            self._remove(key)
+            self.counters["expirations"] += 1
+            return None
+        return entry
+
+    def _nearest(self, scope, query_embedding, threshold, now):
+        keys = [
+            key
+            for key in list(self._scopes.get(scope, ()))
+            if self._live_entry(key, now) is not None
+            and self._entries[key]["embedding"] is not None
+        ]
+        if not keys:
+            return None, None
+        query = np.asarray(query_embedding, dtype=np.float32).ravel()
+        query = query / (np.linalg.norm(query) or 1.0)
+        similarities = (
+            np.stack([self._entries[key]["embedding"] for key in keys]) @ query
+        )
+        best = int(np.argmax(similarities))
+        if similarities[best] < threshold:
+            return None, None
+        return keys[best], self._entries[keys[best]]
+
+    def _remove(self, key):
+        entry = self._entries.pop(key)
+        scope_keys = self._scopes[entry["scope"]]
+        scope_keys.discard(key)
+        if not scope_keys:
+            del self._scopes[entry["scope"]]
+
+    def metrics(self):
+        with self._lock:
+            hits = self.counters["exact_hits"] + self.counters["semantic_hits"]
+            lookups = hits + self.counters["misses"]
+            return {
+                **self.counters,
+                "hit_rate": hits / lookups if lookups else 0.0,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+            }
+
+
+response_cache = ResponseCache(
+    max_entries=int(os.getenv("RESPONSE_CACHE_ENTRIES", 10000)),
+    ttl_seconds=float(os.getenv("RESPONSE_CACHE_TTL_SECONDS", 3600)),
+)
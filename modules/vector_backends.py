@@ -0,0 +1,337 @@
+import json
+import os
+import threading
+
+import numpy as np
+
+_chroma_clients = {}
+_indexes = {}
+_lock = threading.Lock()
+
+
+def get_chroma_client(persist_directory=None):
+    # One client per location: chromadb only allows a single client per path, and
+    # re-opening a persistent store on every request would reload its segments.
+    import chromadb
+
+    key = persist_directory or ":memory:"
+    with _lock:
+        if key not in _chroma_clients:
+            if persist_directory:
+                _chroma_clients[key] = chromadb.PersistentClient(path=persist_directory)
+            else:
+                _chroma_clients[key] = chromadb.Client()
+        return _chroma_clients[key]
+
+
+class ChromaBackend:
+    def __init__(self, collection_name, persist_directory=None, **options):
+        self.client = get_chroma_client(persist_directory)
+        self.collection = self.client.get_or_create_collection(name=collection_name)
+        self.name = collection_name
+
+    def is_indexed(self):
+        return bool((self.collection.metadata or {}).get("indexed"))
+
+    def mark_indexed(self):
+        self.collection.modify(metadata={"indexed": True})
+
+    def count(self):
+        return self.collection.count()
+
+    def upsert(self, ids, documents, embeddings, metadatas=None):
+        batch_size = self.client.get_max_batch_size()
+        for start in range(0, len(ids), batch_size):
+            end = start + batch_size
+            self.collection.upsert(
+                ids=ids[start:end],
+                documents=documents[start:end],
+                embeddings=embeddings[start:end],
+                metadatas=metadatas[start:end] if metadatas else None,
+            )
+
+    def update_metadatas(self, ids, metadatas):
+        self.collection.update(ids=ids, metadatas=metadatas)
+
+    def delete(self, ids):
+        batch_size = self.client.get_max_batch_size()
+        for start in range(0, len(ids), batch_size):
+            self.collection.delete(ids=ids[start : start + batch_size])
+
+    def get_metadatas(self, sources):
+        results = self.collection.get(
+            where={"source": {"$in": list(sources)}}, include=["metadatas"]
+        )
+        return dict(zip(results["ids"], results["metadatas"]))
+
+    def get_chunks(self, ids):
+        results = self.collection.get(ids=list(ids), include=["documents", "metadatas"])
+        return dict(
+            zip(results["ids"], zip(results["documents"], results["metadatas"]))
+        )
+
+    def query(self, query_embeddings, n_results=5):
+        return self.collection.query(
+            query_embeddings=query_embeddings, n_results=n_results
+        )
+
+
+def normalize_rows(vectors):
+    vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def top_k(scores, k):
+    # argpartition finds the k best columns per row in O(n); only those k are
+    # then sorted.
+    k = min(k, scores.shape[1])
+    if k == 0:
+        return np.empty((scores.shape[0], 0), dtype=np.int64)
+    if k < scores.shape[1]:
+        candidates = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    else:
+        candidates = np.tile(np.arange(scores.shape[1]), (scores.shape[0], 1))
+    order = np.argsort(
+        -np.take_along_axis(scores, candidates, axis=1), axis=1, kind="stable"
+    )
+    return np.take_along_axis(candidates, order, axis=1)
+
+
+class NumpyIndex:
+    # Exact cosine-similarity index: normalized float32 rows in one contiguous,
+    # growable array. When persisted, the vectors are opened memory-mapped and
+    # only copied into memory on the first write.
+    def __init__(self, directory=None):
+        self.directory = directory
+        self.lock = threading.RLock()
+        self.vectors = None
+        self.size = 0
+        self.ids = []
+        self.documents = []
+        self.metadatas = []
+        self.rows = {}
+        self.indexed = False
+        if directory and os.path.exists(os.path.join(directory, "index.json")):
+            self.load()
+
+    def load(self):
+        with open(os.path.join(self.directory, "index.json")) as f:
+            state = json.load(f)
+        self.ids = state["ids"]
+        self.documents = state["documents"]
+        self.metadatas = state["metadatas"]
+        self.indexed = state["indexed"]
+        self.rows = {id_: row for row, id_ in enumerate(self.ids)}
+        self.size = len(self.ids)
+        if self.size:
+            self.vectors = np.load(
+                os.path.join(self.directory, "vectors.npy"), mmap_mode="r"
+            )
+
+    def save(self):
+        if not self.directory:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        # Still memory-mapped means no vector was written since load(): only the
+        # (small) metadata needs rewriting.
+        if self.size and not isinstance(self.vectors, np.memmap):
+            np.save(
+                os.path.join(self.directory, "vectors.tmp.npy"),
+                self.vectors[: self.size],
+            )
+            os.replace(
+                os.path.join(self.directory, "vectors.tmp.npy"),
+                os.path.join(self.directory, "vectors.npy"),
+            )
+        with open(os.path.join(self.directory, "index.tmp.json"), "w") as f:
+            json.dump(
+                {
+                    "ids": self.ids,
+                    "documents": self.documents,
+                    "metadatas": self.metadatas,
+                    "indexed": self.indexed,
+                },
+                f,
+            )
+        os.replace(
+            os.path.join(self.directory, "index.tmp.json"),
+            os.path.join(self.directory, "index.json"),
+        )
+
+    def reserve(self, n_rows, dim):
+        if self.vectors is None:
+            self.vectors = np.empty((max(n_rows, 1024), dim), dtype=np.float32)
+            return
+        capacity = self.vectors.shape[0]
+        if isinstance(self.vectors, np.memmap) or n_rows > capacity:
+            # Amortised doubling; also moves a read-only memory map into RAM
+            new_capacity = max(n_rows, capacity * 2 if n_rows > capacity else capacity)
+            vectors = np.empty((new_capacity, self.vectors.shape[1]), dtype=np.float32)
+            vectors[: self.size] = self.vectors[: self.size]
+            self.vectors = vectors
+
+    def upsert(self, ids, documents, embeddings, metadatas=None):
+        embeddings = normalize_rows(embeddings)
+        with self.lock:
+            new_ids = [id_ for id_ in dict.fromkeys(ids) if id_ not in self.rows]
+            self.reserve(self.size + len(new_ids), embeddings.shape[1])
+            for id_ in new_ids:
+                self.rows[id_] = self.size
+                self.ids.append(id_)
+                self.documents.append(None)
+                self.metadatas.append(None)
+                self.size += 1
+            rows = [self.rows[id_] for id_ in ids]
+            self.vectors[rows] = embeddings
+            for i, row in enumerate(rows):
+                self.documents[row] = documents[i]
+                self.metadatas[row] = metadatas[i] if metadatas else None
+
+    def update_metadatas(self, ids, metadatas):
+        with self.lock:
+            for id_, metadata in zip(ids, metadatas):
+                self.metadatas[self.rows[id_]] = metadata
+
+    def delete(self, ids):
+        with self.lock:
+            if self.vectors is None:
+                return
+            self.reserve(self.size, self.vectors.shape[1])
+            for id_ in ids:
+                row = self.rows.pop(id_, None)
+                if row is None:
+                    continue
+                # Move the last row into the hole to keep the array contiguous
+                last = self.size - 1
+                if row != last:
+                    self.vectors[row] = self.vectors[last]
+                    self.ids[row] = self.ids[last]
+                    self.documents[row] = self.documents[last]
+                    self.metadatas[row] = self.metadatas[last]
+                    self.rows[self.ids[row]] = row
+                self.ids.pop()
+                self.documents.pop()
+                self.metadatas.pop()
+                self.size -= 1
+
+    def get_metadatas(self, sources):
+        sources = set(sources)
+        with self.lock:
+            return {
+                id_: metadata
+                for id_, metadata in zip(self.ids, self.metadatas)
+                if metadata and metadata.get("source") in sources
+            }
+
+    def get_chunks(self, ids):
+        with self.lock:
+            return {
+                id_: (self.documents[self.rows[id_]], self.metadatas[self.rows[id_]])
+                for id_ in ids
+                if id_ in self.rows
+            }
+
+    def query(self, query_embeddings, n_results=5):
+        queries = normalize_rows(query_embeddings)
+        with self.lock:
+            if self.size == 0:
+                empty = [[] for _ in range(queries.shape[0])]
+                return {"ids": empty, "documents": empty, "metadatas": empty}
+            scores = queries @ self.vectors[: self.size].T
+            best = top_k(scores, n_results)
+            return {
+                "ids": [[self.ids[i] for i in row] for row in best],
+                "documents": [[self.documents[i] for i in row] for row in best],
+                "metadatas": [[self.metadatas[i] for i in row] for row in best],
+                "distances": (1.0 - np.take_along_axis(scores, best, axis=1)).tolist(),
+            }
+
+
+def get_shared_index(kind, collection_name, persist_directory, factory):
+    # Indexes are shared per process, like chromadb collections on a client
+    directory = (
+        os.path.join(persist_directory, kind, collection_name)
+        if persist_directory
+        else None
+    )
+    key = (kind, directory, collection_name)
+    with _lock:
+        if key not in _indexes:
+            _indexes[key] = factory(directory)
+        return _indexes[key]
+
+
+class NumpyBackend:
+    def __init__(self, collection_name, persist_directory=None, **options):
+        self.index = get_shared_index(
+            "numpy", collection_name, persist_directory, NumpyIndex
+        )
+        self.name = collection_name
+
+    def is_indexed(self):
+        return self.index.indexed
+
+    def mark_indexed(self):
+        with self.index.lock:
+            self.index.indexed = True
+            self.index.save()
+
+    def count(self):
+        return self.index.size
+
+    def upsert(self, ids, documents, embeddings, metadatas=None):
+        self.index.upsert(ids, documents, embeddings, metadatas)
+
+    def update_metadatas(self, ids, metadatas):
+        self.index.update_metadatas(ids, metadatas)
+
+    def delete(self, ids):
+        self.index.delete(ids)
+
+    def get_metadatas(self, sources):
+        return self.index.get_metadatas(sources)
+
+    def get_chunks(self, ids):
+        return self.index.get_chunks(ids)
+
+    def query(self, query_embeddings, n_results=5):
+        return self.index.query(query_embeddings, n_results)
+
+
+class IVFBackend(NumpyBackend):
+    def __init__(
+        self,
+        collection_name,
+        persist_directory=None,
+        n_lists=None,
+        nprobe=8,
+        quantization="int8",
+        **options,
+    ):
+        from modules.ann_index import IVFIndex
+
+        self.index = get_shared_index(
+            "ivf",
+            collection_name,
+            persist_directory,
+            lambda directory: IVFIndex(
+                directory, n_lists=n_lists, nprobe=nprobe, quantization=quantization
+            ),
+        )
+        self.name = collection_name
+        self.nprobe = nprobe
+
+    def upsert(self, ids, documents, embeddings, metadatas=None):
+        self.index.add(ids, documents, embeddings, metadatas)
+
+    def query(self, query_embeddings, n_results=5):
+        return self.index.query(query_embeddings, n_results, nprobe=self.nprobe)
+
+
+BACKENDS = {
+    "chroma": ChromaBackend,
+    "numpy": NumpyBackend,
+    "ivf": IVFBackend,
+}
@@ -1,26 +1,134 @@
-import chromadb
+import hashlib
+
+from modules.data_chunker import source_name
+from modules.vector_backends import BACKENDS
+
+
+def file_hash(file_path):
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def corpus_collection_name(file_paths, *params):
+    # Same file contents + same chunking/embedding settings -> same collection,
+    # regardless of the file names or upload order.
+    digest = hashlib.sha256()
+    for content_hash in sorted(file_hash(file_path) for file_path in file_paths):
+        digest.update(content_hash.encode())
+    for param in params:
+        digest.update(b"\0" + str(param).encode())
+    return f"corpus_{digest.hexdigest()[:32]}"
+
+
+def chunk_metadata(record):
+    metadata = {
+        "source": record["source"],
+        "offset": record["offset"],
+        "content_hash": record["content_hash"],
+    }
+    if record.get("page") is not None:
+        metadata["page"] = record["page"]
+    return metadata
+
+
+def source_collection_name(file_paths, *params):
+    # Keyed by file names rather than contents, so a new version of a document
+    # maps onto the collection of the previous one and can be synced in place.
+    digest = hashlib.sha256()
+    for name in sorted(source_name(file_path) for file_path in file_paths):
+        digest.update(name.encode() + b"\0")
+    for param in params:
+        digest.update(b"\0" + str(param).encode())
+    return f"corpus_{digest.hexdigest()[:32]}"
 
 
 class VectorStore:
-    def __init__(self, collection_name):
-        self.client = chromadb.Client()
-        self.collection = self.client.create_collection(name=collection_name)
-
-    def add_documents(self, documents, embeddings):
-        self.collection.add(
-            documents=documents,
-            embeddings=embeddings,
-            ids=[str(i) for i in range(len(documents))],
-        )
-        print(
-            f"Added {len(documents)} documents to the collection '{self.collection.name}'."
-        )
+    def __init__(
+        self, collection_name, persist_directory=None, backend="chroma", **options
+    ):
+        if backend not in BACKENDS:
+            raise ValueError(f"Unsupported vector store backend: {backend}")
+        self.backend = BACKENDS[backend](collection_name, persist_directory, **options)
+        self.name = collection_name
+
+    def is_indexed(self):
+        # Only set once indexing finished, so a half-written index is rebuilt
+        return self.backend.is_indexed()
+
+    def mark_indexed(self):
+        self.backend.mark_indexed()
+
+    def count(self):
+        return self.backend.count()
+
+    def add_documents(self, documents, embeddings, ids=None, metadatas=None):
+        if ids is None:
+            offset = self.count()
+            ids = [str(offset + i) for i in range(len(documents))]
+        self.upsert_documents(ids, documents, embeddings, metadatas)
+        self.mark_indexed()
+        print(f"Added {len(documents)} documents to the collection '{self.name}'.")
+
+    def upsert_documents(self, ids, documents, embeddings, metadatas=None):
+        self.backend.upsert(ids, documents, embeddings, metadatas)
+
+    def delete_documents(self, ids):
+        self.backend.delete(ids)
+
+    def get_metadatas(self, sources):
+        return self.backend.get_metadatas(sources)
+
+    def get_chunks(self, ids):
+        # {id: (document, metadata)} for the ids that exist
+        return self.backend.get_chunks(ids)
+
+    def sync_documents(self, records, embedding_fn):
+        # Diff the chunk records of the given sources against what is stored:
+        # only new/changed chunks are embedded, vanished ones are deleted, and
+        # chunks that only moved get their metadata updated without re-embedding.
+        # embedding_fn maps the new chunk records to their embeddings.
+        existing = self.get_metadatas({record["source"] for record in records})
+        new_records = [record for record in records if record["id"] not in existing]
+        moved_records = [
+            record
+            for record in records
+            if record["id"] in existing
+            and existing[record["id"]] != chunk_metadata(record)
+        ]
+        current_ids = {record["id"] for record in records}
+        stale_ids = [id_ for id_ in existing if id_ not in current_ids]
+
+        if new_records:
+            self.upsert_documents(
+                [record["id"] for record in new_records],
+                [record["text"] for record in new_records],
+                embedding_fn(new_records),
+                [chunk_metadata(record) for record in new_records],
+            )
+        if moved_records:
+            self.backend.update_metadatas(
+                [record["id"] for record in moved_records],
+                [chunk_metadata(record) for record in moved_records],
+            )
+        if stale_ids:
+            self.delete_documents(stale_ids)
+        self.mark_indexed()
+
+        stats = {
+            "added": len(new_records),
+            "moved": len(moved_records),
+            "deleted": len(stale_ids),
+            "unchanged": len(records) - len(new_records) - len(moved_records),
+        }
+        print(f"Synced collection '{self.name}': {stats}")
+        return stats
 
     def query(self, query_embedding, n_results=5):
-        results = self.collection.query(
-            query_embeddings=query_embedding, n_results=n_results
-        )
-        return results
+        # Accepts one embedding or a batch of them; results are per query
+        return self.backend.query(query_embedding, n_results=n_results)
 
 
 if __name__ == "__main__":
@@ -39,7 +147,7 @@ if __name__ == "__main__":
     embedding_generator = EmbeddingGenerator(
         model="sentence-transformers/all-MiniLM-L6-v2"
     )
-    embeddings = [embedding_generator.generate(chunk) for chunk in chunks]
+    embeddings = embedding_generator.generate_batch(chunks)
 
     vector_store = VectorStore(collection_name="test_collection")
     vector_store.add_documents(chunks, embeddings)
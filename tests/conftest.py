@@ -0,0 +1,33 @@
+import pytest
+from fastapi.testclient import TestClient
+
+from benchmarks.fakes import install_fakes
+from benchmarks.mock_openai_server import start_server
+from modules.llm_client import get_llm_pool
+
+
+@pytest.fixture(scope="session")
+def mock_server():
+    server = start_server(ttft_ms=20, tokens_per_second=2000, completion_tokens=20)
+    yield server
+    server.shutdown()
+
+
+@pytest.fixture
+def llm_pool(mock_server, monkeypatch):
+    monkeypatch.setenv("OPENAI_BASE_URL", mock_server.base_url)
+    monkeypatch.setenv("OPENAI_API_KEY", "mock")
+    return get_llm_pool(mock_server.base_url)
+
+
+@pytest.fixture
+def client(llm_pool, monkeypatch, tmp_path):
+    monkeypatch.setenv("MODEL_PRELOAD", "")
+    monkeypatch.setenv("VECTOR_BACKEND", "numpy")
+    monkeypatch.delenv("VECTOR_STORE_DIR", raising=False)
+    monkeypatch.chdir(tmp_path)
+    install_fakes()
+    import main
+
+    with TestClient(main.app) as client:
+        yield client
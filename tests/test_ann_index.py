@@ -0,0 +1,103 @@
+import numpy as np
+
+from modules.ann_index import RETRAIN_GROWTH, IVFIndex
+
+
+def random_vectors(n, dim=16, seed=0):
+    return np.random.default_rng(seed).standard_normal((n, dim)).astype(np.float32)
+
+
+def add_range(index, start, end, seed=0):
+    ids = [f"chunk-{i}" for i in range(start, end)]
+    index.add(ids, ids, random_vectors(end - start, seed=seed))
+
+
+def test_repeated_ids_keep_last_write():
+    index = IVFIndex(train_threshold=10)
+    vectors = random_vectors(3)
+    index.add(["a", "b", "a"], ["first", "b", "second"], vectors)
+    assert index.size == 2
+    assert index.n_rows == 2
+    assert index.get_chunks(["a"])["a"][0] == "second"
+    result = index.query(vectors[2:], n_results=1)
+    assert result["ids"] == [["a"]]
+
+
+def test_lists_are_retrained_as_the_index_grows():
+    index = IVFIndex(train_threshold=100)
+    add_range(index, 0, 100)
+    assert index.trained_size == 100
+    n_lists = len(index.lists)
+
+    add_range(index, 100, 100 * RETRAIN_GROWTH, seed=1)
+    assert index.trained_size == 100
+    add_range(index, 100 * RETRAIN_GROWTH, 100 * RETRAIN_GROWTH + 1, seed=2)
+    assert index.trained_size == 100 * RETRAIN_GROWTH + 1
+    assert len(index.lists) > n_lists
+    assert sum(map(len, index.lists)) == index.size
+
+
+def test_load_memory_maps_codes(tmp_path):
+    index = IVFIndex(str(tmp_path), train_threshold=50)
+    add_range(index, 0, 80)
+    index.delete(["chunk-3"])
+    index.save()
+    queries = random_vectors(4, seed=5)
+    expected = index.query(queries, n_results=5, nprobe=1000)
+
+    loaded = IVFIndex(str(tmp_path), train_threshold=50)
+    assert isinstance(loaded.codes, np.memmap)
+    assert loaded.size == 79
+    assert loaded.trained_size == index.trained_size
+    assert loaded.query(queries, n_results=5, nprobe=1000)["ids"] == expected["ids"]
+
+    # Saving without writes keeps the memory map; a write copies it into memory
+    loaded.save()
+    assert isinstance(loaded.codes, np.memmap)
+    add_range(loaded, 80, 81, seed=6)
+    assert not isinstance(loaded.codes, np.memmap)
+    loaded.save()
+    assert IVFIndex(str(tmp_path)).size == 80
+
+
+def clustered_vectors(n, n_clusters=32, dim=32, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((n_clusters, dim))
+    labels = rng.integers(n_clusters, size=n)
+    noise = 0.3 * rng.standard_normal((n, dim))
+    return (centers[labels] + noise).astype(np.float32)
+
+
+def exact_neighbours(vectors, queries, k):
+    vectors = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    queries = queries / np.linalg.norm(queries, axis=1, keepdims=True)
+    return np.argsort(-(queries @ vectors.T), axis=1)[:, :k]
+
+
+def test_probing_every_list_is_exact():
+    vectors = clustered_vectors(2000)
+    ids = [f"chunk-{i}" for i in range(2000)]
+    index = IVFIndex(n_lists=16, quantization="none", train_threshold=500)
+    index.add(ids, ids, vectors)
+    assert index.trained
+    queries = clustered_vectors(10, seed=1)
+
+    result = index.query(queries, n_results=10, nprobe=16)
+    expected = exact_neighbours(vectors, queries, 10)
+    assert result["ids"] == [[ids[i] for i in row] for row in expected]
+
+
+def test_int8_recall_with_a_few_probes():
+    vectors = clustered_vectors(4000)
+    ids = [f"chunk-{i}" for i in range(4000)]
+    index = IVFIndex(n_lists=32, nprobe=4, train_threshold=1000)
+    index.add(ids, ids, vectors)
+    queries = clustered_vectors(50, seed=1)
+
+    result = index.query(queries, n_results=10)
+    expected = exact_neighbours(vectors, queries, 10)
+    hits = sum(
+        len(set(found) & {ids[i] for i in row})
+        for found, row in zip(result["ids"], expected)
+    )
+    assert hits / expected.size >= 0.9
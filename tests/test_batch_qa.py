@@ -0,0 +1,31 @@
+import json
+
+from modules.batch_qa import read_checkpoint
+
+
+def write_lines(path, results, tail=""):
+    path.write_text("".join(json.dumps(result) + "\n" for result in results) + tail)
+
+
+def test_failed_questions_are_retried(tmp_path):
+    path = tmp_path / "answers.jsonl"
+    answered = {"id": "1", "model_response": "yes"}
+    write_lines(
+        path,
+        [answered, {"id": "2", "error": "RateLimitError: slow down"}],
+        tail='{"id": "3", "model_resp',
+    )
+    assert read_checkpoint(str(path)) == {"1"}
+    assert path.read_text() == json.dumps(answered) + "\n"
+
+
+def test_failed_questions_are_kept_without_retry(tmp_path):
+    path = tmp_path / "answers.jsonl"
+    results = [{"id": "1", "model_response": "yes"}, {"id": "2", "error": "failed"}]
+    write_lines(path, results, tail='{"id": "3"')
+    assert read_checkpoint(str(path), retry_failed=False) == {"1", "2"}
+    assert [json.loads(line) for line in path.read_text().splitlines()] == results
+
+
+def test_missing_checkpoint(tmp_path):
+    assert read_checkpoint(str(tmp_path / "answers.jsonl")) == set()
@@ -0,0 +1,35 @@
+import gc
+import weakref
+
+from benchmarks.fakes import install_fakes
+from modules.batching import BatchedEmbeddingGenerator
+from modules.embedding_generator import EmbeddingGenerator
+from modules.model_registry import model_registry
+from modules.reranker import Reranker
+
+EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+RERANK_MODEL = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+
+
+def test_batchers_do_not_keep_evicted_models():
+    install_fakes()
+    model_registry.clear()
+    embedding_generator = BatchedEmbeddingGenerator(EmbeddingGenerator(EMBEDDING_MODEL))
+    reranker = Reranker(RERANK_MODEL, micro_batching=True)
+    assert embedding_generator.generate("first query").shape == (384,)
+    assert len(reranker.score([("query", "document")])) == 1
+    models = [
+        weakref.ref(embedding_generator.embedding_generator.client),
+        weakref.ref(reranker.client),
+    ]
+
+    del embedding_generator, reranker
+    model_registry.clear()
+    gc.collect()
+    assert all(model() is None for model in models)
+
+    # The shared batchers load the models again on their next batch
+    embedding_generator = BatchedEmbeddingGenerator(EmbeddingGenerator(EMBEDDING_MODEL))
+    assert embedding_generator.generate("second query").shape == (384,)
+    reranker = Reranker(RERANK_MODEL, micro_batching=True)
+    assert len(reranker.score([("query", "document")])) == 1
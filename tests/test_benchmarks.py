@@ -0,0 +1,55 @@
+import numpy as np
+import pytest
+
+from benchmarks.bench_pipeline import bench_end_to_end, compare, make_queries
+from benchmarks.corpus import generate_corpus
+from benchmarks.fakes import FakeSentenceTransformer, install_fakes
+from modules.data_loader import DataLoader
+
+
+def test_corpus_is_reproducible_in_every_format(tmp_path):
+    first = generate_corpus(
+        str(tmp_path / "first"), 3, 4, formats=("txt", "docx", "pdf"), seed=1
+    )
+    second = generate_corpus(
+        str(tmp_path / "second"), 3, 4, formats=("txt", "docx", "pdf"), seed=1
+    )
+    first_records = list(DataLoader(first).iter_records())
+    second_records = list(DataLoader(second).iter_records())
+    assert [r["text"] for r in first_records] == [r["text"] for r in second_records]
+    pdf_pages = [r for r in first_records if r["file_path"].endswith(".pdf")]
+    assert len(pdf_pages) == 4
+    assert make_queries(5, seed=1) == make_queries(5, seed=1)
+
+
+def test_fake_embeddings_are_deterministic():
+    texts = ["attention weighs tokens", "the decoder attends"]
+    first = FakeSentenceTransformer().encode(texts, normalize_embeddings=True)
+    second = FakeSentenceTransformer().encode(texts, normalize_embeddings=True)
+    assert np.array_equal(first, second)
+    assert first.shape == (2, 384)
+
+
+def test_compare_reports_regressions_in_both_directions():
+    baseline = {"embed": {"items_per_second": 100.0, "latency_p95_ms": 10.0}}
+    results = {
+        "embed": {"items_per_second": 80.0, "latency_p95_ms": 5.0},
+        "llm": {"items_per_second": 1.0},
+    }
+    changes = compare(results, baseline)
+    assert set(changes) == {"embed.items_per_second", "embed.latency_p95_ms"}
+    # Fewer items per second is worse, lower latency is better
+    assert changes["embed.items_per_second"]["regression"] == pytest.approx(0.2)
+    assert changes["embed.latency_p95_ms"]["regression"] == pytest.approx(-0.5)
+
+
+def test_end_to_end_benchmark_runs(llm_pool, tmp_path):
+    install_fakes()
+    file_paths = generate_corpus(str(tmp_path / "corpus"), 2, 3, formats=("txt",))
+    result = bench_end_to_end(
+        file_paths, make_queries(3, seed=0), "numpy", str(tmp_path)
+    )
+    assert result["index"]["items"] > 0
+    assert result["query"]["items"] == 3
+    assert result["query"]["latency_p50_ms"] > 0
+    assert "retrieve" in result["query"]["mean_stage_ms"]
@@ -0,0 +1,118 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from graphlib import CycleError
+
+import pytest
+
+from modules.concurrency import (
+    AdmissionController,
+    AdmissionRejected,
+    prefetch,
+    run_stage_graph,
+)
+
+
+def test_admission_queues_then_rejects():
+    async def run():
+        admission = AdmissionController(max_in_flight=1, max_queue=1)
+        release = asyncio.Event()
+        order = []
+
+        async def request(name):
+            async with admission.slot():
+                order.append(name)
+                await release.wait()
+
+        first = asyncio.create_task(request("first"))
+        await asyncio.sleep(0)
+        second = asyncio.create_task(request("second"))
+        await asyncio.sleep(0)
+        assert admission.metrics()["in_flight"] == 1
+        assert admission.metrics()["waiting"] == 1
+
+        with pytest.raises(AdmissionRejected):
+            async with admission.slot():
+                pass
+        assert admission.rejected == 1
+
+        release.set()
+        await asyncio.gather(first, second)
+        assert order == ["first", "second"]
+        assert admission.metrics()["in_flight"] == 0
+        assert admission.metrics()["waiting"] == 0
+
+    asyncio.run(asyncio.wait_for(run(), timeout=5))
+
+
+def test_stage_graph_runs_independent_stages_together():
+    both_started = threading.Barrier(2, timeout=5)
+    order = []
+
+    def stage(name, wait=False):
+        def run():
+            if wait:
+                # Only passes if the other independent stage runs at the same time
+                both_started.wait()
+            order.append(name)
+            return name.upper()
+
+        return run
+
+    stages = {
+        "answer": (("index", "models"), stage("answer")),
+        "index": ((), stage("index", wait=True)),
+        "models": ((), stage("models", wait=True)),
+    }
+    executor = ThreadPoolExecutor(max_workers=4)
+    results = asyncio.run(run_stage_graph(stages, executor))
+    executor.shutdown()
+    assert results == {"answer": "ANSWER", "index": "INDEX", "models": "MODELS"}
+    assert order[-1] == "answer"
+
+
+def test_stage_graph_rejects_bad_graphs_and_raises_failures():
+    with pytest.raises(CycleError):
+        asyncio.run(run_stage_graph({"a": (("b",), int), "b": (("a",), int)}))
+    with pytest.raises(ValueError, match="Unknown stages"):
+        asyncio.run(run_stage_graph({"a": (("missing",), int)}))
+
+    ran = []
+
+    def fail():
+        raise RuntimeError("index failed")
+
+    stages = {"index": ((), fail), "answer": (("index",), lambda: ran.append(1))}
+    with pytest.raises(RuntimeError, match="index failed"):
+        asyncio.run(run_stage_graph(stages))
+    assert ran == []
+
+
+def test_prefetch_keeps_order_and_reraises():
+    assert list(prefetch(iter(range(100)), depth=3)) == list(range(100))
+
+    def produce():
+        yield 1
+        raise ValueError("parse error")
+
+    items = prefetch(produce())
+    assert next(items) == 1
+    with pytest.raises(ValueError, match="parse error"):
+        next(items)
+
+
+def test_prefetch_stays_a_bounded_distance_ahead():
+    produced = []
+
+    def produce():
+        for i in range(100):
+            produced.append(i)
+            yield i
+
+    items = prefetch(produce(), depth=2)
+    assert next(items) == 0
+    time.sleep(0.2)
+    # One item handed out, two queued and one waiting to be queued
+    assert len(produced) <= 4
+    items.close()
@@ -0,0 +1,173 @@
+import bisect
+import itertools
+import logging
+import random
+
+import numpy as np
+import pytest
+import tiktoken
+
+from benchmarks.corpus import make_page
+from benchmarks.fakes import WORD_PATTERN, install_fakes
+from config import Config
+from modules.data_chunker import DataChunker, semantic_breakpoints, token_windows
+from modules.model_registry import model_registry
+from modules.pipeline_manager import PipelineManager
+
+TEXT = " ".join(f"word{i}." for i in range(1000))
+
+
+def test_tokenizer_follows_the_embedding_model():
+    minilm = PipelineManager("test", Config(method="token"))
+    assert minilm.make_chunker().tokenizer == "sentence_transformer:all-MiniLM-L6-v2"
+    openai = PipelineManager(
+        "test", Config(method="token", embedding_model="text-embedding-3-small")
+    )
+    assert openai.make_chunker().tokenizer == "tiktoken:text-embedding-3-small"
+    custom = PipelineManager(
+        "test", Config(method="token", tokenizer="tiktoken:cl100k_base")
+    )
+    assert custom.make_chunker().tokenizer == "tiktoken:cl100k_base"
+
+
+def test_tokens_per_chunk_over_the_model_limit_is_logged(caplog):
+    install_fakes()
+    with caplog.at_level(logging.WARNING, logger="modules.data_chunker"):
+        spans = DataChunker(TEXT, method="token", tokens_per_chunk=300).token_spans()
+    # The fake model accepts 256 positions, two of which are special tokens
+    assert "tokens_per_chunk=300 is over the 254 tokens" in caplog.text
+    assert len(spans) == -(-2000 // 254)
+
+    caplog.clear()
+    with caplog.at_level(logging.WARNING, logger="modules.data_chunker"):
+        DataChunker(TEXT, method="token", tokens_per_chunk=200).token_spans()
+    assert caplog.text == ""
+
+
+def page_records(n_pages=40, words=120):
+    rng = random.Random(0)
+    return [
+        {"file_path": "docs/report.txt", "page": page, "text": make_page(rng, words)}
+        for page in range(n_pages)
+    ]
+
+
+@pytest.mark.parametrize(
+    "options",
+    [
+        {"method": "character", "chunk_size": 300},
+        {"method": "word", "words_per_chunk": 50},
+        {"method": "token", "tokens_per_chunk": 64, "token_overlap": 16},
+    ],
+)
+def test_windowed_chunks_match_chunking_the_whole_text(options):
+    install_fakes()
+    records = page_records()
+    text = "\n".join(record["text"] for record in records)
+    chunker = DataChunker("", **options)
+    whole = list(chunker.iter_chunk_records(records, window_chars=None))
+    windowed = list(chunker.iter_chunk_records(records, window_chars=2000))
+
+    assert len(whole) > 20
+    assert [r["text"] for r in windowed] == [r["text"] for r in whole]
+    assert [r["offset"] for r in windowed] == [r["offset"] for r in whole]
+    assert [r["id"] for r in windowed] == [r["id"] for r in whole]
+    page_starts = list(itertools.accumulate(len(r["text"]) + 1 for r in records))
+    for record in windowed:
+        offset = record["offset"]
+        if options["method"] == "word":
+            # Word chunks are re-joined with single spaces
+            assert text[offset:].split()[:5] == record["text"].split()[:5]
+        else:
+            assert text[offset : offset + len(record["text"])] == record["text"]
+        assert record["page"] == bisect.bisect_right(page_starts, offset)
+
+
+def test_token_windows_share_the_overlap():
+    starts = np.arange(0, 100, 10)
+    ends = starts + 5
+    windows = token_windows(starts, ends, size=4, overlap=1)
+    # Tokens 0-3, 3-6, 6-9
+    assert windows.tolist() == [[0, 35], [30, 65], [60, 95]]
+    assert token_windows(starts, ends, size=20, overlap=5).tolist() == [[0, 95]]
+    assert token_windows(starts[:0], ends[:0], size=4, overlap=1).shape == (0, 2)
+
+
+def test_token_chunks_are_spans_of_the_text():
+    install_fakes()
+    rng = random.Random(0)
+    text = "\n\n".join(make_page(rng, 100) for _ in range(5))
+    chunker = DataChunker(text, method="token", tokens_per_chunk=40, token_overlap=10)
+    records = chunker.chunk_records("doc.txt")
+
+    tokens = [match.span() for match in WORD_PATTERN.finditer(text)]
+    assert len(records) == -(-(len(tokens) - 10) // 30)
+    for i, record in enumerate(records):
+        start = record["offset"]
+        assert record["text"] == text[start : start + len(record["text"])]
+        # Each chunk starts at its first token and ends with its last one
+        first = 30 * i
+        last = min(first + 40, len(tokens)) - 1
+        assert start == tokens[first][0]
+        assert start + len(record["text"]) == tokens[last][1]
+
+
+def test_tiktoken_chunks_skip_leading_whitespace(monkeypatch):
+    install_fakes()
+    # One token per byte; real encodings need files that are not available offline
+    encoding = tiktoken.Encoding(
+        "bytes",
+        pat_str=r"\s?\w+|\s?[^\w\s]+|\s+",
+        mergeable_ranks={bytes([i]): i for i in range(256)},
+        special_tokens={},
+    )
+    monkeypatch.setitem(model_registry.loaders, "tiktoken", lambda name: encoding)
+    text = "Attention is all you need. " * 20
+    chunker = DataChunker(
+        text,
+        method="token",
+        tokens_per_chunk=50,
+        token_overlap=5,
+        tokenizer="tiktoken:bytes",
+    )
+    spans = chunker.token_spans()
+    assert len(spans) == -(-(len(text) - 5) // 45)
+    for i, (start, end) in enumerate(spans):
+        assert not text[start].isspace()
+        assert end == min(45 * i + 50, len(text))
+    model_registry.clear()
+
+
+def topic_embeddings(topics, dim=8, seed=0):
+    # One embedding per sentence, near the direction of its topic
+    rng = np.random.default_rng(seed)
+    directions = np.eye(dim)
+    embeddings = directions[topics] + 0.05 * rng.standard_normal((len(topics), dim))
+    return embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+
+
+def test_semantic_breakpoints_follow_topic_shifts():
+    embeddings = topic_embeddings([0] * 6 + [1] * 6 + [2] * 6)
+    assert semantic_breakpoints(embeddings, 3, 10, max_sentences=15) == [6, 12]
+    # Long runs of one topic are split every max_sentences sentences
+    embeddings = topic_embeddings([0] * 12)
+    breakpoints = semantic_breakpoints(embeddings, 3, 0, max_sentences=5)
+    assert all(
+        end - start <= 5 for start, end in zip([0, *breakpoints], [*breakpoints, 12])
+    )
+    assert semantic_breakpoints(embeddings[:1], 3, 10, max_sentences=5) == []
+
+
+def test_semantic_chunks_are_contiguous_sentences():
+    pytest.importorskip("nltk")
+    install_fakes()
+    text = " ".join(
+        ["The encoder attends to every token."] * 4
+        + ["Gradient descent lowers the training loss."] * 4
+    )
+    chunks = DataChunker(text, method="semantic", semantic_percentile=10).chunk_spans()
+    split = text.index("Gradient")
+    assert [chunk for chunk, _, _ in chunks] == [text[: split - 1], text[split:]]
+    for chunk, offset, embedding in chunks:
+        assert text[offset : offset + len(chunk)] == chunk
+        assert np.linalg.norm(embedding) == pytest.approx(1.0)
@@ -0,0 +1,39 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from modules import data_loader
+from modules.data_loader import DataLoader
+
+
+def test_parallel_load_stops_a_file_at_its_first_failing_range(monkeypatch):
+    tasks = [("a.pdf", 0, 2), ("a.pdf", 2, 4), ("a.pdf", 4, 6), ("b.txt", 0, None)]
+
+    def parse_file_task(file_path, start=0, stop=None):
+        if file_path == "a.pdf" and start == 2:
+            raise ValueError("broken page")
+        return [(page, f"{file_path} {page}") for page in range(start, stop or 2)]
+
+    pool = ThreadPoolExecutor(max_workers=2)
+    monkeypatch.setattr(data_loader, "get_process_pool", lambda max_workers: pool)
+    monkeypatch.setattr(data_loader, "parse_file_task", parse_file_task)
+    monkeypatch.setattr(DataLoader, "plan_tasks", lambda self: tasks)
+
+    loader = DataLoader(["a.pdf", "b.txt"], max_workers=2)
+    records = [
+        (record["file_path"], record["page"]) for record in loader.iter_records()
+    ]
+    pool.shutdown()
+    assert records == [("a.pdf", 0), ("a.pdf", 1), ("b.txt", 0), ("b.txt", 1)]
+    assert loader.errors == [{"file_path": "a.pdf", "error": "broken page"}]
+
+
+def test_text_files_are_read_in_blocks_of_whole_lines(tmp_path):
+    lines = [f"line {i} " + "x" * (i % 50) for i in range(2000)]
+    path = tmp_path / "notes.txt"
+    path.write_text("\n".join(lines) + "\n")
+
+    blocks = list(DataLoader().iter_txt_blocks(str(path), block_chars=4096))
+    assert [page for page, _ in blocks] == list(range(1, len(blocks) + 1))
+    assert len(blocks) > 10
+    assert all(len(text) < 4096 + 60 for _, text in blocks)
+    # Records are joined with newlines when chunked, which gives back the file
+    assert "\n".join(text for _, text in blocks) == "\n".join(lines)
@@ -0,0 +1,83 @@
+import numpy as np
+
+from benchmarks.fakes import install_fakes
+from modules.embedding_cache import CachedEmbeddingGenerator, EmbeddingCache
+from modules.embedding_generator import EmbeddingGenerator
+
+EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+
+
+class CountingEmbeddingGenerator(EmbeddingGenerator):
+    def __init__(self, model):
+        super().__init__(model)
+        self.embedded = []
+
+    def generate_batch(self, texts, max_batch_tokens=None):
+        self.embedded.extend(texts)
+        return super().generate_batch(texts, max_batch_tokens)
+
+
+def test_only_missing_texts_are_embedded():
+    install_fakes()
+    embedding_generator = CountingEmbeddingGenerator(EMBEDDING_MODEL)
+    cache = EmbeddingCache()
+    cached = CachedEmbeddingGenerator(embedding_generator, cache)
+
+    first = cached.generate_batch(["attention", "recurrence", "attention"])
+    assert embedding_generator.embedded == ["attention", "recurrence"]
+    assert np.array_equal(first[0], first[2])
+
+    # Whitespace differences map to the same entry
+    second = cached.generate_batch(["recurrence ", "convolution", "attention"])
+    assert embedding_generator.embedded == ["attention", "recurrence", "convolution"]
+    assert np.array_equal(second[0], first[1])
+    assert np.array_equal(second[2], first[0])
+    expected = embedding_generator.encode(["recurrence", "convolution", "attention"])
+    assert np.allclose(second, expected, atol=1e-5)
+
+    metrics = cache.metrics()
+    assert metrics["misses"] == 3
+    assert metrics["memory_hits"] == 2
+    assert metrics["saved_tokens"] > 0
+
+
+def test_entries_are_read_back_from_disk(tmp_path):
+    install_fakes()
+    path = str(tmp_path / "embeddings.sqlite")
+    first = CachedEmbeddingGenerator(
+        EmbeddingGenerator(EMBEDDING_MODEL), EmbeddingCache(path)
+    ).generate_batch(["attention", "recurrence"])
+
+    # A new cache on the same file, as after a restart
+    embedding_generator = CountingEmbeddingGenerator(EMBEDDING_MODEL)
+    cache = EmbeddingCache(path)
+    second = CachedEmbeddingGenerator(embedding_generator, cache).generate_batch(
+        ["recurrence", "attention"]
+    )
+    assert embedding_generator.embedded == []
+    assert np.array_equal(second, first[::-1])
+    assert cache.metrics()["disk_hits"] == 2
+
+
+def test_entries_are_keyed_by_model():
+    install_fakes()
+    cache = EmbeddingCache()
+    CachedEmbeddingGenerator(EmbeddingGenerator(EMBEDDING_MODEL), cache).generate_batch(
+        ["attention"]
+    )
+    embedding_generator = CountingEmbeddingGenerator(
+        "sentence-transformers/all-mpnet-base-v2"
+    )
+    CachedEmbeddingGenerator(embedding_generator, cache).generate_batch(["attention"])
+    assert embedding_generator.embedded == ["attention"]
+
+
+def test_memory_is_bounded():
+    install_fakes()
+    # 384 float32 values are 1.5 KiB; room for two of them
+    cache = EmbeddingCache(max_memory_mb=3 / 1024)
+    CachedEmbeddingGenerator(EmbeddingGenerator(EMBEDDING_MODEL), cache).generate_batch(
+        ["attention", "recurrence", "convolution"]
+    )
+    assert cache.metrics()["memory_entries"] == 2
+    assert cache.metrics()["evictions"] == 1
@@ -0,0 +1,50 @@
+import random
+
+import numpy as np
+
+from benchmarks.corpus import make_page
+from benchmarks.fakes import install_fakes
+from modules.embedding_generator import EmbeddingGenerator
+
+EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+
+
+def test_batched_embeddings_match_one_call_per_text():
+    install_fakes()
+    rng = random.Random(0)
+    texts = [make_page(rng, rng.randrange(1, 80)) for _ in range(50)]
+    embedding_generator = EmbeddingGenerator(EMBEDDING_MODEL)
+    calls = []
+    encode = embedding_generator.encode
+
+    def counting_encode(batch):
+        calls.append(len(batch))
+        return encode(batch)
+
+    embedding_generator.encode = counting_encode
+
+    embeddings = embedding_generator.generate_batch(texts, max_batch_tokens=500)
+    assert embeddings.shape == (50, 384)
+    assert 1 < len(calls) < 50
+    expected = np.stack([encode([text])[0] for text in texts])
+    assert np.allclose(embeddings, expected, atol=1e-5)
+
+
+def test_batches_stay_within_the_token_and_item_limits():
+    install_fakes()
+    rng = random.Random(0)
+    texts = [make_page(rng, rng.randrange(1, 80)) for _ in range(200)]
+    embedding_generator = EmbeddingGenerator(EMBEDDING_MODEL)
+    batches = list(embedding_generator.make_batches(texts, 1000, 16))
+
+    assert sorted(i for batch in batches for i in batch) == list(range(200))
+    for batch in batches:
+        width = max(embedding_generator.estimate_tokens(texts[i]) for i in batch)
+        assert len(batch) <= 16
+        assert len(batch) == 1 or len(batch) * width <= 1000
+
+
+def test_empty_input_gives_no_embeddings():
+    install_fakes()
+    embeddings = EmbeddingGenerator(EMBEDDING_MODEL).generate_batch([])
+    assert embeddings.shape[0] == 0
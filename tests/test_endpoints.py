@@ -0,0 +1,75 @@
+import os
+import random
+import time
+
+from benchmarks.corpus import make_page
+
+
+def document():
+    rng = random.Random(0)
+    return "\n".join(make_page(rng, 200) for _ in range(5))
+
+
+def test_chat_completion(client):
+    response = client.post(
+        "/chat/completion",
+        files=[("files", ("doc.txt", document()))],
+        data={
+            "method": "character",
+            "model_name": "mock-model",
+            "n_questions_per_chunk": 1,
+            "question": "What does the encoder do?",
+        },
+    )
+    assert response.status_code == 200, response.text
+    answer = response.json()["data"]
+    assert answer["model_response"]
+    assert answer["completion_tokens"] > 0
+    assert answer["context_packing"]["context_ids"]
+    assert answer["ingest_errors"] == []
+    # The uploads of a request are removed once it is answered
+    assert os.listdir("tmp") == []
+    assert client.get("/admission").json()["in_flight"] == 0
+
+
+def create_corpus(client):
+    response = client.post(
+        "/corpora",
+        files=[("files", ("doc.txt", document()))],
+        data={"method": "character"},
+    )
+    assert response.status_code == 202
+    corpus_id = response.json()["data"]["corpus_id"]
+    for _ in range(100):
+        corpus = client.get(f"/corpora/{corpus_id}").json()
+        if corpus["status"] in ("ready", "failed"):
+            break
+        time.sleep(0.05)
+    assert corpus["status"] == "ready", corpus["error"]
+    return corpus
+
+
+def test_corpus_is_indexed_once_and_queried_many_times(client):
+    corpus = create_corpus(client)
+    assert corpus["chunks_indexed"] > 1
+    assert corpus["collection_name"]
+    assert os.listdir("tmp") == []
+
+    for question in ("What does the encoder do?", "What is attention?"):
+        response = client.post(
+            f"/corpora/{corpus['corpus_id']}/query", data={"question": question}
+        )
+        assert response.status_code == 200, response.text
+        answer = response.json()["data"]
+        assert answer["model_response"]
+        assert answer["context_packing"]["context_ids"]
+        # Querying neither parses nor indexes the documents again
+        stages = answer["timings"]["stages"]
+        assert "retrieve" in stages
+        assert {"load", "chunk", "index"}.isdisjoint(stages)
+
+
+def test_unknown_corpus(client):
+    assert client.get("/corpora/missing").status_code == 404
+    response = client.post("/corpora/missing/query", data={"question": "Why?"})
+    assert response.status_code == 404
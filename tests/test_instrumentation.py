@@ -0,0 +1,37 @@
+import logging
+import sys
+
+import numpy as np
+
+from modules import instrumentation
+from modules.instrumentation import RunTrace
+from modules.model_registry import peak_rss_bytes, process_rss_bytes
+
+MB = 1024 * 1024
+
+
+def test_span_records_peak_rss_growth():
+    trace = RunTrace("test")
+    # Past the process peak so far, so the peak has to grow
+    n_bytes = max(peak_rss_bytes() - process_rss_bytes(), 0) + 64 * MB
+    with trace.span("embed"):
+        with trace.span("chunk"):
+            pass
+        buffer = np.ones(n_bytes, dtype=np.uint8)
+    del buffer
+    with trace.span("retrieve"):
+        pass
+
+    stages = trace.summary()["stages"]
+    assert stages["embed"]["peak_rss_growth_bytes"] >= 32 * MB
+    assert stages["chunk"]["peak_rss_growth_bytes"] < 32 * MB
+    assert stages["retrieve"]["peak_rss_growth_bytes"] == 0
+
+
+def test_missing_opentelemetry_is_logged(monkeypatch, caplog):
+    monkeypatch.setenv("OTEL_TRACING", "1")
+    monkeypatch.setattr(instrumentation, "_otel_tracer", None)
+    monkeypatch.setitem(sys.modules, "opentelemetry", None)
+    with caplog.at_level(logging.WARNING, logger="modules.instrumentation"):
+        assert instrumentation.get_otel_tracer() is None
+    assert "opentelemetry is not installed" in caplog.text
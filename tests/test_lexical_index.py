@@ -0,0 +1,121 @@
+import math
+import random
+from collections import Counter
+
+import pytest
+
+from benchmarks.corpus import make_page
+from benchmarks.fakes import install_fakes
+from config import Config
+from modules.lexical_index import BM25Index, reciprocal_rank_fusion, tokenize
+from modules.pipeline_manager import PipelineManager
+
+DOCUMENTS = {
+    "zebra": "the zebra grazes",
+    **{f"common-{i}": "common words " * (i % 3 + 1) + "and more" for i in range(40)},
+}
+
+
+def bm25(query, documents, k1=1.2, b=0.75):
+    # Textbook BM25 over every document
+    tokens = {id_: tokenize(text) for id_, text in documents.items()}
+    avg_length = sum(map(len, tokens.values())) / len(tokens)
+    scores = {}
+    for id_, doc_tokens in tokens.items():
+        counts = Counter(doc_tokens)
+        score = 0.0
+        for term in set(tokenize(query)):
+            df = sum(term in other for other in tokens.values())
+            if not counts[term]:
+                continue
+            idf = math.log(1.0 + (len(tokens) - df + 0.5) / (df + 0.5))
+            norm = k1 * (1.0 - b + b * len(doc_tokens) / avg_length)
+            score += idf * counts[term] * (k1 + 1.0) / (counts[term] + norm)
+        if score:
+            scores[id_] = score
+    return scores
+
+
+@pytest.fixture
+def index():
+    index = BM25Index()
+    index.add(list(DOCUMENTS), list(DOCUMENTS.values()))
+    return index
+
+
+def test_search_scores_every_posting(index):
+    expected = bm25("common zebra", DOCUMENTS)
+    results = index.search("common zebra", n_results=len(DOCUMENTS))
+    assert {id_ for id_, _ in results} == set(expected)
+    for id_, score in results:
+        assert score == pytest.approx(expected[id_], rel=1e-5)
+    assert [score for _, score in results] == sorted(
+        (score for _, score in results), reverse=True
+    )
+
+
+def test_pruning_is_opt_in(index):
+    exact = index.search("common zebra", n_results=5)
+    pruned = index.search("common zebra", n_results=5, prune=True)
+    assert len(exact) == 5
+    assert [id_ for id_, _ in pruned] == ["zebra"]
+
+
+def test_rank_fusion_rewards_agreement():
+    fused = reciprocal_rank_fusion([["a", "b", "c"], ["c", "d", "a"]])
+    # "a" and "c" are in both rankings, ahead of anything found only once
+    assert fused[:2] == ["a", "c"]
+    assert set(fused[2:]) == {"b", "d"}
+    assert reciprocal_rank_fusion([["x", "y"]]) == ["x", "y"]
+
+
+def test_identifiers_are_indexed_whole_and_by_part(index):
+    index.add(["part"], ["Replace part PN-0042 after ERR-404."])
+    assert index.search("pn-0042", n_results=1)[0][0] == "part"
+    assert index.search("404", n_results=1)[0][0] == "part"
+    index.delete(["part"])
+    assert index.search("pn-0042") == []
+
+
+def test_saved_index_gives_the_same_results(index, tmp_path):
+    index.directory = str(tmp_path)
+    index.delete(["common-0"])
+    index.save()
+    loaded = BM25Index(str(tmp_path))
+    assert loaded.size == index.size
+    assert loaded.search("common zebra", n_results=10) == index.search(
+        "common zebra", n_results=10
+    )
+
+
+def test_hybrid_retrieval_fuses_dense_and_lexical_candidates(tmp_path):
+    install_fakes()
+    rng = random.Random(0)
+    path = tmp_path / "parts.txt"
+    path.write_text(
+        "\n".join(f"{make_page(rng, 30)} Part PN-{i:04d}." for i in range(200))
+    )
+    question = "Which page lists part PN-0123?"
+    config = Config(
+        file_paths=[str(path)],
+        method="paragraph",
+        vector_backend="numpy",
+        retrieval="hybrid",
+        dense_candidates=3,
+        lexical_candidates=3,
+        rerank_candidates=10,
+    )
+    pipeline_manager = PipelineManager("hybrid", config)
+    pipeline_manager.index()
+    query_embedding = pipeline_manager.embed_query(question)
+    dense_ids = pipeline_manager.vector_storage.query(query_embedding, 3)["ids"][0]
+    lexical_ids = [id_ for id_, _ in pipeline_manager.lexical_index.search(question, 3)]
+
+    ids, documents, metadatas = pipeline_manager.retrieve(question)
+    assert ids == reciprocal_rank_fusion([dense_ids, lexical_ids])
+    assert set(lexical_ids) - set(dense_ids)
+    # Chunks found only by BM25 are fetched from the vector store
+    chunks = pipeline_manager.vector_storage.get_chunks(ids)
+    assert documents == [chunks[id_][0] for id_ in ids]
+    assert metadatas == [chunks[id_][1] for id_ in ids]
+    assert any(document.endswith("PN-0123.") for document in documents)
@@ -0,0 +1,64 @@
+import asyncio
+
+from modules.embedding_generator import EmbeddingGenerator
+from modules.llm import LLM
+from modules.llm_client import LLMClientPool, _pools
+
+
+def test_aslot_caps_concurrent_calls(mock_server, monkeypatch):
+    pool = LLMClientPool(
+        base_url=mock_server.base_url, api_key="mock", max_concurrency=2
+    )
+    monkeypatch.setitem(_pools, mock_server.base_url, pool)
+    llm = LLM(model_name="mock-model", base_url=mock_server.base_url)
+    in_flight = []
+
+    async def generate():
+        async with pool.aslot(1):
+            in_flight.append(pool.metrics()["in_flight"])
+            await asyncio.sleep(0.01)
+
+    async def run():
+        await asyncio.gather(*(generate() for _ in range(8)))
+        return await asyncio.gather(*(llm.agenerate("Hello") for _ in range(6)))
+
+    answers = asyncio.run(run())
+    assert max(in_flight) <= 2
+    assert all(answer["model_response"] for answer in answers)
+    assert pool.metrics()["in_flight"] == 0
+
+
+def test_aslot_cancelled_while_waiting_returns_slot(mock_server):
+    pool = LLMClientPool(
+        base_url=mock_server.base_url, api_key="mock", max_concurrency=1
+    )
+
+    async def run():
+        async with pool.aslot(1):
+            waiter = asyncio.ensure_future(pool.aslot(1).__aenter__())
+            await asyncio.sleep(0.01)
+            waiter.cancel()
+        await asyncio.sleep(0.01)
+        async with pool.aslot(1):
+            return True
+
+    assert asyncio.run(asyncio.wait_for(run(), timeout=5))
+
+
+def test_openai_embeddings_go_through_pool(llm_pool):
+    embedding_generator = EmbeddingGenerator(model="text-embedding-3-small")
+    assert embedding_generator.pool is llm_pool
+    calls = llm_pool.metrics()["calls"]
+    embeddings = embedding_generator.generate_batch(["first text", "second", ""])
+    assert embeddings.shape[0] == 3
+    assert llm_pool.metrics()["calls"] == calls + 1
+    assert llm_pool.metrics()["in_flight"] == 0
+
+
+def test_pool_serves_several_event_loops(mock_server, llm_pool):
+    llm = LLM(model_name="mock-model", base_url=mock_server.base_url)
+    for _ in range(3):
+        answer = asyncio.run(llm.agenerate("Hello"))
+        assert answer["model_response"]
+    # Only the client of a loop that is still running is kept
+    assert len(llm_pool._async_clients) <= 1
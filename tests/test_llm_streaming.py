@@ -0,0 +1,42 @@
+import asyncio
+
+from modules.llm import LLM
+
+
+def check_events(events):
+    kinds = [kind for kind, _ in events]
+    assert kinds[-1] == "usage"
+    assert kinds.count("usage") == 1
+    assert set(kinds[:-1]) == {"token"}
+
+    usage = events[-1][1]
+    assert usage["model_response"] == "".join(data for _, data in events[:-1]).strip()
+    assert usage["completion_tokens"] > 0
+    assert usage["time_to_first_token"] > 0
+    assert usage["tokens_per_second"] > 0
+    assert usage["total_time"] >= usage["time_to_first_token"]
+
+
+def test_stream_yields_tokens_then_usage(mock_server, llm_pool):
+    llm = LLM(model_name="mock-model", base_url=mock_server.base_url)
+    check_events(list(llm.stream("Hello", system_prompt="Answer briefly.")))
+
+
+def test_astream_yields_tokens_then_usage(mock_server, llm_pool):
+    llm = LLM(model_name="mock-model", base_url=mock_server.base_url)
+
+    async def collect():
+        return [
+            event
+            async for event in llm.astream("Hello", system_prompt="Answer briefly.")
+        ]
+
+    check_events(asyncio.run(collect()))
+
+
+def test_generate_reports_timings(mock_server, llm_pool):
+    llm = LLM(model_name="mock-model", base_url=mock_server.base_url)
+    answer = asyncio.run(llm.agenerate("Hello", system_prompt="Answer briefly."))
+    assert answer["model_response"]
+    assert answer["time_to_first_token"] > 0
+    assert answer["tokens_per_second"] > 0
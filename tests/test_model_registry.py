@@ -0,0 +1,83 @@
+import threading
+import time
+
+import pytest
+
+from modules.model_registry import ModelRegistry, parse_model_specs
+
+
+class FakeParameter:
+    def __init__(self, n_bytes):
+        self.n_bytes = n_bytes
+
+    def numel(self):
+        return self.n_bytes
+
+    def element_size(self):
+        return 1
+
+
+class FakeModel:
+    def __init__(self, name, n_bytes=0):
+        self.name = name
+        self.n_bytes = n_bytes
+
+    def parameters(self):
+        return [FakeParameter(self.n_bytes)]
+
+
+def test_models_load_once_per_kind_and_name():
+    loads = []
+
+    def loader(name):
+        loads.append(name)
+        # Slow enough for the other threads to ask while the model loads
+        time.sleep(0.05)
+        return FakeModel(name)
+
+    registry = ModelRegistry()
+    registry.register_loader("fake", loader)
+    models = []
+    threads = [
+        threading.Thread(target=lambda: models.append(registry.get("fake", "a")))
+        for _ in range(8)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert loads == ["a"]
+    assert all(model is models[0] for model in models)
+    assert registry.get("fake", "b") is not models[0]
+    assert loads == ["a", "b"]
+    metrics = registry.metrics()
+    assert metrics["loads"] == 2
+    assert metrics["hits"] == 7
+
+
+def test_least_recently_used_models_are_evicted_over_the_budget():
+    registry = ModelRegistry(memory_budget_mb=2)
+    registry.register_loader("fake", lambda name: FakeModel(name, 1024 * 1024))
+    first = registry.get("fake", "a")
+    registry.get("fake", "b")
+    # "a" is now the most recently used, so loading "c" evicts "b"
+    assert registry.get("fake", "a") is first
+    registry.get("fake", "c")
+
+    names = [model["name"] for model in registry.metrics()["models"]]
+    assert names == ["a", "c"]
+    assert registry.metrics()["evictions"] == 1
+    assert registry.resident_bytes() == 2 * 1024 * 1024
+
+
+def test_unknown_kinds_and_invalid_specs_are_rejected():
+    registry = ModelRegistry()
+    with pytest.raises(ValueError):
+        registry.get("unknown", "model")
+    assert parse_model_specs(" tiktoken:cl100k_base, ,fake:a ") == [
+        ("tiktoken", "cl100k_base"),
+        ("fake", "a"),
+    ]
+    with pytest.raises(ValueError):
+        parse_model_specs("sentence_transformer")
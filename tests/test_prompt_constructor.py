@@ -0,0 +1,74 @@
+from modules.prompt_constructor import (
+    CONTEXT_SEPARATOR,
+    ApproximateTokenizer,
+    PromptConstructor,
+)
+
+
+def constructor():
+    prompt_constructor = PromptConstructor(template="{contexts}\n{question}")
+    # Four characters per token, so budgets do not depend on tiktoken files
+    prompt_constructor.tokenizer = ApproximateTokenizer()
+    return prompt_constructor
+
+
+def chunk(id_, text, score, source=None, offset=None):
+    return {"id": id_, "text": text, "score": score, "source": source, "offset": offset}
+
+
+def test_best_chunks_are_packed_within_the_budget():
+    prompt_constructor = constructor()
+    candidates = [
+        chunk("low", "l" * 400, 0.1),
+        chunk("high", "h" * 400, 0.9),
+        chunk("mid", "m" * 400, 0.5),
+    ]
+    context_str, packing = prompt_constructor.pack_contexts(
+        candidates, max_tokens=220, truncate=False
+    )
+    assert packing["context_ids"] == ["high", "mid"]
+    assert context_str == CONTEXT_SEPARATOR.join(["h" * 400, "m" * 400])
+    assert packing["context_tokens"] <= 220
+    assert packing["dropped"] == 1
+    assert packing["tokens_saved"] == (
+        packing["candidate_tokens"] - packing["context_tokens"]
+    )
+
+
+def test_the_last_chunk_is_cut_at_a_sentence():
+    prompt_constructor = constructor()
+    sentences = [f"Sentence number {i} is here." for i in range(40)]
+    candidates = [
+        chunk("first", "f" * 400, 0.9),
+        chunk("second", " ".join(sentences), 0.5),
+    ]
+    context_str, packing = prompt_constructor.pack_contexts(candidates, max_tokens=200)
+    assert packing["context_ids"] == ["first", "second"]
+    assert packing["truncated"] == 1
+    assert packing["context_tokens"] <= 200
+    kept = context_str.split(CONTEXT_SEPARATOR)[1]
+    assert kept.endswith(".")
+    assert sentences[0] in kept and sentences[-1] not in kept
+
+    _, packing = prompt_constructor.pack_contexts(
+        candidates, max_tokens=200, truncate=False
+    )
+    assert packing["context_ids"] == ["first"]
+
+
+def test_repeated_and_adjacent_chunks_are_deduplicated_and_merged():
+    prompt_constructor = constructor()
+    text = "Attention weighs tokens. Layers stack. Heads split the work."
+    candidates = [
+        chunk("a", text[:24], 0.9, "doc.txt", 0),
+        chunk("b", text[25:38], 0.8, "doc.txt", 25),
+        chunk("a-again", text[:24], 0.7, "other.txt", 0),
+        chunk("inside", text[:9], 0.6, "doc.txt", 0),
+        chunk("c", text[39:], 0.5, "doc.txt", 39),
+    ]
+    context_str, packing = prompt_constructor.pack_contexts(candidates, max_tokens=1000)
+    assert packing["context_ids"] == ["a", "b", "c"]
+    assert packing["duplicates"] == 2
+    assert packing["contexts"] == 1
+    assert packing["merged"] == 2
+    assert context_str == text
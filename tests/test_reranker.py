@@ -0,0 +1,31 @@
+from benchmarks.fakes import install_fakes
+from modules.reranker import Reranker, ScoreCache
+
+RERANK_MODEL = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+
+
+def test_score_cache_is_keyed_by_max_length():
+    install_fakes()
+    cache = ScoreCache()
+    documents = ["attention " * 400, "recurrent networks"]
+    for max_length in (512, 16, 512):
+        Reranker(RERANK_MODEL, max_length=max_length, cache=cache).rerank(
+            "what is attention?", documents, ids=["a", "b"]
+        )
+    assert cache.metrics()["misses"] == 4
+    assert cache.metrics()["hits"] == 2
+
+
+def test_max_length_limits_the_tokens_the_model_reads():
+    install_fakes()
+    # The answer is past the first 32 tokens of the chunk
+    document = "filler " * 40 + "attention weighs every token"
+    scores = {
+        max_length: Reranker(
+            RERANK_MODEL, max_length=max_length, cache=ScoreCache()
+        ).rerank("what is attention?", [document], ids=["a"])[0][1]
+        for max_length in (32, 512)
+    }
+    assert scores[32] < scores[512]
+    # The shared model is left with its own limit
+    assert Reranker(RERANK_MODEL).client.max_length == 512
@@ -0,0 +1,70 @@
+import time
+
+import numpy as np
+
+from modules.response_cache import ResponseCache, response_scope
+
+ANSWER = {"model_response": "It attends.", "prompt_tokens": 100, "total_tokens": 120}
+
+
+def unit(vector):
+    vector = np.asarray(vector, dtype=np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+def test_exact_hits_ignore_case_and_spacing():
+    cache = ResponseCache()
+    scope = response_scope("gpt-4o-mini", "Be brief.", "corpus_a", ["1", "2"])
+    cache.store(scope, "What is attention?", None, ANSWER)
+
+    answer = cache.lookup(scope, "  what is   ATTENTION? ")
+    assert answer["model_response"] == "It attends."
+    assert answer["cache"]["tier"] == "exact"
+    assert cache.lookup(scope, "What is recurrence?") is None
+    assert cache.metrics()["saved_prompt_tokens"] == 100
+
+
+def test_answers_are_scoped_to_model_prompt_corpus_and_contexts():
+    scope = response_scope("gpt-4o-mini", "Be brief.", "corpus_a", ["1", "2"])
+    cache = ResponseCache()
+    cache.store(scope, "What is attention?", None, ANSWER)
+    other_scopes = [
+        response_scope("gpt-4o", "Be brief.", "corpus_a", ["1", "2"]),
+        response_scope("gpt-4o-mini", "Be thorough.", "corpus_a", ["1", "2"]),
+        response_scope("gpt-4o-mini", "Be brief.", "corpus_b", ["1", "2"]),
+        response_scope("gpt-4o-mini", "Be brief.", "corpus_a", ["1", "3"]),
+        response_scope("gpt-4o-mini", "Be brief.", "corpus_a", ["2", "1"]),
+    ]
+    assert len(set(other_scopes)) == len(other_scopes)
+    for other in other_scopes:
+        assert other != scope
+        assert cache.lookup(other, "What is attention?") is None
+
+
+def test_semantic_hits_need_the_threshold_and_the_same_scope():
+    cache = ResponseCache()
+    scope = response_scope("gpt-4o-mini", None, "corpus_a", ["1"])
+    cache.store(scope, "What is attention?", unit([1, 0, 0]), ANSWER)
+    close, far = unit([0.95, 0.3, 0]), unit([0.5, 0.8, 0.3])
+
+    answer = cache.lookup(scope, "Explain attention", close, threshold=0.9)
+    assert answer["cache"]["tier"] == "semantic"
+    assert cache.lookup(scope, "Explain attention", far, threshold=0.9) is None
+    assert cache.lookup(scope, "Explain attention", close) is None
+    other = response_scope("gpt-4o-mini", None, "corpus_a", ["2"])
+    assert cache.lookup(other, "Explain attention", close, threshold=0.9) is None
+
+
+def test_entries_expire_and_are_evicted(monkeypatch):
+    cache = ResponseCache(max_entries=2, ttl_seconds=60)
+    scope = response_scope("gpt-4o-mini", None, "corpus_a", [])
+    for question in ("first?", "second?", "third?"):
+        cache.store(scope, question, None, ANSWER)
+    assert cache.lookup(scope, "first?") is None
+    assert cache.metrics()["evictions"] == 1
+    assert cache.lookup(scope, "third?") is not None
+
+    now = time.time()
+    monkeypatch.setattr(time, "time", lambda: now + 61)
+    assert cache.lookup(scope, "third?") is None
+    assert cache.metrics()["expirations"] == 1
@@ -0,0 +1,50 @@
+import pytest
+
+from modules.data_chunker import DataChunker, check_source_names
+from modules.vector_store import source_collection_name
+
+
+def test_duplicate_file_names_are_rejected():
+    check_source_names(["docs/a.pdf", "docs/b.pdf"])
+    with pytest.raises(ValueError, match="same file name"):
+        check_source_names(["2023/report.pdf", "2024/report.pdf"])
+
+
+def test_chunker_rejects_records_of_two_files_with_one_name():
+    records = [
+        {"file_path": "2023/report.txt", "page": 0, "text": "First report."},
+        {"file_path": "notes.txt", "page": 0, "text": "Some notes."},
+        {"file_path": "2024/report.txt", "page": 0, "text": "Second report."},
+    ]
+    chunker = DataChunker("", method="character", chunk_size=100)
+    with pytest.raises(ValueError, match="same file name"):
+        list(chunker.iter_chunk_records(records))
+    assert len(list(chunker.iter_chunk_records(records[:2]))) == 2
+
+
+def test_chunker_rejects_adjacent_files_with_one_name():
+    records = [
+        {"file_path": "2023/report.txt", "page": 0, "text": "First report."},
+        {"file_path": "2023/report.txt", "page": 1, "text": "More of it."},
+        {"file_path": "2024/report.txt", "page": 0, "text": "Second report."},
+    ]
+    chunker = DataChunker("", method="character", chunk_size=100)
+    with pytest.raises(ValueError, match="same file name"):
+        list(chunker.iter_chunk_records(records))
+    assert list(chunker.iter_chunk_records(records[:2]))
+
+
+def test_source_collection_name_ignores_directories():
+    assert source_collection_name(["tmp/1/a.pdf"], "character") == (
+        source_collection_name(["tmp/2/a.pdf"], "character")
+    )
+
+
+def test_upload_with_duplicate_file_names(client):
+    response = client.post(
+        "/corpora",
+        files=[("files", ("2023/report.txt", "one")), ("files", ("report.txt", "two"))],
+        data={"method": "character"},
+    )
+    assert response.status_code == 400
+    assert "same file name" in response.json()["detail"]
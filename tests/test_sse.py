@@ -0,0 +1,128 @@
+import asyncio
+import json
+import random
+import time
+
+import pytest
+
+from benchmarks.corpus import make_page
+
+
+@pytest.fixture
+def document():
+    rng = random.Random(0)
+    return "\n".join(make_page(rng, 200) for _ in range(5))
+
+
+def read_events(response):
+    events = []
+    for block in response.text.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.splitlines())
+        events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+
+def check_order(events):
+    kinds = [kind for kind, _ in events]
+    assert "error" not in kinds, events
+    assert kinds[0] == "retrieval"
+    assert kinds[-1] == "usage"
+    assert kinds[1:-1] and set(kinds[1:-1]) == {"token"}
+    assert events[0][1]["context_ids"]
+    usage = events[-1][1]
+    assert usage["time_to_first_token"] > 0
+    assert usage["tokens_per_second"] > 0
+    assert "timings" in usage
+
+
+def test_chat_completion_stream(client, document):
+    response = client.post(
+        "/chat/completion/stream",
+        files=[("files", ("doc.txt", document))],
+        data={
+            "method": "character",
+            "model_name": "mock-model",
+            "n_questions_per_chunk": 1,
+            "question": "What does the encoder do?",
+        },
+    )
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    check_order(read_events(response))
+
+
+def create_corpus(client, document):
+    response = client.post(
+        "/corpora",
+        files=[("files", ("doc.txt", document))],
+        data={"method": "character"},
+    )
+    assert response.status_code == 202
+    corpus_id = response.json()["data"]["corpus_id"]
+    for _ in range(100):
+        corpus = client.get(f"/corpora/{corpus_id}").json()
+        if corpus["status"] in ("ready", "failed"):
+            break
+        time.sleep(0.05)
+    assert corpus["status"] == "ready", corpus["error"]
+    return corpus_id
+
+
+def test_corpus_query_stream(client, document):
+    corpus_id = create_corpus(client, document)
+    response = client.post(
+        f"/corpora/{corpus_id}/query/stream",
+        data={"question": "What does the encoder do?"},
+    )
+    assert response.status_code == 200
+    check_order(read_events(response))
+
+
+@pytest.mark.parametrize("spec_version", ["2.0", "2.4"])
+def test_disconnect_before_the_body_releases_the_slot(client, document, spec_version):
+    import main
+
+    corpus_id = create_corpus(client, document)
+    body = b"question=What+does+the+encoder+do%3F"
+    path = f"/corpora/{corpus_id}/query/stream"
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0", "spec_version": spec_version},
+        "http_version": "1.1",
+        "method": "POST",
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "root_path": "",
+        "query_string": b"",
+        "headers": [
+            (b"content-type", b"application/x-www-form-urlencoded"),
+            (b"content-length", str(len(body)).encode()),
+        ],
+        "client": ("testclient", 50000),
+        "server": ("testserver", 80),
+    }
+    messages = [{"type": "http.request", "body": body, "more_body": False}]
+
+    async def receive():
+        if messages:
+            return messages.pop(0)
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        # The client is gone before the response starts
+        if spec_version == "2.4":
+            raise OSError("connection reset")
+        await asyncio.Event().wait()
+
+    async def request():
+        in_flight = main.admission.metrics()["in_flight"]
+        try:
+            await main.app(scope, receive, send)
+        except Exception:
+            pass
+        # Checked before the event loop shuts down, which would close the
+        # admission slot's generator anyway
+        return main.admission.metrics()["in_flight"] - in_flight
+
+    assert asyncio.run(asyncio.wait_for(request(), timeout=10)) == 0
@@ -0,0 +1,33 @@
+import os
+
+import pytest
+
+from benchmarks.bench_startup import (
+    COLD_START_SNIPPET,
+    HEAVY_MODULES,
+    IMPORT_SNIPPET,
+    MODULES,
+    run_snippet,
+)
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def environment(**variables):
+    # A fresh interpreter, so modules imported by other tests don't count
+    return {**os.environ, "PYTHONPATH": ROOT, **variables}
+
+
+@pytest.mark.parametrize("module", MODULES)
+def test_import_loads_no_heavy_dependencies(module):
+    result = run_snippet(
+        IMPORT_SNIPPET.format(module=module, heavy=HEAVY_MODULES), environment()
+    )
+    assert result["heavy_modules"] == []
+
+
+def test_app_starts_without_loading_models():
+    env = environment(MODEL_PRELOAD="", PRELOAD_BEFORE_FORK="0")
+    result = run_snippet(COLD_START_SNIPPET.format(heavy=HEAVY_MODULES), env)
+    assert result["status"] == 200
+    assert result["heavy_modules"] == []
@@ -0,0 +1,74 @@
+import numpy as np
+
+from modules.vector_backends import NumpyIndex, top_k
+
+
+def random_vectors(n, dim=16, seed=0):
+    return np.random.default_rng(seed).standard_normal((n, dim)).astype(np.float32)
+
+
+def brute_force(vectors, queries, k):
+    vectors = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    queries = queries / np.linalg.norm(queries, axis=1, keepdims=True)
+    return np.argsort(-(queries @ vectors.T), axis=1, kind="stable")[:, :k]
+
+
+def test_top_k_matches_a_full_sort():
+    scores = random_vectors(5, dim=100)
+    for k in (1, 10, 100, 200):
+        expected = np.argsort(-scores, axis=1, kind="stable")[:, :k]
+        assert np.array_equal(top_k(scores, k), expected)
+
+
+def test_query_returns_the_exact_nearest_neighbours():
+    vectors = random_vectors(500)
+    ids = [f"chunk-{i}" for i in range(500)]
+    index = NumpyIndex()
+    index.upsert(ids, ids, vectors, [{"source": "a.txt"}] * 500)
+    queries = random_vectors(8, seed=1)
+
+    result = index.query(queries, n_results=10)
+    expected = brute_force(vectors, queries, 10)
+    assert result["ids"] == [[ids[i] for i in row] for row in expected]
+    assert result["documents"] == result["ids"]
+    distances = np.asarray(result["distances"])
+    assert np.all(np.diff(distances, axis=1) >= 0)
+
+
+def test_upsert_replaces_and_delete_compacts():
+    vectors = random_vectors(4)
+    index = NumpyIndex()
+    index.upsert(["a", "b", "c", "d"], ["a", "b", "c", "d"], vectors)
+    index.upsert(["b"], ["new b"], vectors[3:])
+    index.delete(["a", "missing"])
+
+    assert index.size == 3
+    assert sorted(index.ids) == ["b", "c", "d"]
+    assert index.get_chunks(["b", "a"]) == {"b": ("new b", None)}
+    result = index.query(vectors[2:3], n_results=3)
+    assert result["ids"][0][0] == "c"
+    # "b" now has the vector of "d"
+    assert set(index.query(vectors[3:], n_results=2)["ids"][0]) == {"b", "d"}
+
+
+def test_saved_index_is_loaded_memory_mapped(tmp_path):
+    vectors = random_vectors(50)
+    ids = [f"chunk-{i}" for i in range(50)]
+    index = NumpyIndex(str(tmp_path))
+    index.upsert(ids, ids, vectors)
+    index.indexed = True
+    index.save()
+    queries = random_vectors(3, seed=1)
+    expected = index.query(queries, n_results=5)
+
+    loaded = NumpyIndex(str(tmp_path))
+    assert isinstance(loaded.vectors, np.memmap)
+    assert loaded.indexed
+    assert loaded.query(queries, n_results=5)["ids"] == expected["ids"]
+
+    # A write copies the vectors into memory and leaves the file as it was
+    loaded.delete(["chunk-0"])
+    assert not isinstance(loaded.vectors, np.memmap)
+    assert NumpyIndex(str(tmp_path)).size == 50
+    loaded.save()
+    assert NumpyIndex(str(tmp_path)).size == 49
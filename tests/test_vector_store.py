@@ -0,0 +1,86 @@
+from benchmarks.fakes import install_fakes
+from config import Config
+from modules import vector_backends
+from modules.data_chunker import DataChunker
+from modules.embedding_generator import EmbeddingGenerator
+from modules.pipeline_manager import PipelineManager
+from modules.vector_store import VectorStore, corpus_collection_name
+
+EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+
+
+def write_files(directory, texts):
+    paths = []
+    for name, text in texts.items():
+        path = directory / name
+        path.write_text(text)
+        paths.append(str(path))
+    return paths
+
+
+def test_collection_name_depends_on_contents_and_settings(tmp_path):
+    first = write_files(tmp_path, {"a.txt": "first", "b.txt": "second"})
+    renamed = write_files(tmp_path, {"c.txt": "second", "d.txt": "first"})
+    edited = write_files(tmp_path, {"e.txt": "first", "f.txt": "second, edited"})
+    name = corpus_collection_name(first, "character", 500)
+
+    assert corpus_collection_name(renamed, "character", 500) == name
+    assert corpus_collection_name(edited, "character", 500) != name
+    assert corpus_collection_name(first, "character", 400) != name
+
+
+def test_persisted_index_is_reused_after_a_restart(tmp_path):
+    install_fakes()
+    file_paths = write_files(
+        tmp_path,
+        {"attention.txt": "Attention weighs every token. " * 50},
+    )
+    config = Config(
+        file_paths=file_paths,
+        chunk_size=200,
+        persist_directory=str(tmp_path / "index"),
+        vector_backend="numpy",
+        retrieval="dense",
+    )
+    pipeline_manager = PipelineManager("first", config)
+    n_chunks = pipeline_manager.index().count()
+    assert n_chunks > 1
+
+    # A new process starts without the shared in-memory indexes
+    vector_backends._indexes.clear()
+    pipeline_manager = PipelineManager("second", config)
+    vector_store = pipeline_manager.index()
+    assert vector_store.count() == n_chunks
+    # Nothing was parsed or embedded again
+    assert pipeline_manager.embedding_generator is None
+    query_embedding = pipeline_manager.embed_query("attention")
+    assert len(vector_store.query(query_embedding, n_results=3)["ids"][0]) == 3
+
+
+def test_sync_embeds_only_new_chunks():
+    install_fakes()
+    embedding_generator = EmbeddingGenerator(EMBEDDING_MODEL)
+    embedded = []
+
+    def embed_records(records):
+        embedded.extend(record["text"] for record in records)
+        return embedding_generator.generate_batch([r["text"] for r in records])
+
+    def chunk(text):
+        return DataChunker(text, method="paragraph").chunk_records("docs/notes.txt")
+
+    vector_store = VectorStore("test_sync", backend="numpy")
+    stats = vector_store.sync_documents(
+        chunk("Attention.\nRecurrence.\nConvolution."), embed_records
+    )
+    assert stats["added"] == 3
+
+    embedded.clear()
+    records = chunk("Attention.\nPooling.\nConvolution.")
+    stats = vector_store.sync_documents(records, embed_records)
+    assert embedded == ["Pooling."]
+    assert stats == {"added": 1, "moved": 1, "deleted": 1, "unchanged": 1}
+    assert vector_store.count() == 3
+    # Moved chunks carry their new offsets
+    stored = vector_store.get_chunks([record["id"] for record in records])
+    assert [stored[record["id"]][1]["offset"] for record in records] == [0, 11, 20]